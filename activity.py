@@ -56,9 +56,14 @@ from sugar3.datastore import datastore
 
 from sugar3.graphics.colorbutton import ColorToolButton
 from collabwrapper import CollabWrapper
+from myelements import worldfile
 
 import tools
 from physics import PhysicsGame
+from sharing import WorldSync, Lockstep, pack, unpack
+from sharing import sync_mode, SYNC_OPERATIONS, SYNC_LOCKSTEP
+from sharing import StateBroadcast, StateFollower, SYNC_BROADCAST
+from sharing import tag_bodies
 
 # For some reason increasing FPS decreases execution speed :/
 SLOWEST_FPS = 90
@@ -80,6 +85,23 @@ class PhysicsActivity(Activity):
         self.connect('window-state-event', self._window_event)
 
         self.game = PhysicsGame(self)
+        self._sync = WorldSync(self.game.get_snapshot,
+                               self.game.set_snapshot)
+        self._collab.joined.connect(self.__joined_cb)
+        self._collab.buddy_joined.connect(self.__buddy_joined_cb)
+        try:
+            self.sync = sync_mode()
+        except ValueError as e:
+            logging.error('%s, sharing operations only', e)
+            self.sync = SYNC_OPERATIONS
+        self.lockstep = Lockstep()
+        self._resync = False  # the world was asked for again
+        self._world_frame = None  # lockstep frame of the world loaded
+        self._broadcast = StateBroadcast()
+        self._follower = StateFollower()
+        self._made_by = None  # operation whose bodies have no id yet
+        self._inbox = []
+        self._outbox = []
         self.game.canvas = sugargame.canvas.PygameCanvas(
             self, main=self.game.run, modules=[pygame.display, pygame.font])
 
@@ -106,12 +128,97 @@ class PhysicsActivity(Activity):
         self._collab.setup()
 
     def get_data(self):
-        """ FIXME: not implemented, thus objects created before
-        sharing starts are not shared """
-        return dict()
+        """ The world for a buddy joining, see sharing.WorldSync """
+        # Operations received but not applied yet would be in neither
+        # the world nor the messages the buddy gets from now on
+        self.apply_events()
+        if self.sync == SYNC_LOCKSTEP:
+            started = self.lockstep.enabled
+            data = self._lockstep_data()
+            if started:
+                # The buddies already in lockstep rebuild their world too
+                self._collab.post(dict(data, action='world'))
+        else:
+            if self.sync == SYNC_BROADCAST:
+                # Bodies made before sharing are known by an id of the
+                # leader
+                self._tag_bodies()
+                self._made_by = self._sync.new_id()
+                self._tag_bodies()
+            data = self._sync.get_data()
+        data['sync'] = self.sync
+        return data
+
+    def _lockstep_data(self):
+        """ Return the world and the frame for buddies in lockstep,
+            starting lockstep at frame 0 if sharing starts. The world
+            here is rebuilt from the snapshot sent, like theirs.
+        """
+        if not self.lockstep.enabled:
+            self.lockstep.start()
+        data = self._sync.get_data(reload=True)
+        data['lockstep'] = self.lockstep.get_data(self._sync.peer)
+        self.game.wake()
+        return data
 
     def set_data(self, data):
-        pass
+        if not hasattr(self.game, 'world'):
+            # The canvas is not running yet, try again shortly
+            GLib.timeout_add(100, self.set_data, data)
+            return
+        try:
+            self.sync = sync_mode(data.get('sync', SYNC_OPERATIONS))
+        except ValueError as e:
+            logging.error('%s, sharing operations only', e)
+            self.sync = SYNC_OPERATIONS
+        self._load_world(data)
+
+    def _load_world(self, data):
+        """ Replace the world with the leader's, and follow its lockstep
+            frame if any
+        """
+        # Operations scheduled here, the leader may not have them yet
+        scheduled = self.lockstep.stop()
+        self._inbox.extend(self._sync.set_data(data))
+        if data.get('lockstep'):
+            self.lockstep.set_data(data['lockstep'])
+            self._world_frame = data['lockstep']['frame']
+            for msg in scheduled:
+                if not self._sync.is_applied(msg.get('id')):
+                    self.lockstep.schedule(msg)
+        self._resync = False
+        self._made_by = None
+        self._follower.reset()
+        self.apply_events()
+        self.game.wake()
+
+    def __joined_cb(self, collab):
+        # Hold shared operations until the world arrives from the leader
+        self._sync.wait()
+
+    def __buddy_joined_cb(self, collab, buddy):
+        # Lockstep starts in get_data, once the leader sends the world
+        if self.sync == SYNC_BROADCAST:
+            # Send every body to the buddy, moved or not
+            self._broadcast.reset()
+
+    @property
+    def busy(self):
+        """ Whether sharing needs frames to go on, see PhysicsGame.frame
+        """
+        return bool(self._inbox or self._outbox) or \
+            self.lockstep.enabled or self._follower.moving
+
+    @property
+    def following(self):
+        """ Whether the world moves as the leader broadcasts it, instead
+            of being stepped here """
+        return self.sync == SYNC_BROADCAST and not self._collab.leader
+
+    def follow_leader(self):
+        """ Move the bodies between the states received from the
+            leader """
+        self._follower.apply(self.game.world.world)
 
     def __configure_cb(self, event):
         ''' Screen size has changed '''
@@ -426,8 +533,11 @@ class PhysicsActivity(Activity):
     def clear_trace_alert_cb(self, alert, response):
         self.remove_alert(alert)
         if response is Gtk.ResponseType.OK:
-            self.game.full_pos_list = [[] for _ in self.game.full_pos_list]
+            self.game.traces.clear()
             self.game.tracked_bodies = 0
+            # Traces are drawn over the cached layer, repaint everything
+            self.game.world.renderer.invalidate()
+            self.game.wake()
 
     def clear_trace_cb(self, button):
         clear_trace_alert = ConfirmationAlert()
@@ -438,9 +548,12 @@ class PhysicsActivity(Activity):
         self.add_alert(clear_trace_alert)
 
     def stop_play_cb(self, button):
-        pygame.event.post(pygame.event.Event(pygame.USEREVENT,
-                                             action='stop_start_toggle'))
-        self.stop_play_state = not self.stop_play_state
+        # The button changes once the buddies run or pause too, see
+        # set_stop_play_state
+        self.game.post_action('stop_start_toggle')
+
+    def set_stop_play_state(self, running):
+        self.stop_play_state = running
 
         if self.stop_play_state:
             self.stop_play.set_icon_name('media-playback-stop')
@@ -457,8 +570,7 @@ class PhysicsActivity(Activity):
         def clear_all_alert_cb(alert, response_id):
             self.remove_alert(alert)
             if response_id is Gtk.ResponseType.OK:
-                pygame.event.post(pygame.event.Event(pygame.USEREVENT,
-                                                     action='clear_all'))
+                self.game.post_action('clear_all')
         if len(self.game.world.world.bodies) > 2:
             clear_all_alert = ConfirmationAlert()
             clear_all_alert.props.title = _('Are You Sure?')
@@ -468,19 +580,16 @@ class PhysicsActivity(Activity):
             self.add_alert(clear_all_alert)
 
     def radioClicked(self, button):
-        pygame.event.post(pygame.event.Event(pygame.USEREVENT,
-                                             action=self.radioList[button]))
+        self.game.post_action(self.radioList[button])
 
     def _focus_event(self, event, data=None):
         ''' Send focus events to pygame to allow it to idle when in
         background. '''
         if data.state == Gdk.VisibilityState.FULLY_OBSCURED:
-            pygame.event.post(pygame.event.Event(pygame.USEREVENT,
-                                                 action='focus_out'))
+            self.game.post_action('focus_out')
         else:
             self.game.show_fake_cursor = True
-            pygame.event.post(pygame.event.Event(pygame.USEREVENT,
-                                                 action='focus_in'))
+            self.game.post_action('focus_in')
 
     def _export_json_cb(self, button):
         jobject = datastore.create()
@@ -500,8 +609,7 @@ class PhysicsActivity(Activity):
         ''' Send focus out event to pygame when switching to a desktop
         view. '''
         if event.changed_mask & Gdk.WindowState.ICONIFIED:
-            pygame.event.post(pygame.event.Event(pygame.USEREVENT,
-                                                 action='focus_out'))
+            self.game.post_action('focus_out')
 
     def _restore_cursor(self):
         ''' No longer waiting, so restore standard cursor. '''
@@ -518,9 +626,103 @@ class PhysicsActivity(Activity):
 
     def __message_cb(self, collab, buddy, msg):
         ''' Data is passed as tuples: cmd:text '''
-        action = msg.get('action')
-        if action != 'text':
+        if msg.get('action') == 'tick':
+            if self.lockstep.enabled:
+                self.lockstep.receive_tick(msg)
+            return
+        if msg.get('action') == 'resync':
+            # A buddy found its world different from the others
+            if self._collab.leader and self.lockstep.enabled:
+                self._collab.post(dict(self._lockstep_data(),
+                                       action='world'))
+            elif self._collab.leader and self.sync == SYNC_BROADCAST:
+                self._collab.post(dict(self.get_data(), action='world'))
+                self._broadcast.reset()
+            return
+        if msg.get('action') == 'world':
+            # The leader rebuilt its world, with a buddy joining
+            if self.lockstep.enabled and not self._collab.leader and \
+                    not self._sync.waiting and \
+                    msg['lockstep']['frame'] != self._world_frame:
+                self._load_world(msg)
+            # or sent it again, as asked
+            elif self.following and self._resync and \
+                    not self._sync.waiting:
+                self._load_world(msg)
+            return
+        if msg.get('action') == 'state':
+            if self.following and hasattr(self.game, 'world'):
+                if not self._follower.receive(msg, self.game.world.world) \
+                        and not self._resync:
+                    # The bodies are not the leader's, ask for its world
+                    self._resync = True
+                    self._collab.post({'action': 'resync',
+                                       'peer': self._sync.peer})
+                self.game.wake()
+            return
+        # Applied together by apply_events, between physics steps
+        for op in unpack(msg):
+            self._inbox.extend(self._sync.receive(op))
+        self.game.wake()
+
+    def apply_events(self):
+        """ Apply the operations received from buddies since the last
+            frame, or in lockstep keep them for their frame """
+        inbox = self._inbox
+        self._inbox = []
+        for msg in inbox:
+            if self.lockstep.enabled:
+                self.lockstep.schedule(msg)
+            else:
+                self._apply_message(msg)
+
+    def flush_events(self):
+        """ Post the operations made during this frame """
+        self._tag_bodies()
+        if self._outbox:
+            for msg in pack(self._outbox):
+                self._collab.post(msg)
+            self._outbox = []
+        if self.lockstep.enabled:
+            tick = self.lockstep.tick(self._sync.peer)
+            if tick is not None:
+                self._collab.post(tick)
+        if self.sync == SYNC_BROADCAST and self._collab.leader and \
+                self._collab.shared_activity:
+            state = self._broadcast.state(self.game.world.world)
+            if state is not None:
+                self._collab.post(state)
+
+    def before_step(self):
+        """ In lockstep, apply the operations of the frame about to be
+            stepped
+
+            Return: False when the operations of a buddy behind are
+            still missing, and the world must not be stepped yet
+        """
+        if not self.lockstep.enabled:
+            return True
+        if not self.lockstep.can_step():
+            return False
+        for msg in self.lockstep.due():
+            self._apply_message(msg)
+        return True
+
+    def after_step(self):
+        if not self.lockstep.enabled:
             return
+        self.lockstep.stepped(self.game.world.world)
+        if self.lockstep.diverged is not None and not self._resync and \
+                not self._collab.leader:
+            # Start again from the leader's world
+            self._resync = True
+            self._collab.post({'action': 'resync', 'peer': self._sync.peer})
+
+    def _apply_message(self, msg):
+        if self._sync.is_applied(msg.get('id')):
+            return
+        self._sync.applied(msg.get('id'))
+        self._tag_bodies()
 
         text = msg['text']
         dispatch_table = {'C': self._construct_shared_circle,
@@ -533,9 +735,23 @@ class PhysicsActivity(Activity):
                           'm': self._add_shared_motor,
                           't': self._add_shared_track,
                           'c': self._add_shared_chain,
+                          'd': self._destroy_shared,
+                          'g': self._grab_shared,
+                          'r': self._set_shared_running,
+                          'x': self._clear_shared,
                           }
         logging.debug('<<< %s' % (text[0]))
         dispatch_table[text[0]](text[2:])
+        if self.sync == SYNC_BROADCAST:
+            self._made_by = msg.get('id')
+            self._tag_bodies()
+
+    def _tag_bodies(self):
+        # Give the bodies made by the last operation the ids the buddies
+        # know them by in the state broadcast
+        if self._made_by is not None:
+            tag_bodies(self.game.world.world.bodies, self._made_by)
+            self._made_by = None
 
     def _construct_shared_circle(self, data):
         circle_data = json.loads(data)
@@ -616,8 +832,44 @@ class PhysicsActivity(Activity):
         self._constructors['Chain'](vertices, link_length, radius,
                                     share=False)
 
+    def _destroy_shared(self, data):
+        destroy_data = json.loads(data)
+        vertices = destroy_data[0]
+        self._constructors['Destroy'](vertices, share=False)
+
+    def _grab_shared(self, data):
+        grab_data = json.loads(data)
+        action = grab_data[0]
+        pos = grab_data[1]
+        speed = grab_data[2]
+        self._constructors['Grab'](action, pos, speed, share=False)
+
+    def _set_shared_running(self, data):
+        running = json.loads(data)[0]
+        self.game.set_running(running, share=False)
+
+    def _clear_shared(self, data):
+        self.game.clear_all(share=False)
+
     def send_event(self, text):
-        self._collab.post(dict(action='text', text=text))
+        """ Share an operation made here
+
+            Return: True when it must not be applied now, as lockstep
+            applies it later, at the frame it is scheduled for
+        """
+        self._tag_bodies()
+        op_id = self._sync.new_id()
+        msg = dict(action='text', text=text, id=op_id)
+        if self.lockstep.enabled:
+            self.lockstep.tag(msg)
+            self._outbox.append(msg)
+            return True
+        if self.sync == SYNC_BROADCAST:
+            # The bodies are made right after, see flush_events
+            self._made_by = op_id
+        self._sync.applied(op_id)
+        self._outbox.append(msg)
+        return False
 
     def _load_project(self, button):
         chooser = ObjectChooser(parent=self)
@@ -640,10 +892,11 @@ class PhysicsActivity(Activity):
                 return
 
             try:
-                f = open(file_path, 'r')
                 # Test if the file is valid project.
-                json.loads(f.read())
-                f.close()
+                if not worldfile.is_binary(file_path):
+                    f = open(file_path, 'r')
+                    json.loads(f.read())
+                    f.close()
 
                 self.read_file(file_path)
                 self.game.check_queue()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# Physics, a 2D Physics Playground for Kids
+
+#  This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark suite of canonical Physics scenes.
+
+Each scene is built with the Add API of Elements, or loaded from the
+bundled samples, in a process of its own, and timed for:
+
+    steps/s ..... physics steps at the fixed timestep of the activity
+    draw ms ..... one full redraw onto an offscreen surface
+    save/load ms  a save and load in the JSON and binary formats
+    peak MB ..... peak resident memory of the process
+
+Results can be stored as a baseline, and later runs are compared with it
+and reported as regressions when worse by more than a threshold. Timings
+depend on the machine, so no baseline is shipped: save one first, on the
+machine compared. A --baseline given which does not exist is an error.
+
+Usage:
+    python3 bench.py
+    python3 bench.py --save-baseline
+    python3 bench.py ball_pit chains --steps 600 --threshold 0.1
+    python3 bench.py --baseline ci_baseline.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import glob
+import argparse
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame  # noqa: E402
+
+import myelements as elements  # noqa: E402
+from myelements.locals import PHYSICS_DT  # noqa: E402
+
+from headless import DEFAULT_SCREEN_SIZE  # noqa: E402
+
+BASELINE_PATH = 'bench_baseline.json'
+# Relative change worse than this is a regression
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_STEPS = 1200
+
+# Metrics, and whether a higher value is better
+METRICS = (('steps_per_second', True), ('draw_ms', False),
+           ('json_save_ms', False), ('json_load_ms', False),
+           ('binary_save_ms', False), ('binary_load_ms', False),
+           ('peak_mb', False))
+
+
+def _grid(count, columns, x0, y0, spacing):
+    for i in range(count):
+        row, column = divmod(i, columns)
+        yield (x0 + column * spacing, y0 + row * spacing)
+
+
+def ball_pit(world, count=400):
+    world.add.balls(list(_grid(count, 25, 100, 50, 40)), 15)
+
+
+def box_stack(world, count=300):
+    world.add.rects(list(_grid(count, 15, 200, 100, 42)), 20, 20)
+
+
+def chains(world, count=6, length=800):
+    for i in range(count):
+        pos1 = (200, 60 + 40 * i)
+        pos2 = (200 + length, 60 + 40 * i)
+        body1 = world.add.ball(pos1, 8)
+        body2 = world.add.ball(pos2, 8)
+        world.add.joint(body1, pos1)
+        world.add.joint(body2, pos2)
+        world.add.chain([pos1, pos2], 20, 6, bodies=[body1, body2])
+
+
+def magic_pen(world, count=40):
+    # Concave strokes, as drawn with the magic pen
+    for x, y in _grid(count, 10, 120, 80, 100):
+        points = []
+        for i in range(24):
+            angle = 2 * math.pi * i / 24
+            radius = 40 if i % 2 else 20
+            points.append((x + radius * math.cos(angle),
+                           y + radius * math.sin(angle)))
+        world.add.complexPoly(points)
+
+
+def motors_and_pins(world, count=30):
+    for x, y in _grid(count, 10, 150, 150, 100):
+        wheel = world.add.ball((x, y), 30)
+        world.add.motor(wheel, (x, y), speed=5)
+        bar = world.add.rect((x, y - 60), 40, 8)
+        world.add.joint(bar, (x - 30, y - 60))
+
+
+SCENES = {
+    'ball_pit': ball_pit,
+    'box_stack': box_stack,
+    'chains': chains,
+    'magic_pen': magic_pen,
+    'motors_and_pins': motors_and_pins,
+}
+
+
+def find_samples():
+    """ Return the scene names of the bundled samples """
+    here = os.path.dirname(os.path.abspath(__file__))
+    return ['samples/' + os.path.basename(path) for path in
+            sorted(glob.glob(os.path.join(here, 'samples', '*.json')))]
+
+
+def build(name, renderer='pygame'):
+    """ Return a new world with the scene name, drawn by renderer """
+    world = elements.Elements(DEFAULT_SCREEN_SIZE, renderer=renderer)
+    world.renderer.set_surface(pygame.Surface(DEFAULT_SCREEN_SIZE))
+    if name.startswith('samples/'):
+        here = os.path.dirname(os.path.abspath(__file__))
+        world.load(os.path.join(here, name), serialized=True)
+    else:
+        world.add.ground()
+        SCENES[name](world)
+    return world
+
+
+def _best_ms(function, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000.0
+
+
+def measure(name, steps=DEFAULT_STEPS, repeat=3, renderer='pygame'):
+    """ Build the scene name and time it
+
+        Return: dict of the METRICS, with the body and joint counts
+    """
+    world = build(name, renderer)
+    result = {'scene': name, 'bodies': world.world.bodyCount,
+              'joints': world.world.jointCount, 'renderer': renderer}
+
+    fps = int(1.0 / PHYSICS_DT)
+    start = time.perf_counter()
+    for i in range(steps):
+        world.update(fps=fps)
+    elapsed = time.perf_counter() - start
+    result['steps_per_second'] = steps / elapsed if elapsed > 0 else 0.0
+    result['draw_ms'] = _best_ms(world.draw, repeat)
+
+    directory = tempfile.mkdtemp()
+    try:
+        for kind in ('json', 'binary'):
+            path = os.path.join(directory, 'scene.' + kind)
+            save = getattr(world, kind + '_save')
+            additional_vars = getattr(world, 'additional_vars', {})
+            result[kind + '_save_ms'] = _best_ms(
+                lambda: save(path, additional_vars), repeat)
+
+            def load():
+                other = elements.Elements(DEFAULT_SCREEN_SIZE, renderer=None)
+                other.load(path)
+
+            result[kind + '_load_ms'] = _best_ms(load, repeat)
+            os.remove(path)
+    finally:
+        os.rmdir(directory)
+
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_mb'] = peak / 1024.0
+    return result
+
+
+def _measure_job(name, steps, repeat, renderer):
+    try:
+        return measure(name, steps, repeat, renderer)
+    except Exception as e:
+        return {'scene': name, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def run(names, steps=DEFAULT_STEPS, repeat=3, renderer='pygame'):
+    """ Measure each scene in a new process, so peak memory is its own
+
+        Return: list of results, in the order of names
+    """
+    results = []
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(_measure_job, name, steps,
+                                           repeat, renderer).result())
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """ Compare results with a baseline
+
+        Return: list of (scene, metric, baseline value, value, change)
+        of the regressions, change being relative, positive when worse
+    """
+    regressions = []
+    for result in results:
+        base = baseline.get(result['scene'])
+        if base is None or 'error' in result:
+            continue
+        if base.get('renderer', 'pygame') != \
+                result.get('renderer', 'pygame'):
+            continue
+        for metric, higher_is_better in METRICS:
+            old = base.get(metric)
+            new = result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if higher_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append((result['scene'], metric, old, new,
+                                    change))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    baseline = load_baseline(path)
+    for result in results:
+        if 'error' not in result:
+            baseline[result['scene']] = result
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time canonical Physics scenes and compare them with '
+        'a baseline.')
+    parser.add_argument('scenes', nargs='*', metavar='scene',
+                        help='scenes to run (default: all), among %s and '
+                        'the samples' % ', '.join(sorted(SCENES)))
+    parser.add_argument('--steps', type=int, default=DEFAULT_STEPS,
+                        help='physics steps per scene (default %d)' %
+                        DEFAULT_STEPS)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='keep the best of N draws, saves and loads')
+    parser.add_argument('--baseline',
+                        help='baseline file (default %s), which must exist '
+                        'when given unless saving' % BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative change reported as a regression '
+                        '(default %.2f)' % DEFAULT_THRESHOLD)
+    parser.add_argument('--renderer', default='pygame',
+                        choices=('pygame', 'opengl'),
+                        help='drawing method timed (default pygame)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON lines')
+    args = parser.parse_args(argv)
+    if args.baseline and not args.save_baseline and \
+            not os.path.exists(args.baseline):
+        parser.error('no baseline %s, make it with --save-baseline' %
+                     args.baseline)
+    baseline_path = args.baseline or BASELINE_PATH
+
+    names = args.scenes or sorted(SCENES) + find_samples()
+    results = run(names, args.steps, args.repeat, args.renderer)
+
+    if args.json:
+        for result in results:
+            sys.stdout.write(json.dumps(result) + '\n')
+    else:
+        sys.stdout.write('%-24s %7s %9s %8s %8s %8s %8s %8s %7s\n' % (
+            'scene', 'bodies', 'steps/s', 'draw ms', 'json sv', 'json ld',
+            'bin sv', 'bin ld', 'peak MB'))
+        for result in results:
+            if 'error' in result:
+                sys.stdout.write('%-24s %s\n' % (result['scene'],
+                                                 result['error']))
+                continue
+            sys.stdout.write(
+                '%-24s %7d %9.0f %8.2f %8.2f %8.2f %8.2f %8.2f %7.1f\n' % (
+                    result['scene'], result['bodies'],
+                    result['steps_per_second'], result['draw_ms'],
+                    result['json_save_ms'], result['json_load_ms'],
+                    result['binary_save_ms'], result['binary_load_ms'],
+                    result['peak_mb']))
+
+    if args.save_baseline:
+        save_baseline(baseline_path, results)
+        sys.stderr.write('Baseline saved to %s\n' % baseline_path)
+        return 0
+
+    baseline = load_baseline(baseline_path)
+    if not baseline:
+        sys.stderr.write('No baseline in %s, nothing compared. Make it '
+                         'with --save-baseline\n' % baseline_path)
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for scene, metric, old, new, change in regressions:
+        sys.stderr.write('REGRESSION %s %s: %.2f -> %.2f (%+.0f%%)\n' % (
+            scene, metric, old, new, 100 * change))
+    sys.stderr.write('%d regressions against %s\n' % (
+        len(regressions), baseline_path))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
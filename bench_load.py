@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Physics, a 2D Physics Playground for Kids
+
+#  This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for loading saved projects.
+
+Generates worlds made of chains like the chain tool makes them with
+Add.chain, balls joined to the next one by distance joints and the first
+one held by the ground, saves them in the JSON and binary formats and
+times Elements.load().
+
+Usage:
+    python3 bench_load.py
+    python3 bench_load.py --bodies 1000 5000 20000 --links 100
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import myelements as elements
+from myelements import worldfile
+
+from headless import DEFAULT_SCREEN_SIZE
+
+DEFAULT_BODIES = (1000, 5000, 10000, 20000)
+
+
+def make_chain_model(bodies, links=50, size=0.1):
+    """ Return a world model of bodies balls in chains of links balls
+
+        Parameters:
+          bodies .. number of bodies, not counting ground
+          links ... balls per chain
+          size .... radius of a ball in meters
+
+        Return: dict in the format of Elements.get_world_model
+    """
+    world = elements.Elements(DEFAULT_SCREEN_SIZE, renderer=None)
+    radius = size * world.ppm
+    step = 2 * radius  # link length, in pixels
+    chains = -(-bodies // links)
+    columns = max(1, int(chains ** 0.5))
+    ground = world.world.groundBody
+    for chain in range(chains):
+        count = min(links, bodies - chain * links)
+        x = (chain % columns) * (links + 1) * step
+        # High above the screen, a row of chains every two links
+        y = (chain // columns) * 2 * step - 4000
+        # Balls at half a link from the ground and every link after it,
+        # the last one at the end of the line
+        length = (count - 1) * step if count > 1 else radius
+        world.add.chain([(x, y), (x + length, y)], step, radius,
+                        bodies=[ground, None])
+    return world.get_world_model()
+
+
+def time_load(path, repeat=1):
+    """ Return the best time to load path into a new world, in seconds """
+    best = None
+    for i in range(repeat):
+        world = elements.Elements(DEFAULT_SCREEN_SIZE, renderer=None)
+        world.add.ground()
+        start = time.perf_counter()
+        world.load(path)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(bodies=DEFAULT_BODIES, links=50, repeat=1):
+    """ Time loading chain worlds of each size in both formats
+
+        Return: list of dicts, one per size
+    """
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for count in bodies:
+            model = make_chain_model(count, links)
+            json_path = os.path.join(directory, 'chains.json')
+            binary_path = os.path.join(directory, 'chains.bin')
+            with open(json_path, 'w') as f:
+                json.dump(model, f)
+            worldfile.write(binary_path, model)
+            results.append({
+                'bodies': count,
+                'joints': len(model['jointlist']),
+                'json': time_load(json_path, repeat),
+                'binary': time_load(binary_path, repeat),
+                'json_bytes': os.path.getsize(json_path),
+                'binary_bytes': os.path.getsize(binary_path),
+            })
+            os.remove(json_path)
+            os.remove(binary_path)
+    finally:
+        os.rmdir(directory)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time loading generated chain worlds.')
+    parser.add_argument('--bodies', type=int, nargs='+',
+                        default=list(DEFAULT_BODIES),
+                        help='world sizes to generate')
+    parser.add_argument('--links', type=int, default=50,
+                        help='links per chain (default 50)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='keep the best of N loads')
+    args = parser.parse_args(argv)
+
+    sys.stdout.write('%8s %8s %10s %10s %10s %10s\n' % (
+        'bodies', 'joints', 'json s', 'binary s', 'json kB', 'binary kB'))
+    for result in run(args.bodies, args.links, args.repeat):
+        sys.stdout.write('%8d %8d %10.3f %10.3f %10d %10d\n' % (
+            result['bodies'], result['joints'], result['json'],
+            result['binary'], result['json_bytes'] // 1024,
+            result['binary_bytes'] // 1024))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
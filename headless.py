@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Physics, a 2D Physics Playground for Kids
+
+#  This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Headless simulation of saved Physics projects.
+
+Steps a world loaded from a journal or sample file at the same fixed
+timestep as the activity, without GTK, a display or pygame.
+
+Usage:
+    python3 headless.py samples/example-1.json --steps 1200 --every 120
+    python3 headless.py samples/ --steps 1200 --jobs 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import Box2D as box2d
+import myelements as elements
+from myelements.locals import PHYSICS_DT
+
+# Canvas size used for screen <> world conversions, matching a typical
+# XO display with the toolbar removed.
+DEFAULT_SCREEN_SIZE = (1200, 750)
+
+
+class HeadlessRunner:
+
+    def __init__(self, path=None, screen_size=DEFAULT_SCREEN_SIZE):
+        self.world = elements.Elements(screen_size, renderer=None)
+        self.steps = 0
+        if path is not None:
+            self.load(path)
+
+    def load(self, path):
+        """ Load a project saved by PhysicsGame.write_file """
+        self.world.load(path, serialized=True)
+        self.steps = 0
+
+    def step(self, count=1):
+        fps = int(1.0 / PHYSICS_DT)
+        for i in range(count):
+            self.world.update(fps=fps)
+        self.steps += count
+
+    def get_state(self):
+        """ Return the time and the state of every body except ground """
+        snapshot = self.world.capture_state()
+        state = snapshot.state
+        columns = zip(snapshot.bodies,
+                      state['x'].tolist(), state['y'].tolist(),
+                      state['angle'].tolist(),
+                      state['vx'].tolist(), state['vy'].tolist(),
+                      state['type'].tolist(), state['awake'].tolist())
+        bodies = []
+        for body, x, y, angle, vx, vy, type_, awake in columns:
+            if body == self.world.world.groundBody:
+                continue
+            bodies.append({
+                'position': (x, y),
+                'angle': angle,
+                'linearVelocity': (vx, vy),
+                'angularVelocity': body.angularVelocity,
+                'dynamic': type_ == box2d.b2_dynamicBody,
+                'awake': awake,
+            })
+        return {'step': self.steps,
+                'time': self.steps * PHYSICS_DT,
+                'bodies': bodies}
+
+    def run(self, steps, every=0, callback=None):
+        """ Step the world, calling callback(state) every `every` steps
+
+            Return: dict with the final state and timing
+        """
+        elapsed = 0.0
+        done = 0
+        while done < steps:
+            chunk = steps - done
+            if every > 0:
+                chunk = min(chunk, every - self.steps % every)
+            start = time.perf_counter()
+            self.step(chunk)
+            elapsed += time.perf_counter() - start
+            done += chunk
+            if every > 0 and callback is not None and \
+                    self.steps % every == 0:
+                callback(self.get_state())
+
+        return {
+            'steps': done,
+            'elapsed': elapsed,
+            'steps_per_second': done / elapsed if elapsed > 0 else 0.0,
+            'bodies': self.world.world.bodyCount - 1,
+            'joints': self.world.world.jointCount,
+            'final': self.get_state(),
+        }
+
+
+def run_scene(path, steps, every=0, callback=None):
+    """ Load the project at path and simulate it for steps steps """
+    return HeadlessRunner(path).run(steps, every, callback)
+
+
+def _run_scene_job(path, steps, every, keep_final):
+    # Runs in a worker process, which owns the Box2D world for the scene
+    states = []
+    try:
+        result = run_scene(path, steps, every, states.append)
+    except Exception as e:
+        return {'path': path, 'error': '%s: %s' % (type(e).__name__, e)}
+    result['path'] = path
+    if every > 0:
+        result['states'] = states
+    if not keep_final:
+        del result['final']
+    return result
+
+
+def find_scenes(path):
+    """ Return the project files in a directory, or [path] for a file.
+
+        Journal exports have no extension, so every regular file in the
+        directory is included; files that fail to load are reported with
+        an 'error' in their result.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    scenes = []
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if not name.startswith('.') and os.path.isfile(full):
+            scenes.append(full)
+    return scenes
+
+
+def run_scenes(paths, steps, every=0, workers=None, keep_final=True):
+    """ Simulate many projects in parallel, one process per core
+
+        Box2D holds the GIL while stepping, so scenes are spread over a
+        ProcessPoolExecutor rather than threads.
+
+        Parameters:
+          paths ...... project files
+          steps ...... number of steps per scene
+          every ...... also collect the state every N steps
+          workers .... number of processes, default os.cpu_count()
+          keep_final . include the final body states in each result
+
+        Return: dict with per-scene results, in the order of paths
+    """
+    paths = list(paths)
+    results = [None] * len(paths)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = {}
+        for i, path in enumerate(paths):
+            job = executor.submit(_run_scene_job, path, steps, every,
+                                  keep_final)
+            jobs[job] = i
+        for job in as_completed(jobs):
+            results[jobs[job]] = job.result()
+    elapsed = time.perf_counter() - start
+
+    total_steps = sum(r['steps'] for r in results if 'error' not in r)
+    return {
+        'scenes': results,
+        'elapsed': elapsed,
+        'failed': sum(1 for r in results if 'error' in r),
+        'steps': total_steps,
+        'steps_per_second': total_steps / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _print_json(data):
+    sys.stdout.write(json.dumps(data) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Simulate a saved Physics project without a display.')
+    parser.add_argument('paths', nargs='+', metavar='path',
+                        help='project file (JSON or binary) or a '
+                        'directory of them')
+    parser.add_argument('--steps', type=int, default=1200,
+                        help='number of %.4fs steps (default 1200)' %
+                        PHYSICS_DT)
+    parser.add_argument('--every', type=int, default=0,
+                        help='also print the state every N steps')
+    parser.add_argument('--no-final', action='store_true',
+                        help='omit the final body states from the summary')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes for several projects '
+                        '(default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    paths = []
+    for path in args.paths:
+        paths.extend(find_scenes(path))
+
+    if len(paths) == 1 and not os.path.isdir(args.paths[0]):
+        result = run_scene(paths[0], args.steps, args.every, _print_json)
+        if args.no_final:
+            del result['final']
+        result['path'] = paths[0]
+        _print_json(result)
+        sys.stderr.write('%d steps in %.3fs, %.0f steps/s\n' % (
+            result['steps'], result['elapsed'], result['steps_per_second']))
+        return 0
+
+    summary = run_scenes(paths, args.steps, args.every, args.jobs,
+                         keep_final=not args.no_final)
+    for result in summary['scenes']:
+        _print_json(result)
+    sys.stderr.write('%d scenes (%d failed), %d steps in %.3fs, '
+                     '%.0f steps/s\n' % (
+                         len(paths), summary['failed'], summary['steps'],
+                         summary['elapsed'], summary['steps_per_second']))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -171,3 +171,9 @@ def find_body(world, pos):
         return body[0]
     else:
         return None
+
+
+def find_bodies(world, points):
+    # find_body of each point, in one call
+    found = world.get_bodies_at_points([tuple_to_int(pos) for pos in points])
+    return [bodies[0] if bodies else None for bodies in found]
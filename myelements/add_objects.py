@@ -28,18 +28,29 @@ from .locals import *
 import Box2D as box2d
 
 # Imports
+import numpy
+
 from math import pi
 from math import sqrt
 from math import asin
 
 from . import tools_poly
 
+# Pieces of a decomposed outline smaller than this, in square pixels,
+# are dropped
+MIN_PIECE_AREA = 1.0
+# Fixture definitions kept for reuse, the cache is emptied beyond this
+PROTOTYPE_CACHE_SIZE = 256
+
 
 class Add:
     element_count = 0
 
     def __init__(self, parent):
         self.parent = parent
+        # Body and fixture definitions, reused by the bodies alike
+        self._body_defs = {}
+        self._fixture_defs = {}
 
     def set_color(self, color):
         self.parent.set_color(color)
@@ -50,6 +61,46 @@ class Add:
     def next_color(self):
         return self.parent.next_color()
 
+    def _body_def(self, pos, dynamic):
+        # The body definition for pos, with a new userData dict, as
+        # Box2D copies the definition into the body
+        bodyDef = self._body_defs.get(dynamic)
+        if bodyDef is None:
+            bodyDef = box2d.b2BodyDef()
+            if dynamic:
+                bodyDef.type = box2d.b2_dynamicBody
+            self._body_defs[dynamic] = bodyDef
+        bodyDef.position = pos
+        bodyDef.userData = {'color': self.parent.get_color()}
+        return bodyDef
+
+    def _fixture_def(self, key, make_shape, density, restitution, friction):
+        # The fixture definition of the shape key with a material, the
+        # shape being made by make_shape() the first time
+        key = (key, density, restitution, friction)
+        fixtureDef = self._fixture_defs.get(key)
+        if fixtureDef is None:
+            if len(self._fixture_defs) >= PROTOTYPE_CACHE_SIZE:
+                self._fixture_defs.clear()
+            fixtureDef = box2d.b2FixtureDef(
+                shape=make_shape(), density=density,
+                restitution=restitution, friction=friction)
+            self._fixture_defs[key] = fixtureDef
+        return fixtureDef
+
+    def _bulk(self, positions, screenCoord, *values):
+        # Positions in meters as a list of (x, y), and each of values as
+        # a list with one item per position
+        positions = numpy.array(positions, float).reshape(-1, 2)
+        if screenCoord:
+            positions = self.parent.to_world_array(positions)
+        if self.parent.input_unit == INPUT_PIXELS:
+            positions /= self.parent.ppm
+        count = len(positions)
+        lists = [numpy.broadcast_to(value, (count, )).tolist()
+                 for value in values]
+        return [tuple(pos) for pos in positions.tolist()], lists
+
     def ground(self):
         """ Add a static ground to the scene
 
@@ -106,37 +157,43 @@ class Add:
               friction=0.5):
         # Add a ball without correcting any settings
         # meaning, pos and vertices are in meters
-        # Define the body
-        x, y = pos
-        bodyDef = box2d.b2BodyDef()
-        bodyDef.position = (x, y)
-
-        userData = {'color': self.parent.get_color()}
-        bodyDef.userData = userData
-
         # Create the Body
         if not dynamic:
             density = 0
-        else:
-            bodyDef.type = box2d.b2_dynamicBody
 
-        body = self.parent.world.CreateBody(bodyDef)
+        body = self.parent.world.CreateBody(self._body_def(pos, dynamic))
 
         self.parent.element_count += 1
 
         # Add a shape to the Body
-        circleShape = box2d.b2CircleShape()
-        circleShape.radius = radius
-        circleDef = box2d.b2FixtureDef()
-        circleDef.shape = circleShape
-        circleDef.density = density
-        circleDef.restitution = restitution
-        circleDef.friction = friction
-
-        body.CreateFixture(circleDef)
+        body.CreateFixture(self._fixture_def(
+            ('circle', radius), lambda: box2d.b2CircleShape(radius=radius),
+            density, restitution, friction))
 
         return body
 
+    def balls(self, positions, radii, dynamic=True, density=1.0,
+              restitution=0.16, friction=0.5, screenCoord=True):
+        """ Add many balls in one call, in the current input unit
+            system (meters or pixels)
+
+            Parameters:
+              positions .. positions (x,y), or an (n, 2) array
+              radii ...... circle radius, or one per ball
+              other ...... see [physics parameters], one value for all
+                           balls or one per ball
+
+            Return: list of box2d.b2Body
+        """
+        positions, (radii, density, restitution, friction) = self._bulk(
+            positions, screenCoord, radii, density, restitution, friction)
+        if self.parent.input_unit == INPUT_PIXELS:
+            radii = [radius / self.parent.ppm for radius in radii]
+
+        return [self._ball(*args) for args in zip(
+            positions, radii, [dynamic] * len(positions), density,
+            restitution, friction)]
+
     def rect(self, pos, width, height, angle=0, dynamic=True, density=1.0,
              restitution=0.16, friction=0.5, screenCoord=True):
         """ Add a dynamic rectangle with input unit according to self.input
@@ -219,36 +276,49 @@ class Add:
         # Add a rect without correcting any settings
         # meaning, pos and vertices are in meters
         # angle is now in radians ((degrees * pi) / 180))
-        x, y = pos
-        bodyDef = box2d.b2BodyDef()
-        bodyDef.position = (x, y)
-
-        userData = {'color': self.parent.get_color()}
-        bodyDef.userData = userData
-
         # Create the Body
         if not dynamic:
             density = 0
-        else:
-            bodyDef.type = box2d.b2_dynamicBody
 
-        body = self.parent.world.CreateBody(bodyDef)
+        body = self.parent.world.CreateBody(self._body_def(pos, dynamic))
 
         self.parent.element_count += 1
 
         # Add a shape to the Body
-        boxDef = box2d.b2FixtureDef()
-
-        polygonShape = box2d.b2PolygonShape()
-        polygonShape.SetAsBox(width, height, (0, 0), angle)
-        boxDef.shape = polygonShape
-        boxDef.density = density
-        boxDef.restitution = restitution
-        boxDef.friction = friction
-        body.CreateFixture(boxDef)
+        body.CreateFixture(self._fixture_def(
+            ('box', width, height, angle),
+            lambda: box2d.b2PolygonShape(box=(width, height, (0, 0), angle)),
+            density, restitution, friction))
 
         return body
 
+    def rects(self, positions, widths, heights, angles=0, dynamic=True,
+              density=1.0, restitution=0.16, friction=0.5, screenCoord=True):
+        """ Add many rectangles in one call, in the current input unit
+            system (meters or pixels)
+
+            Parameters:
+              positions .. positions (x,y), or an (n, 2) array
+              widths ..... horizontal line, or one per rectangle
+              heights .... vertical line, or one per rectangle
+              angles ..... in degrees (0 .. 360), or one per rectangle
+              other ...... see [physics parameters], one value for all
+                           rectangles or one per rectangle
+
+            Return: list of box2d.b2Body
+        """
+        positions, (widths, heights, angles, density, restitution,
+                    friction) = self._bulk(
+            positions, screenCoord, widths, heights,
+            numpy.radians(angles), density, restitution, friction)
+        if self.parent.input_unit == INPUT_PIXELS:
+            widths = [width / self.parent.ppm for width in widths]
+            heights = [height / self.parent.ppm for height in heights]
+
+        return [self._rect(*args) for args in zip(
+            positions, widths, heights, angles, [dynamic] * len(positions),
+            density, restitution, friction)]
+
     def poly(self, pos, vertices, dynamic=True, density=1.0, restitution=0.16,
              friction=0.5, screenCoord=True):
         """ Add a dynamic polygon, which has the vertices arranged around
@@ -290,33 +360,20 @@ class Add:
               restitution=0.16, friction=0.5):
         # add a centered poly at pos without correcting any settings
         # meaning, pos and vertices are in meters
-        x, y = pos
-        bodyDef = box2d.b2BodyDef()
-        bodyDef.position = (x, y)
-
-        userData = {'color': self.parent.get_color()}
-        bodyDef.userData = userData
-
         # Create the Body
         if not dynamic:
             density = 0
-        else:
-            bodyDef.type = box2d.b2_dynamicBody
 
-        body = self.parent.world.CreateBody(bodyDef)
+        body = self.parent.world.CreateBody(self._body_def(pos, dynamic))
 
         self.parent.element_count += 1
 
         # Add a shape to the Body
-        polyDef = box2d.b2FixtureDef()
-
-        polygonShape = box2d.b2PolygonShape()
-        polygonShape.vertices = vertices
-        polyDef.shape = polygonShape
-        polyDef.density = density
-        polyDef.restitution = restitution
-        polyDef.friction = friction
-        body.CreateFixture(polyDef)
+        vertices = tuple(tuple(v) for v in vertices)
+        body.CreateFixture(self._fixture_def(
+            ('polygon', vertices),
+            lambda: box2d.b2PolygonShape(vertices=vertices),
+            density, restitution, friction))
 
         return body
 
@@ -333,6 +390,12 @@ class Add:
         x, y = c = tools_poly.calc_center(vertices)
         vertices = tools_poly.poly_center_vertices(vertices)
 
+        # A closed outline is filled with a few convex pieces, and only
+        # made of lines (rects) when it cannot be decomposed
+        shapes = None
+        if is_closed:
+            shapes = self._convex_shapes(vertices[:-1])
+
         # Bring coordinates into the world coordinate system (flip,
         # camera offset, ...)
         if screenCoord:
@@ -363,6 +426,13 @@ class Add:
 
         self.parent.element_count += 1
 
+        if shapes:
+            for shape in shapes:
+                body.CreateFixture(box2d.b2FixtureDef(
+                    shape=shape, density=density, restitution=restitution,
+                    friction=friction))
+            return body
+
         # Create the reusable Box2D polygon and circle definitions
         polyDef = box2d.b2FixtureDef()
 
@@ -421,6 +491,32 @@ class Add:
         # Return hard and soft reduced vertices
         return body
 
+    def _convex_shapes(self, vertices):
+        """ Decompose a closed outline into convex polygon shapes
+
+            Parameters:
+              vertices .. outline around the center in pixels, not closed
+
+            Return: list of box2d.b2PolygonShape, or None when the
+            outline cannot be decomposed
+        """
+        pieces = tools_poly.decompose_poly(vertices)
+        if not pieces:
+            return None
+
+        shapes = []
+        for piece in pieces:
+            # Slivers left by the triangulation are too thin to matter
+            if tools_poly.poly_area(piece) < MIN_PIECE_AREA:
+                continue
+            try:
+                shapes.append(box2d.b2PolygonShape(
+                    vertices=[(vx / self.parent.ppm, vy / self.parent.ppm)
+                              for vx, vy in piece]))
+            except (AssertionError, ValueError):
+                return None
+        return shapes or None
+
     def complexPoly(self, vertices, dynamic=True, density=1.0,
                     restitution=0.16, friction=0.5):
         # 1. Step: Reduce
@@ -521,7 +617,7 @@ class Add:
             jointDef.Initialize(b1, b2, p1, p2)
             jointDef.collideConnected = flag
 
-            self.parent.world.CreateJoint(jointDef)
+            self.parent.create_joint(jointDef)
 
         elif len(args) == 4:
             # Distance Joint
@@ -535,7 +631,7 @@ class Add:
             jointDef.collideConnected = True
 
             try:
-                self.parent.world.CreateJoint(jointDef)
+                self.parent.create_joint(jointDef)
             except AssertionError:
                 pass
 
@@ -553,7 +649,7 @@ class Add:
             jointDef.Initialize(b1, b2, p1)
 
             try:
-                self.parent.world.CreateJoint(jointDef)
+                self.parent.create_joint(jointDef)
             except AssertionError:
                 pass
 
@@ -567,10 +663,169 @@ class Add:
             jointDef.Initialize(b1, b2, p1)
 
             try:
-                self.parent.world.CreateJoint(jointDef)
+                self.parent.create_joint(jointDef)
             except AssertionError:
                 pass
 
+    def chain(self, vertices, link_length, radius, bodies=None,
+              closed=False, joint=CHAIN_DISTANCE, max_links=None,
+              density=1.0, restitution=0.16, friction=0.1, find=None):
+        """ Add a chain of balls along a polyline, in one batch
+
+            A ball is placed every link_length along each segment, and
+            the balls are joined one to the next. The vertices are held
+            by the bodies given, or else, as when the chain is built one
+            segment after the other, by a ball of the chain made before
+            the vertex which it lies on, by the body find returns, or by
+            a new ball.
+
+            Parameters:
+              vertices ..... polyline in screen coordinates (pixels)
+              link_length .. distance between two balls (pixels)
+              radius ....... radius of the balls (pixels)
+              bodies ....... body at each vertex, None for a new ball
+              closed ....... join the last vertex back to the first,
+                             unless both are held by the same body
+              joint ........ CHAIN_DISTANCE, CHAIN_ROPE (slack allowed)
+                             or CHAIN_REVOLUTE (pinned between balls)
+              max_links .... longer links are used when the chain would
+                             have more balls than this
+              find ......... function of a list of vertices returning
+                             the body of the world holding each, or None
+              other ........ see [physics parameters]
+
+            Return: list of the new box2d.b2Body
+        """
+        points = numpy.array(vertices, float).reshape(-1, 2)
+        if bodies is None:
+            bodies = [None] * len(points)
+        else:
+            bodies = list(bodies)
+        closed = closed and len(points) > 2
+
+        starts = numpy.arange(len(points) - 1)
+        ends = starts + 1
+        if closed:
+            starts = numpy.append(starts, len(points) - 1)
+            ends = numpy.append(ends, 0)
+        deltas = points[ends] - points[starts]
+        lengths = numpy.hypot(deltas[:, 0], deltas[:, 1])
+
+        if max_links:
+            links = lengths[lengths >= link_length].sum() / link_length
+            if links > max_links:
+                link_length *= links / max_links
+        half, step = int(link_length / 2.), int(link_length)
+
+        # Links of each segment, at half + k * step along it
+        dists = (lengths + 0.5).astype(int)
+        counts = numpy.where(dists < link_length, 0,
+                             -((half - dists) // step))
+        segments = numpy.repeat(numpy.arange(len(starts)), counts)
+        first = numpy.cumsum(counts) - counts
+        offsets = numpy.arange(counts.sum()) - first[segments]
+        offsets = half + step * offsets
+        directions = deltas / numpy.maximum(lengths, 1e-9)[:, None]
+        links = directions[segments] * offsets[:, None]
+        links = numpy.trunc(points[starts[segments]] + links)
+
+        # The bodies of the world at the vertices, in one query
+        missing = [i for i, body in enumerate(bodies) if body is None]
+        if find is not None and missing:
+            found = dict(zip(missing, find(points[missing].tolist())))
+        else:
+            found = {}
+
+        # The holder of each vertex: a body, or ('vertex', i) or
+        # ('link', i) for the new balls made below
+        new_vertices = []
+        for i, point in enumerate(points):
+            if bodies[i] is not None:
+                continue
+            # Before vertex i, the vertices up to i - 1 and the links of
+            # the segments up to i - 2 were made
+            near = numpy.flatnonzero(numpy.hypot(
+                *(points[new_vertices] - point).T) <= radius)
+            made = links[:int(counts[:max(i - 1, 0)].sum())]
+            near_link = numpy.flatnonzero(numpy.hypot(
+                *(made - point).T) <= radius)
+            if len(near):
+                bodies[i] = ('vertex', new_vertices[near[0]])
+            elif len(near_link):
+                bodies[i] = ('link', int(near_link[0]))
+            else:
+                bodies[i] = found.get(i)
+            if bodies[i] is None:
+                bodies[i] = ('vertex', i)
+                new_vertices.append(i)
+
+        if closed and bodies[0] == bodies[-1]:
+            # Already closed, drop the last segment
+            keep = segments < len(starts) - 1
+            links = links[keep]
+            segments = segments[keep]
+            counts = counts[:-1]
+            starts = starts[:-1]
+            ends = ends[:-1]
+
+        # All the balls at once, the new vertices first
+        created = self.balls(numpy.concatenate((points[new_vertices], links)),
+                             radius, density=density,
+                             restitution=restitution, friction=friction)
+        new = dict(zip((('vertex', i) for i in new_vertices), created))
+        link_bodies = created[len(new_vertices):]
+        new.update((('link', i), body) for i, body in enumerate(link_bodies))
+        bodies = [new[body] if isinstance(body, tuple) else body
+                  for body in bodies]
+
+        # Anchors in meters, of the vertices and of the links
+        anchors = self.parent.to_world_array(
+            numpy.concatenate((points, links))) / self.parent.ppm
+        anchors = [box2d.b2Vec2(*anchor) for anchor in anchors.tolist()]
+        link_anchors = anchors[len(points):]
+
+        jointDef = {CHAIN_ROPE: box2d.b2RopeJointDef,
+                    CHAIN_REVOLUTE: box2d.b2RevoluteJointDef}.get(
+            joint, box2d.b2DistanceJointDef)()
+        link = 0
+        for segment, count in enumerate(counts.tolist()):
+            start, end = int(starts[segment]), int(ends[segment])
+            if not count:
+                # Too short for a chain, the vertices are joined directly
+                self._chain_joint(jointDef, bodies[start], bodies[end],
+                                  anchors[start], anchors[end], True)
+                continue
+            chain = [(bodies[start], anchors[start])]
+            chain.extend(zip(link_bodies[link:link + count],
+                             link_anchors[link:link + count]))
+            chain.append((bodies[end], anchors[end]))
+            link += count
+            for (b1, p1), (b2, p2) in zip(chain, chain[1:]):
+                self._chain_joint(jointDef, b1, b2, p1, p2, False)
+
+        return created
+
+    def _chain_joint(self, jointDef, b1, b2, p1, p2, collideConnected):
+        # Join two balls of a chain with jointDef, which is reused
+        if b1 == b2:
+            return
+        if isinstance(jointDef, box2d.b2RevoluteJointDef):
+            jointDef.Initialize(b1, b2, (p1 + p2) * 0.5)
+        elif isinstance(jointDef, box2d.b2RopeJointDef):
+            jointDef.bodyA = b1
+            jointDef.bodyB = b2
+            jointDef.localAnchorA = b1.GetLocalPoint(p1)
+            jointDef.localAnchorB = b2.GetLocalPoint(p2)
+            jointDef.maxLength = (p2 - p1).length
+        else:
+            jointDef.Initialize(b1, b2, p1, p2)
+        jointDef.collideConnected = collideConnected
+
+        try:
+            self.parent.create_joint(jointDef)
+        except AssertionError:
+            pass
+
     def motor(self, body, pt, torque=900, speed=-10):
         # Revolute joint to the background with motor torque applied
         b1 = self.parent.world.groundBody
@@ -582,7 +837,7 @@ class Add:
         jointDef.motorSpeed = speed
         jointDef.enableMotor = True
 
-        self.parent.world.CreateJoint(jointDef)
+        self.parent.create_joint(jointDef)
 
     def mouseJoint(self, body, pos, jointForce=100.0):
         pos = self.parent.to_world(pos)
@@ -127,3 +127,19 @@ class kContactListener(box2d.b2ContactListener):
     def Remove(self, point):
         """Called when a contact point is removed"""
         self.check_contact(CALLBACK_CONTACT_REMOVE, point)
+
+
+class kDestructionListener(box2d.b2DestructionListener):
+
+    def __init__(self, parent):
+        # Init the Box2D b2DestructionListener
+        box2d.b2DestructionListener.__init__(self)
+
+        self.parent = parent
+
+    def SayGoodbye(self, obj):
+        """Called for each fixture and joint destroyed with their body"""
+        if isinstance(obj, box2d.b2Fixture):
+            self.parent.fixture_destroyed(obj)
+        elif isinstance(obj, box2d.b2Joint):
+            self.parent.joint_destroyed(obj)
@@ -24,10 +24,13 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import ctypes
 from math import pi
 from math import cos
 from math import sin
 
+import numpy
+
 from . import tools
 
 # Functions of a rendering class
@@ -41,12 +44,23 @@ from . import tools
 #    set_lineWidth
 #
 # renderer-specific mandatory functions:
-# for pygame:
+# for pygame and opengl:
 #    set_surface
+#    get_surface
+#    set_retained
+#    invalidate
+#    add_dirty, get_dirty, dirty and changed (attributes)
+#
+# optional, for a retained layer of settled bodies (see Elements.draw):
+#    retained (attribute)
+#    layer_changed
+#    begin_layer
+#    end_layer
+#    restore
 # for cairo:
 #    draw_text
 # for opengl:
-#
+#    draw_polygon gets convex polygons only
 
 # IMPORTANT
 # The drawing functions get the coordinates in their screen coordinate system
@@ -59,6 +73,17 @@ class draw_pygame(object):
         simple since we only need draw_ellipse and draw_polygon.
     """
     lineWidth = 0
+    # Draw the orientation vector of circles, off at a coarse level of
+    # detail
+    orientation = True
+    # With retained set, bodies which are not moving are drawn once into
+    # a cached layer, and only the changed areas of the surface are
+    # reported by get_dirty() for pygame.display.update()
+    retained = False
+    background = (255, 255, 255)
+    # Whether something new was drawn since the last get_dirty(), and not
+    # only erased back from the layer by restore()
+    changed = False
 
     def __init__(self):
         """ Load pygame.draw and pygame.Rect, and reference it for
@@ -72,9 +97,18 @@ class draw_pygame(object):
         """
         from pygame import draw
         from pygame import Rect
+        from pygame import Surface
 
         self.draw = draw
         self.Rect = Rect
+        self.Surface = Surface
+
+        self.dirty = []
+        self._drawn = []
+        self._last_drawn = []
+        self._layer = None
+        self._layer_key = None
+        self._target = None
 
     def set_lineWidth(self, lw):
         """
@@ -85,12 +119,92 @@ class draw_pygame(object):
         """
         """
         self.surface = surface
+        self.invalidate()
 
     def get_surface(self):
         """
         """
         return self.surface
 
+    def set_retained(self, retained, background=None):
+        """ Enable or disable the retained layer
+
+            Parameters:
+              retained .... True or False
+              background .. color the layer is cleared with
+
+            Return: -
+        """
+        self.retained = retained
+        if background is not None:
+            self.background = background
+        self.invalidate()
+
+    def invalidate(self):
+        """ Redraw everything on the next frame, eg. after the surface
+            was changed by something else than the renderer
+        """
+        self._layer_key = None
+
+    def layer_changed(self, key):
+        """ Return True if the layer must be redrawn for key, a value
+            describing the settled bodies and the view
+        """
+        return self._layer_key is None or self._layer_key != key or \
+            self._layer.get_size() != self.surface.get_size()
+
+    def begin_layer(self, key):
+        """ Send the following drawing to the cleared layer
+        """
+        size = self.surface.get_size()
+        if self._layer is None or self._layer.get_size() != size:
+            self._layer = self.Surface(size)
+        self._layer.fill(self.background)
+        self._layer_key = key
+        self._target = self.surface
+        self.surface = self._layer
+
+    def end_layer(self):
+        """ Draw to the surface again, starting with a copy of the layer
+        """
+        self.surface = self._target
+        self._target = None
+        self.surface.blit(self._layer, (0, 0))
+        self.dirty = [self.surface.get_rect()]
+        self.changed = True
+
+    def restore(self):
+        """ Erase what was drawn over the layer in the last frame
+        """
+        for rect in self._last_drawn:
+            self.surface.blit(self._layer, rect, rect)
+        self.dirty = list(self._last_drawn)
+
+    def add_dirty(self, rect, changed=True):
+        """ Report an area of the surface changed outside the renderer
+
+            Parameters:
+              rect ..... the area drawn over the layer
+              changed .. False when the same was drawn there in the last
+                         frame, so the frame only puts it back
+        """
+        if self.retained and self._target is None:
+            self.dirty.append(rect)
+            self._drawn.append(rect)
+            if changed:
+                self.changed = True
+
+    def get_dirty(self):
+        """ Return the areas changed since the last call, and remember
+            what was drawn over the layer to be restored in the next frame
+        """
+        dirty = self.dirty
+        self._last_drawn = self._drawn
+        self.dirty = []
+        self._drawn = []
+        self.changed = False
+        return dirty
+
     def start_drawing(self):
         pass
 
@@ -114,10 +228,11 @@ class draw_pygame(object):
         y1 = y - radius
 
         rect = self.Rect([x1, y1, 2 * radius, 2 * radius])
-        self.draw.ellipse(self.surface, clr, rect, self.lineWidth)
+        self.add_dirty(
+            self.draw.ellipse(self.surface, clr, rect, self.lineWidth))
 
         # draw the orientation vector
-        if radius > 10:
+        if self.orientation and radius > 10:
             rx = cos(angle) * radius
             ry = -sin(angle) * radius
 
@@ -132,7 +247,8 @@ class draw_pygame(object):
 
             Return: -
         """
-        self.draw.polygon(self.surface, clr, points, self.lineWidth)
+        self.add_dirty(
+            self.draw.polygon(self.surface, clr, points, self.lineWidth))
         # self.draw.lines(self.surface, clr, True, points)
 
     def draw_lines(self, clr, closed, points, width=None):
@@ -149,7 +265,7 @@ class draw_pygame(object):
         else:
             lw = width
 
-        self.draw.lines(self.surface, clr, closed, points, lw)
+        self.add_dirty(self.draw.lines(self.surface, clr, closed, points, lw))
 
 
 class draw_cairo(object):
@@ -385,3 +501,322 @@ class draw_opengl_pyglet(object):
 
     def after_drawing(self):
         pass
+
+
+class draw_opengl(object):
+
+    """ This class handles the drawing with OpenGL, off screen through
+        EGL (the software rasterizer of Mesa will do), into the pygame
+        surface. The shapes are collected while drawing and sent at
+        once in after_drawing(): a vertex buffer of the frame, and a
+        call for each run of triangles, or of lines of a width, in the
+        order they were drawn.
+    """
+    lineWidth = 0
+    orientation = True
+    # The whole frame is drawn each time, into the whole surface
+    retained = False
+    background = (255, 255, 255)
+    changed = False
+    segments = 16  # of a circle
+
+    def __init__(self):
+        """ Make the OpenGL context, and load pygame.image and pygame.Rect
+
+            Return: Class draw_opengl(), raises OSError or RuntimeError
+              if OpenGL is not available
+        """
+        from pygame import image
+        from pygame import Rect
+
+        from . import egl
+
+        self.egl = egl
+        self.gl = egl.OffscreenGL()
+        self.image = image
+        self.Rect = Rect
+
+        self.surface = None
+        self.dirty = []
+        self._buffer = ctypes.c_uint(0)
+        self.gl.glGenBuffers(1, self._buffer)
+        self._pixels = bytearray()
+        self._last_pixels = bytearray()
+        self.start_drawing()
+
+    def set_lineWidth(self, lw):
+        """
+        """
+        self.lineWidth = lw
+
+    def set_surface(self, surface):
+        """
+        """
+        self.surface = surface
+        self.invalidate()
+
+    def get_surface(self):
+        """
+        """
+        return self.surface
+
+    def set_retained(self, retained, background=None):
+        """ Only the background is used, there is no retained layer
+
+            Parameters:
+              retained .... ignored
+              background .. color the frame is cleared with
+
+            Return: -
+        """
+        if background is not None:
+            self.background = background
+
+    def invalidate(self):
+        """ Size the framebuffer like the surface
+        """
+        if self.surface is not None:
+            self.gl.make_current()
+            self.gl.resize(self.surface.get_size())
+
+    def add_dirty(self, rect, changed=True):
+        """ Report an area of the surface changed outside the renderer
+        """
+        self.dirty.append(rect)
+        if changed:
+            self.changed = True
+
+    def get_dirty(self):
+        """ Return the areas changed since the last call
+        """
+        dirty = self.dirty
+        self.dirty = []
+        self.changed = False
+        return dirty
+
+    def start_drawing(self):
+        self._shapes = 0  # drawing order of the calls
+        self._circles = []  # (x, y, radius)
+        self._circle_colors = []
+        self._circle_order = []
+        self._points = []  # of the polygons, one after the other
+        self._sizes = []
+        self._polygon_colors = []
+        self._polygon_order = []
+        self._ends = []  # of the line segments, two by two
+        self._line_colors = []
+        self._line_order = []
+        self._line_widths = []
+
+    def draw_circle(self, clr, pt, radius, angle):
+        """ Draw a circle
+
+            Parameters:
+              pt ........ (x, y)
+              clr ....... color in rgb ((r), (g), (b))
+              radius .... circle radius
+              angle ..... rotation in radians
+
+            Return: -
+        """
+        x, y = pt
+        if self.lineWidth:
+            step = 2 * pi / self.segments
+            self.draw_lines(clr, True,
+                            [(x + cos(i * step) * radius,
+                              y + sin(i * step) * radius)
+                             for i in range(self.segments)])
+        else:
+            self._circles.append((x, y, radius))
+            self._circle_colors.append(clr[:3])
+            self._circle_order.append(self._shapes)
+            self._shapes += 1
+
+        # draw the orientation vector
+        if self.orientation and radius > 10:
+            rx = cos(angle) * radius
+            ry = -sin(angle) * radius
+            self.draw_lines((255, 255, 255), False, [pt, (x + rx, y + ry)], 1)
+
+    def draw_polygon(self, clr, points):
+        """ Draw a convex polygon
+
+            Parameters:
+              clr ....... color in rgb ((r), (g), (b))
+              points .... polygon points in normal (x,y) positions
+
+            Return: -
+        """
+        if self.lineWidth:
+            self.draw_lines(clr, True, points)
+        elif len(points) > 2:
+            self._points.extend(points)
+            self._sizes.append(len(points))
+            self._polygon_colors.append(clr[:3])
+            self._polygon_order.append(self._shapes)
+            self._shapes += 1
+
+    def draw_lines(self, clr, closed, points, width=None):
+        """ Draw a polyline
+
+            Parameters:
+              clr ....... color in rgb ((r), (g), (b))
+              closed .... True to join the last point to the first
+              points .... polyline points in normal (x,y) positions
+              width ..... line width, lineWidth when None
+
+            Return: -
+        """
+        points = list(points)
+        if closed:
+            points.append(points[0])
+        count = len(points) - 1
+        if count < 1:
+            return
+        for p1, p2 in zip(points, points[1:]):
+            self._ends.append(p1)
+            self._ends.append(p2)
+        self._line_colors.extend([clr[:3]] * count)
+        self._line_order.extend([self._shapes] * count)
+        self._line_widths.extend([width or self.lineWidth or 1] * count)
+        self._shapes += 1
+
+    def _triangles(self):
+        """ Return the vertices, colors and drawing order of the circles
+            and polygons as triangles
+        """
+        vertices = [numpy.zeros((0, 2))]
+        colors = [numpy.zeros((0, 3), numpy.uint8)]
+        order = [numpy.zeros(0, int)]
+
+        if self._circles:
+            circles = numpy.array(self._circles, float)
+            angles = numpy.linspace(0, 2 * pi, self.segments + 1)
+            rim = numpy.empty((len(circles), self.segments + 1, 2))
+            rim[..., 0] = circles[:, 0, None] + \
+                circles[:, 2, None] * numpy.cos(angles)
+            rim[..., 1] = circles[:, 1, None] + \
+                circles[:, 2, None] * numpy.sin(angles)
+            fans = numpy.empty((len(circles), self.segments, 3, 2))
+            fans[:, :, 0] = circles[:, None, :2]
+            fans[:, :, 1] = rim[:, :-1]
+            fans[:, :, 2] = rim[:, 1:]
+            vertices.append(fans.reshape(-1, 2))
+            colors.append(numpy.repeat(numpy.array(
+                self._circle_colors, numpy.uint8), 3 * self.segments, 0))
+            order.append(numpy.repeat(self._circle_order, self.segments))
+
+        if self._points:
+            # Convex polygons as fans from their first point
+            points = numpy.array(self._points, float)
+            sizes = numpy.array(self._sizes)
+            counts = sizes - 2
+            polygon = numpy.repeat(numpy.arange(len(sizes)), counts)
+            first = (numpy.cumsum(sizes) - sizes)[polygon]
+            k = numpy.arange(counts.sum()) - \
+                numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            corners = numpy.stack((first, first + k + 1, first + k + 2), 1)
+            vertices.append(points[corners.ravel()])
+            colors.append(numpy.repeat(numpy.array(
+                self._polygon_colors, numpy.uint8)[polygon], 3, 0))
+            order.append(numpy.array(self._polygon_order)[polygon])
+
+        return (numpy.concatenate(vertices), numpy.concatenate(colors),
+                numpy.concatenate(order))
+
+    def _batches(self):
+        """ Return the vertices and colors of the frame in drawing order,
+            and the draws to make: (mode, line width, first vertex,
+            vertex count). A draw covers the calls in a row with the same
+            primitive and width, so shapes overlap as with pygame.
+        """
+        egl = self.egl
+        vertices, colors, order = self._triangles()
+        triangles = len(order)
+        ends = numpy.array(self._ends, float).reshape(-1, 2)
+        vertices = numpy.concatenate((vertices, ends))
+        colors = numpy.concatenate((colors, numpy.repeat(numpy.array(
+            self._line_colors, numpy.uint8).reshape(-1, 3), 2, 0)))
+        order = numpy.concatenate((order, self._line_order)).astype(int)
+        # The line width, 0 for triangles
+        kind = numpy.concatenate((numpy.zeros(triangles),
+                                  self._line_widths))
+        size = numpy.where(numpy.arange(len(kind)) < triangles, 3, 2)
+        first = numpy.cumsum(size) - size
+
+        primitives = numpy.argsort(order, kind='stable')
+        size = size[primitives]
+        kind = kind[primitives]
+        start = numpy.cumsum(size) - size
+        corners = numpy.repeat(first[primitives], size) + \
+            numpy.arange(size.sum()) - numpy.repeat(start, size)
+
+        draws = []
+        runs = numpy.flatnonzero(numpy.diff(kind)) + 1
+        bounds = [0] + runs.tolist() + [len(kind)]
+        for i, j in zip(bounds, bounds[1:]):
+            if i == j:
+                continue
+            lw = kind[i]
+            mode = egl.GL_LINES if lw else egl.GL_TRIANGLES
+            begin = int(start[i])
+            draws.append((mode, float(lw), begin,
+                          int(start[j - 1] + size[j - 1]) - begin))
+        return vertices[corners], colors[corners], draws
+
+    def after_drawing(self):
+        """ Draw the frame with OpenGL, and copy it to the surface
+        """
+        gl = self.gl
+        egl = self.egl
+        gl.make_current()
+        width, height = gl.size
+
+        vertices, colors, draws = self._batches()
+        count = len(vertices)
+
+        # One buffer of the positions, followed by the RGBA colors
+        rgba = numpy.full((count, 4), 255, numpy.uint8)
+        rgba[:, :3] = colors
+        data = vertices.astype(numpy.float32).tobytes()
+        offset = len(data)
+        data += rgba.tobytes()
+
+        r, g, b = tools.rgb2floats(self.background[:3])
+        gl.glClearColor(r, g, b, 1.0)
+        gl.glClear(egl.GL_COLOR_BUFFER_BIT)
+        # Screen coordinates at the pixel centers, like pygame, and the
+        # first row read back is the top one
+        gl.glMatrixMode(egl.GL_PROJECTION)
+        gl.glLoadIdentity()
+        gl.glOrtho(-0.5, width - 0.5, -0.5, height - 0.5, -1, 1)
+        gl.glMatrixMode(egl.GL_MODELVIEW)
+        gl.glLoadIdentity()
+
+        if count:
+            gl.glBindBuffer(egl.GL_ARRAY_BUFFER, self._buffer)
+            gl.glBufferData(egl.GL_ARRAY_BUFFER, len(data), data,
+                            egl.GL_STREAM_DRAW)
+            gl.glEnableClientState(egl.GL_VERTEX_ARRAY)
+            gl.glEnableClientState(egl.GL_COLOR_ARRAY)
+            gl.glVertexPointer(2, egl.GL_FLOAT, 0, 0)
+            gl.glColorPointer(4, egl.GL_UNSIGNED_BYTE, 0, offset)
+            for mode, lw, first, n in draws:
+                if mode == egl.GL_LINES:
+                    gl.glLineWidth(lw)
+                gl.glDrawArrays(mode, first, n)
+
+        # The frame is redrawn whole, it only changed when it differs
+        # from the last one read back
+        self._pixels, self._last_pixels = self._last_pixels, self._pixels
+        if len(self._pixels) != width * height * 4:
+            self._pixels = bytearray(width * height * 4)
+        gl.read(self._pixels)
+        if self._pixels != self._last_pixels:
+            self.changed = True
+        if self.surface is not None:
+            frame = self.image.frombuffer(self._pixels, (width, height),
+                                          'RGBX')
+            self.surface.blit(frame, (0, 0))
+            self.dirty.append(self.surface.get_rect())
+        self.start_drawing()
@@ -0,0 +1,202 @@
+"""
+This file is part of the 'Elements' Project
+Elements is a 2D Physics API for Python (supporting Box2D2)
+
+Copyright (C) 2008, The Elements Team, <elements@linuxuser.at>
+
+Home:  http://elements.linuxuser.at
+IRC:   #elements on irc.freenode.org
+
+Code:  http://www.assembla.com/wiki/show/elements
+       svn co http://svn2.assembla.com/svn/elements
+
+License:  GPLv3 | See LICENSE for the full text
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import ctypes
+from ctypes import c_char_p, c_double, c_float, c_int, c_uint, c_void_p
+from ctypes import POINTER
+
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+EGL_OPENGL_API = 0x30A2
+
+GL_LINES = 0x0001
+GL_TRIANGLES = 0x0004
+GL_UNSIGNED_BYTE = 0x1401
+GL_FLOAT = 0x1406
+GL_MODELVIEW = 0x1700
+GL_PROJECTION = 0x1701
+GL_RGBA = 0x1908
+GL_PACK_ALIGNMENT = 0x0D05
+GL_COLOR_BUFFER_BIT = 0x4000
+GL_VERTEX_ARRAY = 0x8074
+GL_COLOR_ARRAY = 0x8076
+GL_RGBA8 = 0x8058
+GL_ARRAY_BUFFER = 0x8892
+GL_STREAM_DRAW = 0x88E0
+GL_FRAMEBUFFER_COMPLETE = 0x8CD5
+GL_COLOR_ATTACHMENT0 = 0x8CE0
+GL_FRAMEBUFFER = 0x8D40
+GL_RENDERBUFFER = 0x8D41
+
+_UINT_P = POINTER(c_uint)
+
+# The GL functions used, with their result and argument types
+GL_FUNCTIONS = {
+    'glViewport': (None, c_int, c_int, c_int, c_int),
+    'glClearColor': (None, c_float, c_float, c_float, c_float),
+    'glClear': (None, c_uint),
+    'glMatrixMode': (None, c_uint),
+    'glLoadIdentity': (None, ),
+    'glOrtho': (None, c_double, c_double, c_double, c_double, c_double,
+                c_double),
+    'glEnableClientState': (None, c_uint),
+    'glVertexPointer': (None, c_int, c_uint, c_int, c_void_p),
+    'glColorPointer': (None, c_int, c_uint, c_int, c_void_p),
+    'glDrawArrays': (None, c_uint, c_int, c_int),
+    'glLineWidth': (None, c_float),
+    'glPixelStorei': (None, c_uint, c_int),
+    'glReadPixels': (None, c_int, c_int, c_int, c_int, c_uint, c_uint,
+                     c_void_p),
+    'glGenBuffers': (None, c_int, _UINT_P),
+    'glBindBuffer': (None, c_uint, c_uint),
+    'glBufferData': (None, c_uint, ctypes.c_ssize_t, c_void_p, c_uint),
+    'glGenFramebuffers': (None, c_int, _UINT_P),
+    'glBindFramebuffer': (None, c_uint, c_uint),
+    'glCheckFramebufferStatus': (c_uint, c_uint),
+    'glGenRenderbuffers': (None, c_int, _UINT_P),
+    'glDeleteRenderbuffers': (None, c_int, _UINT_P),
+    'glBindRenderbuffer': (None, c_uint, c_uint),
+    'glRenderbufferStorage': (None, c_uint, c_uint, c_int, c_int),
+    'glFramebufferRenderbuffer': (None, c_uint, c_uint, c_uint, c_uint),
+}
+
+
+class OffscreenGL:
+
+    """ A headless OpenGL context, drawing into a framebuffer object
+        whose pixels are read back.
+
+        EGL and GL are called through ctypes, on the surfaceless platform
+        of Mesa, so neither a display nor a GL binding for Python is
+        needed; the software rasterizer (llvmpipe) will do. The GL
+        functions are attributes of gl.
+
+        Raises OSError when libEGL or libGL are missing, and
+        RuntimeError when no context can be made.
+    """
+
+    def __init__(self):
+        self._egl = egl = ctypes.CDLL('libEGL.so.1')
+        self._libgl = ctypes.CDLL('libGL.so.1')
+
+        egl.eglGetProcAddress.restype = c_void_p
+        egl.eglGetProcAddress.argtypes = [c_char_p]
+        egl.eglGetDisplay.restype = c_void_p
+        egl.eglGetDisplay.argtypes = [c_void_p]
+        egl.eglInitialize.argtypes = [c_void_p, c_void_p, c_void_p]
+        egl.eglBindAPI.argtypes = [c_uint]
+        egl.eglCreateContext.restype = c_void_p
+        egl.eglCreateContext.argtypes = [c_void_p, c_void_p, c_void_p,
+                                         c_void_p]
+        egl.eglMakeCurrent.argtypes = [c_void_p, c_void_p, c_void_p,
+                                       c_void_p]
+        egl.eglDestroyContext.argtypes = [c_void_p, c_void_p]
+
+        get_platform_display = self._proc(
+            'eglGetPlatformDisplayEXT', c_void_p, c_int, c_void_p, c_void_p)
+        self.display = None
+        if get_platform_display is not None:
+            self.display = get_platform_display(
+                EGL_PLATFORM_SURFACELESS_MESA, None, None)
+        if not self.display:
+            self.display = egl.eglGetDisplay(None)
+        if not self.display or \
+                not egl.eglInitialize(self.display, None, None):
+            raise RuntimeError('EGL cannot be initialized')
+        if not egl.eglBindAPI(EGL_OPENGL_API):
+            raise RuntimeError('EGL has no OpenGL')
+
+        # Without a config nor a surface, as the framebuffer object is
+        # the only thing drawn to
+        self.context = egl.eglCreateContext(self.display, None, None, None)
+        if not self.context:
+            raise RuntimeError('No OpenGL context')
+        self.make_current()
+
+        for name, types in GL_FUNCTIONS.items():
+            function = self._gl_function(name, *types)
+            if function is None:
+                raise RuntimeError('OpenGL has no %s' % name)
+            setattr(self, name, function)
+
+        self.size = (0, 0)
+        self._framebuffer = c_uint(0)
+        self._renderbuffer = c_uint(0)
+        self.glGenFramebuffers(1, self._framebuffer)
+        self.glBindFramebuffer(GL_FRAMEBUFFER, self._framebuffer)
+
+    def _proc(self, name, restype, *argtypes):
+        address = self._egl.eglGetProcAddress(name.encode('ascii'))
+        if not address:
+            return None
+        return ctypes.CFUNCTYPE(restype, *argtypes)(address)
+
+    def _gl_function(self, name, restype, *argtypes):
+        # OpenGL 1.1 is exported by libGL, the rest comes from EGL
+        try:
+            function = getattr(self._libgl, name)
+        except AttributeError:
+            return self._proc(name, restype, *argtypes)
+        function.restype = restype
+        function.argtypes = argtypes
+        return function
+
+    def make_current(self):
+        self._egl.eglMakeCurrent(self.display, None, None, self.context)
+
+    def resize(self, size):
+        """ Make the framebuffer size (width, height) pixels
+        """
+        if size == self.size:
+            return
+        width, height = self.size = size
+        if self._renderbuffer.value:
+            self.glDeleteRenderbuffers(1, self._renderbuffer)
+        self.glGenRenderbuffers(1, self._renderbuffer)
+        self.glBindRenderbuffer(GL_RENDERBUFFER, self._renderbuffer)
+        self.glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        self.glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                                       GL_RENDERBUFFER, self._renderbuffer)
+        if self.glCheckFramebufferStatus(GL_FRAMEBUFFER) != \
+                GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError('Incomplete framebuffer of %dx%d' % size)
+        self.glViewport(0, 0, width, height)
+
+    def read(self, buffer):
+        """ Read the framebuffer into buffer, a writable bytes-like object
+            of width * height * 4 bytes, as RGBA rows from the bottom
+        """
+        width, height = self.size
+        self.glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        address = ctypes.addressof(
+            (ctypes.c_ubyte * len(buffer)).from_buffer(buffer))
+        self.glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE,
+                          address)
+
+    def close(self):
+        if self.context:
+            self._egl.eglMakeCurrent(self.display, None, None, None)
+            self._egl.eglDestroyContext(self.display, self.context)
+            self.context = None
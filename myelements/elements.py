@@ -42,6 +42,8 @@ except:
 # Standard Imports
 from random import shuffle
 
+import numpy
+
 # Load Elements Definitions
 from .locals import *
 
@@ -51,6 +53,11 @@ from . import drawing
 from . import add_objects
 from . import callbacks
 from . import camera
+from . import geometry
+from . import snapshot
+from . import worldfile
+from . import picking
+from . import pins
 
 # Main Class
 
@@ -81,6 +88,12 @@ class Elements:
 
     mouseJoint = None
 
+    # Level of detail: bodies smaller than lod_min_pixels on screen are
+    # not drawn, and below a camera scale of lod_scale strokes and chains
+    # are drawn as polylines, and circles without their orientation
+    lod_min_pixels = 1.0
+    lod_scale = 0.5
+
     def __init__(self, screen_size, gravity=(0.0, -9.0), ppm=100.0,
                  renderer='pygame'):
         """ Init the world with boundaries and gravity, and init colors.
@@ -90,7 +103,7 @@ class Elements:
               gravity ...... (x, y) in m/s^2  [float] default: (0.0, -9.0)
               ppm .......... pixels per meter [float] default: 100.0
               renderer ..... which drawing method to use (str) default:
-                             'pygame'
+                             'pygame', None for headless use
 
             Return: class Elements()
         """
@@ -101,6 +114,19 @@ class Elements:
         self.add = add_objects.Add(self)
         self.callbacks = callbacks.CallbackHandler(self)
         self.camera = camera.Camera(self)
+        self.snapshot = snapshot.BodySnapshot()
+        self.geometry = geometry.GeometryCache()
+        self.picker = picking.Picker(self)
+        self.pins = pins.PinIndex()
+        self.joints_version = 0  # changes with each joint created or not
+        self._wake = True
+        self._settled = False
+        self._settled_view = None
+        self._layer_key = None
+        self._joints = None
+        self._joints_key = None
+        self._chains = None
+        self._chains_key = None
 
         # Gravity + Bodies will sleep on outside
         self.gravity = gravity
@@ -108,9 +134,8 @@ class Elements:
         self.PIN_MOTOR_RADIUS = 2
 
         # Create the World
-        self.world = box2d.b2World(self.gravity, self.doSleep)
-        bodyDef = box2d.b2BodyDef()
-        self.world.groundBody = self.world.CreateBody(bodyDef)
+        self.destruction_listener = callbacks.kDestructionListener(self)
+        self.create_world()
 
         # Init Colors
         self.init_colors()
@@ -118,6 +143,15 @@ class Elements:
         # Set Pixels per Meter
         self.ppm = ppm
 
+    def create_world(self):
+        """ Replace the Box2D world by a new and empty one, with a ground
+            body
+        """
+        self.world = box2d.b2World(self.gravity, self.doSleep)
+        self.world.destructionListener = self.destruction_listener
+        bodyDef = box2d.b2BodyDef()
+        self.world.groundBody = self.world.CreateBody(bodyDef)
+
     def set_inputUnit(self, input_unit):
         """ Change the input unit to either meter or pixels
 
@@ -144,15 +178,20 @@ class Elements:
         """ Set a drawing method (from drawing.py)
 
             Parameters:
-              m .... 'pygame' or 'cairo'
+              m .... 'pygame', 'opengl' or 'cairo', or None to run without
+                     drawing
               *kw .. keywords to pass to the initializer of the drawing method
 
-            Return: True if ok, False if no method identifier m found
+            Return: True if ok, False if no method identifier m found, or
+              if it cannot be used here (eg. no OpenGL for 'opengl')
         """
+        if m is None:
+            self.renderer = None
+            return True
         try:
             self.renderer = getattr(drawing, "draw_%s" % m)(*kw)
             return True
-        except AttributeError:
+        except (AttributeError, ImportError, OSError, RuntimeError):
             return False
 
     def set_screenSize(self, size):
@@ -246,12 +285,97 @@ class Elements:
             Return: -
         """
         if self.run_physics:
+            if self._settled and not self._wake and self.is_settled():
+                # Stepping would not change anything, and was found so
+                # when drawing last
+                return
+            self._wake = False
             if real_dt is not None:
                 dt = min(real_dt, 1.0 / fps)
             else:
                 dt = 1.0 / fps
             self.world.Step(dt, vel_iterations, pos_iterations)
 
+    def wake(self):
+        """ Step and draw the next frame even if the world is settled,
+            eg. after input which may change it
+        """
+        self._wake = True
+        self._settled = False
+        self._settled_view = None
+
+    def is_settled(self):
+        """ Return True when stepping would not change the world: every
+            body is asleep, no motor turns and nothing is grabbed
+        """
+        if self.mouseJoint or self.pins.motors():
+            return False
+        for body in self.world.bodies:
+            if body.awake and body.type != box2d.b2_staticBody:
+                return False
+        return True
+
+    def capture_state(self):
+        """ Read the state of all bodies into self.snapshot in one pass
+
+            Return: self.snapshot
+        """
+        self.snapshot.capture(self.world)
+        return self.snapshot
+
+    def fixture_destroyed(self, fixture):
+        """ Called by Box2D for each fixture of a body being destroyed
+        """
+        body = fixture.body
+        self.geometry.invalidate(body)
+        self.snapshot.forget(body)
+
+    def joint_destroyed(self, joint):
+        """ Called by Box2D for each joint of a body being destroyed
+        """
+        self.pins.remove(joint)
+        self.joints_version += 1
+
+    def create_joint(self, jointDef):
+        """ Create a joint, keeping pins and motors in the pin index
+
+            Return: the new joint
+        """
+        joint = self.world.CreateJoint(jointDef)
+        self.pins.add(joint)
+        self.joints_version += 1
+        return joint
+
+    def destroy_joint(self, joint):
+        """ Destroy a joint created with create_joint """
+        self.pins.remove(joint)
+        self.joints_version += 1
+        self.world.DestroyJoint(joint)
+
+    def get_pins_at_pos(self, search_point, radius):
+        """ Return the revolute joints (pins and motors) whose anchor
+            is within a square of radius pixels around search_point
+            (screen coordinates)
+        """
+        sx, sy = self.to_world(search_point)
+        sx /= self.ppm
+        sy /= self.ppm
+        r = radius / self.meter_to_screen(1.0)
+
+        x, y = search_point
+        found = []
+        for joint in self.pins.query(sx, sy, r):
+            ax, ay = joint.anchorA
+            ax, ay = self.to_screen((ax * self.ppm, ay * self.ppm))
+            if abs(ax - x) <= radius and abs(ay - y) <= radius:
+                found.append(joint)
+        return found
+
+    def invalidate_geometry(self, body):
+        """ Call after adding fixtures to a body which has been drawn
+        """
+        self.geometry.invalidate(body)
+
     def translate_coord(self, point):
         """ Flips the coordinates in another coordinate system orientation,
             if necessary (screen <> world coordinate system)
@@ -292,6 +416,22 @@ class Elements:
         x, y = self.translate_coord((round(x), round(y)))
         return(x + dx, y + dy)
 
+    def to_world_array(self, points):
+        """ Like to_world, for an (n, 2) array of screen coordinates
+
+            Return: (n, 2) array of world pixel coordinates
+        """
+        out = numpy.round(points / self.camera.scale_factor)
+
+        if self.inputAxis_x_left:
+            out[:, 0] = self.display_width - out[:, 0]
+
+        if self.inputAxis_y_down:
+            out[:, 1] = self.display_height - out[:, 1]
+
+        out += self.screen_offset_pixel
+        return out
+
     def to_screen(self, pos):
         """Transfers a coordinate from the world to the screen coordinate
             system (pixels) and by the screen offset
@@ -303,40 +443,60 @@ class Elements:
         sx, sy = self.translate_coord((x, y))
         return (sx * self.camera.scale_factor, sy * self.camera.scale_factor)
 
-    def meter_to_screen(self, i):
-        return i * self.ppm * self.camera.scale_factor
+    def to_screen_array(self, points):
+        """ Like to_screen, for an (n, 2) array of world pixel coordinates
 
-    def get_bodies_at_pos(self, search_point, include_static=False, area=0.01):
-        """ Check if given point (screen coordinates) is inside any body.
-            If yes, return all found bodies, if not found return False
+            Return: (n, 2) array of screen coordinates
         """
-        sx, sy = self.to_world(search_point)
-        sx /= self.ppm
-        sy /= self.ppm
+        dx, dy = self.screen_offset_pixel
+        out = points - (dx, dy)
 
-        f = area / self.camera.scale_factor
+        if self.inputAxis_x_left:
+            out[:, 0] = self.display_width - out[:, 0]
 
-        AABB = box2d.b2AABB()
-        AABB.lowerBound = (sx - f, sy - f)
-        AABB.upperBound = (sx + f, sy + f)
+        if self.inputAxis_y_down:
+            out[:, 1] = self.display_height - out[:, 1]
 
-        query_cb = Query_CB()
+        out *= self.camera.scale_factor
+        return out
 
-        self.world.QueryAABB(query_cb, AABB)
+    def meter_to_screen(self, i):
+        return i * self.ppm * self.camera.scale_factor
 
-        bodylist = []
-        for s in query_cb.fixtures:
-            body = s.body
-            if body is None:
-                continue
-            if not include_static:
-                if body.type == box2d.b2_staticBody or body.mass == 0.0:
-                    continue
+    def get_bodies_at_pos(self, search_point, include_static=False, area=0.01):
+        """ Check if given point (screen coordinates) is inside any body.
+            If yes, return all found bodies, top first, if not found
+            return an empty list
+        """
+        return self.picker.bodies(
+            self.picker.fixtures_at(search_point, include_static, area))
+
+    def get_bodies_at_points(self, points, include_static=False,
+                             area=0.01):
+        """ Like get_bodies_at_pos, for several points (screen
+            coordinates) in one call
 
-            if s.TestPoint((sx, sy)):
-                bodylist.append(body)
+            Return: a list of bodies, top first, for each point
+        """
+        return [self.picker.bodies(fixtures) for fixtures in
+                self.picker.fixtures_at_points(points, include_static,
+                                               area)]
+
+    def get_bodies_in_radius(self, search_point, radius,
+                             include_static=False):
+        """ Return the bodies touching a circle of radius pixels around
+            search_point (screen coordinates), top first
+        """
+        return self.picker.bodies(
+            self.picker.fixtures_in_radius(search_point, radius,
+                                           include_static))
 
-        return bodylist
+    def get_bodies_along(self, points, radius=0, include_static=False):
+        """ Return the bodies touched by a stroke through points (screen
+            coordinates) of radius pixels, top first
+        """
+        return self.picker.bodies(
+            self.picker.fixtures_along(points, radius, include_static))
 
     def draw(self):
         """ If a drawing method is specified, this function passes the objects
@@ -360,64 +520,319 @@ class Elements:
                                                p1.y * self.ppm)),
                                stopTrack=False)
 
+        retained = getattr(self.renderer, 'retained', False)
+        view = (self.world.bodyCount, self.world.jointCount,
+                self.joints_version, self.run_physics,
+                self.screen_offset_pixel, self.camera.scale_factor,
+                self.display_width, self.display_height)
+        if retained and view == self._settled_view and \
+                not self.renderer.layer_changed(self._layer_key) and \
+                (not self.run_physics or self.is_settled()):
+            # Everything is in the cached layer already, only erase what
+            # was drawn over it
+            self.renderer.restore()
+            self.callbacks.start(CALLBACK_DRAWING_END)
+            return True
+        self._settled_view = None
+
         # Walk through all known elements
         self.renderer.start_drawing()
 
-        for body in self.world.bodies:
-            xform = body.transform
-            shape = body.fixtures
-            angle = body.angle
-
-            if shape:
-                userdata = body.userData
-                if 'color' in userdata:
-                    clr = userdata['color']
-                else:
-                    clr = self.colors[0]
-
-            for shape in body.fixtures:
-                type_ = shape.type
-
-                if type_ == box2d.b2Shape.e_circle:
-                    position = box2d.b2Mul(xform, shape.shape.pos)
+        snapshot = self.capture_state()
+        state = snapshot.state
+        circles, vertices = self.geometry.transform(snapshot)
+        radii = self.geometry.circle_radius * self.meter_to_screen(1.0)
+        shapes = (self.to_screen_array(circles * self.ppm).tolist(),
+                  self.to_screen_array(vertices * self.ppm).tolist(),
+                  radii.tolist(),
+                  state['angle'].tolist())
 
-                    pos = self.to_screen((position.x * self.ppm,
-                                          position.y * self.ppm))
-
-                    self.renderer.draw_circle(
-                        clr, pos, self.meter_to_screen(shape.shape.radius),
-                        angle)
+        if self.run_physics:
+            settled = (state['type'] == box2d.b2_staticBody) | \
+                ~state['awake']
+            self._settled = bool(settled.all()) and self.is_settled()
+        else:
+            settled = numpy.ones(len(state), bool)
+        still = self._settled or not self.run_physics
+
+        lod = self._level_of_detail(snapshot)
+        for rows, points, width, closed in lod[2]:
+            # A chain is drawn at once, with its moving links
+            if not settled[rows].all():
+                settled[rows] = False
+        joints = self._place_joints(snapshot, lod[3])
+
+        if retained:
+            # Static and sleeping bodies, or all when paused, are drawn
+            # into a cached layer which is only redrawn when they change.
+            # Once the whole scene is settled the joints go there too.
+            key = (state[settled].tobytes(), still, view)
+            if self.renderer.layer_changed(key):
+                self.renderer.begin_layer(key)
+                self._draw_bodies(shapes, lod, settled)
+                if still:
+                    self._draw_joints(joints)
+                self.renderer.end_layer()
+            else:
+                self.renderer.restore()
+            self._draw_bodies(shapes, lod, ~settled)
+            if still:
+                self._settled_view = view
+                self._layer_key = key
+            else:
+                self._draw_joints(joints)
+        else:
+            self._draw_bodies(shapes, lod)
+            self._draw_joints(joints)
 
-                elif type_ == box2d.b2Shape.e_polygon:
-                    points = []
-                    for v in shape.shape.vertices:
-                        pt = box2d.b2Mul(xform, v)
-                        x, y = self.to_screen((pt.x * self.ppm,
-                                               pt.y * self.ppm))
-                        points.append([x, y])
+        self.callbacks.start(CALLBACK_DRAWING_END)
+        self.renderer.after_drawing()
 
-                    self.renderer.draw_polygon(clr, points)
+        return True
 
-                else:
-                    print("unknown shape type:%d" % shape.type)
+    def get_view(self):
+        """ Return the part of the world shown on the screen
 
+            Return: (left, bottom, right, top) in meters
+        """
+        corners = self.to_world_array(numpy.array(
+            ((0.0, 0.0), (self.display_width, self.display_height)),
+            float)) / self.ppm
+        left, bottom = corners.min(0).tolist()
+        right, top = corners.max(0).tolist()
+        return left, bottom, right, top
+
+    def _in_view(self, snapshot):
+        # Mask of the rows whose fixtures are on the screen, by the box
+        # around them
+        bounds = self.geometry.world_bounds(snapshot)
+        margin = VIEW_MARGIN / self.meter_to_screen(1.0)
+        left, bottom, right, top = self.get_view()
+        x, y, hx, hy = bounds.T
+        return (x + hx >= left - margin) & (x - hx <= right + margin) & \
+            (y + hy >= bottom - margin) & (y - hy <= top + margin)
+
+    def _level_of_detail(self, snapshot):
+        """ Decide how each body is drawn at the current camera scale
+
+            Bodies off the screen or smaller than lod_min_pixels are left
+            out. Below lod_scale, the bodies which are lines of rects
+            (strokes) are drawn as their centre line, and chains of balls
+            as one polyline each.
+
+            Return: (mask of the rows drawn fixture by fixture,
+                     list of (row, points, width) of the strokes,
+                     list of (rows, points, width, closed) of the chains,
+                     mask of the joints drawn on their own, or None for
+                     all)
+        """
+        geometry = self.geometry
+        scale = self.meter_to_screen(1.0)
+        visible = self._in_view(snapshot)
+        shaped = visible & (geometry.extent * scale >= self.lod_min_pixels)
+        strokes = []
+        chains = []
+        joints = None
+
+        coarse = self.camera.scale_factor < self.lod_scale
+        self.renderer.orientation = not coarse
+        if not coarse:
+            return shaped, strokes, chains, joints
+
+        if geometry.strokes:
+            points = self.to_screen_array(
+                geometry.transform_strokes(snapshot) * self.ppm).tolist()
+            for row, start, end, width in geometry.strokes:
+                if shaped[row]:
+                    shaped[row] = False
+                    strokes.append((row, points[start:end],
+                                    max(1, int(width * scale))))
+
+        found, joints = self._find_chains(snapshot)
+        if found:
+            state = snapshot.state
+            centers = self.to_screen_array(numpy.column_stack(
+                (state['x'], state['y'])).astype(float) * self.ppm)
+            for rows, closed in found:
+                shaped[rows] = False
+                if not visible[rows].any():
+                    continue
+                width = 2 * geometry.ball_radius[rows].max() * scale
+                chains.append((rows, centers[rows].tolist(),
+                               max(1, int(width)), closed))
+        return shaped, strokes, chains, joints
+
+    def _joint_layout(self, snapshot):
+        # The joints, but the mouse joint, with the rows of their bodies
+        # and their anchors in body space, kept until joints or bodies
+        # change
+        key = (self.joints_version, self.world.jointCount,
+               self.geometry.version)
+        if key == self._joints_key:
+            return self._joints
+
+        joints = []
+        rows = []
+        local = []
         for joint in self.world.joints:
-            p2 = joint.anchorA
-            p2 = self.to_screen((p2.x * self.ppm, p2.y * self.ppm))
-
-            p1 = joint.anchorB
-            p1 = self.to_screen((p1.x * self.ppm, p1.y * self.ppm))
+            if isinstance(joint, box2d.b2MouseJoint):
+                continue
+            bodyA = joint.bodyA
+            bodyB = joint.bodyB
+            a = snapshot.row(bodyA)
+            b = snapshot.row(bodyB)
+            if a is None or b is None:
+                continue
+            joints.append(joint)
+            rows.append((a, b))
+            local.append((tuple(bodyA.GetLocalPoint(joint.anchorA)),
+                          tuple(bodyB.GetLocalPoint(joint.anchorB))))
+
+        pins = [isinstance(joint, box2d.b2RevoluteJoint) for joint in joints]
+        self._joints = (joints, numpy.array(rows, numpy.intp).reshape(-1, 2),
+                        numpy.array(local, float).reshape(-1, 2, 2),
+                        numpy.array(pins, bool))
+        self._joints_key = key
+        return self._joints
+
+    def _find_chains(self, snapshot):
+        # Chains of balls joined one to the next, as a list of (rows,
+        # closed), with the mask of the joints of _joint_layout() which
+        # are not part of a chain, kept until joints or bodies change
+        joints, rows, local, pins = self._joint_layout(snapshot)
+        if self._chains_key == self._joints_key:
+            return self._chains
+
+        link = (self.geometry.ball_radius > 0) & snapshot.dynamic()
+        neighbours = {}
+        pairs = {}
+        for i, (a, b) in enumerate(rows.tolist()):
+            if a == b or not (link[a] and link[b]):
+                continue
+            neighbours.setdefault(a, set()).add(b)
+            neighbours.setdefault(b, set()).add(a)
+            pairs.setdefault((a, b), []).append(i)
+            pairs.setdefault((b, a), []).append(i)
+
+        # Balls joined to more than two others are forks, not links
+        for row in [row for row, rows in neighbours.items()
+                    if len(rows) > 2]:
+            for other in neighbours.pop(row):
+                if other in neighbours:
+                    neighbours[other].discard(row)
+
+        chains = []
+        drawn = numpy.ones(len(joints), bool)
+        seen = set()
+        # Open chains from one of their ends, then the closed ones
+        starts = [row for row, rows in neighbours.items() if len(rows) == 1]
+        for start in starts + list(neighbours):
+            if start in seen:
+                continue
+            path = [start]
+            seen.add(start)
+            while True:
+                following = [row for row in neighbours[path[-1]]
+                             if row not in seen]
+                if not following:
+                    break
+                path.append(following[0])
+                seen.add(following[0])
+            if len(path) < CHAIN_MIN_LINKS:
+                continue
+            closed = path[0] in neighbours[path[-1]] and len(path) > 2
+            for a, b in zip(path, path[1:] + path[:1] if closed else
+                            path[1:]):
+                drawn[pairs[(a, b)]] = False
+            chains.append((numpy.array(path, numpy.intp), closed))
+
+        self._chains = chains, drawn
+        self._chains_key = self._joints_key
+        return self._chains
+
+    def _place_joints(self, snapshot, drawn=None):
+        # The joints on the screen, as a list of (pin, anchor B, anchor A)
+        # in screen coordinates, only those whose entry in drawn is True
+        # if drawn is given
+        joints, rows, local, pins = self._joint_layout(snapshot)
+        anchors = self.geometry.place(snapshot, local.reshape(-1, 2),
+                                      rows.ravel())
+        anchors = self.to_screen_array(anchors * self.ppm).reshape(-1, 2, 2)
+
+        x = anchors[:, :, 0]
+        y = anchors[:, :, 1]
+        margin = VIEW_MARGIN + self.PIN_MOTOR_RADIUS
+        shown = (x.max(1) >= -margin) & \
+            (x.min(1) <= self.display_width + margin) & \
+            (y.max(1) >= -margin) & \
+            (y.min(1) <= self.display_height + margin)
+        if drawn is not None:
+            shown &= drawn
+
+        anchors = anchors.tolist()
+        pins = pins.tolist()
+        placed = [(pins[i], anchors[i][1], anchors[i][0])
+                  for i in numpy.flatnonzero(shown).tolist()]
 
-            if isinstance(joint, box2d.b2RevoluteJoint):
+        if self.mouseJoint:
+            p2 = self.mouseJoint.anchorA
+            p1 = self.mouseJoint.anchorB
+            placed.append((False,
+                           self.to_screen((p1.x * self.ppm, p1.y * self.ppm)),
+                           self.to_screen((p2.x * self.ppm, p2.y * self.ppm))))
+        return placed
+
+    def _draw_bodies(self, shapes, lod, rows=None):
+        # Draw the bodies at the level of detail lod, only those whose
+        # entry in rows is True if rows is given
+        shaped, strokes, chains, joints = lod
+        if rows is not None:
+            shaped = shaped & rows
+        self._draw_shapes(shapes, shaped)
+
+        userdata = self.geometry.userdata
+        default_clr = self.colors[0]
+        for row, points, width in strokes:
+            if rows is None or rows[row]:
+                self.renderer.draw_lines(
+                    userdata[row].get('color', default_clr), False, points,
+                    width)
+        for chain, points, width, closed in chains:
+            if rows is None or rows[chain[0]]:
+                self.renderer.draw_lines(
+                    userdata[chain[0]].get('color', default_clr), closed,
+                    points, width)
+
+    def _draw_joints(self, joints):
+        # Draw the joints placed by _place_joints()
+        for pin, p1, p2 in joints:
+            if pin:
                 self.renderer.draw_circle((255, 255, 255), p1,
                                           self.PIN_MOTOR_RADIUS, 0)
             else:
                 self.renderer.draw_lines((0, 0, 0), False, [p1, p2], 3)
 
-        self.callbacks.start(CALLBACK_DRAWING_END)
-        self.renderer.after_drawing()
-
-        return True
+    def _draw_shapes(self, shapes, rows=None):
+        # Draw the fixtures placed by geometry.transform(), only for the
+        # bodies whose entry in the mask rows is True if rows is given
+        circles, vertices, radii, angles = shapes
+        userdata = self.geometry.userdata
+        default_clr = self.colors[0]
+
+        drawn = self.geometry.shapes
+        if rows is not None:
+            drawn = [drawn[i] for i in numpy.flatnonzero(
+                rows[self.geometry.shape_rows]).tolist()]
+        for shape in drawn:
+            row = shape[1]
+            clr = userdata[row].get('color', default_clr)
+
+            if shape[0] == geometry.SHAPE_CIRCLE:
+                i = shape[2]
+                self.renderer.draw_circle(clr, circles[i], radii[i],
+                                          angles[row])
+            else:
+                self.renderer.draw_polygon(clr, vertices[shape[2]:shape[3]])
 
     def set_pin_motor_radius(self, radius):
         self.PIN_MOTOR_RADIUS = radius
@@ -492,25 +907,56 @@ class Elements:
         for body in self.world.bodies:
             del body.userData['saveid']  # remove temporary data
 
+    def binary_save(self, path, additional_vars={}, serialize=False):
+        """ Save the world like json_save, in the binary format of
+            worldfile, which is smaller and faster to read and write
+        """
+        worldmodel = self.get_world_model(additional_vars, serialize)
+        self.world.groundBody.userData = {"saveid": 0}
+
+        worldfile.write(path, worldmodel)
+
+        for body in self.world.bodies:
+            del body.userData['saveid']  # remove temporary data
+
+    def binary_dumps(self, additional_vars={}, serialize=False):
+        """ Like binary_save, returning the bytes instead of writing them
+        """
+        worldmodel = self.get_world_model(additional_vars, serialize)
+        self.world.groundBody.userData = {"saveid": 0}
+
+        data = worldfile.dumps(worldmodel)
+
+        for body in self.world.bodies:
+            del body.userData['saveid']  # remove temporary data
+        return data
+
     def get_world_model(self, additional_vars={}, serialize=False):
         worldmodel = {}
         save_id_index = 1
         self.world.groundBody.userData = {"saveid": 0}
 
+        state = self.capture_state().state
+        rows = zip(self.snapshot.bodies,
+                   state['x'].tolist(), state['y'].tolist(),
+                   state['angle'].tolist(),
+                   state['vx'].tolist(), state['vy'].tolist(),
+                   state['type'].tolist())
+
         bodylist = []
-        for body in self.world.bodies:
+        for body, x, y, angle, vx, vy, type_ in rows:
             if body == self.world.groundBody:
                 continue
             body.userData["saveid"] = save_id_index  # set temporary data
             save_id_index += 1
             shapelist = body.fixtures
             modelbody = {}
-            modelbody['position'] = body.position.tuple
-            modelbody['dynamic'] = body.type == box2d.b2_dynamicBody
+            modelbody['position'] = (x, y)
+            modelbody['dynamic'] = type_ == box2d.b2_dynamicBody
             modelbody['userData'] = body.userData
-            modelbody['angle'] = body.angle
+            modelbody['angle'] = angle
             modelbody['angularVelocity'] = body.angularVelocity
-            modelbody['linearVelocity'] = body.linearVelocity.tuple
+            modelbody['linearVelocity'] = (vx, vy)
             if shapelist and len(shapelist) > 0:
                 shapes = []
                 for shape in shapelist:
@@ -585,36 +1031,75 @@ class Elements:
     def json_load(self, path, serialized=False):
         import json
 
-        self.world.groundBody.userData = {"saveid": 0}
-
         f = open(path, 'r')
         worldmodel = json.loads(f.read())
         f.close()
+        self.load_world_model(worldmodel, serialized)
+
+    def binary_load(self, path, serialized=False):
+        """ Load a world saved by binary_save """
+        self.load_world_model(worldfile.read(path), serialized)
+
+    def binary_loads(self, data, serialized=False):
+        """ Load a world from bytes returned by binary_dumps """
+        self.load_world_model(worldfile.loads(data), serialized)
+
+    def load(self, path, serialized=False):
+        """ Load a world saved by json_save or binary_save
+
+            Parameters:
+              path ........ file name, the format is detected
+              serialized .. True if saved with serialize=True
+
+            Return: -
+        """
+        if worldfile.is_binary(path):
+            self.binary_load(path, serialized)
+        else:
+            self.json_load(path, serialized)
+
+    def load_world_model(self, worldmodel, serialized=False):
+        """ Replace the world with a model from get_world_model """
+        self.world.groundBody.userData = {"saveid": 0}
+
         # clean world
         for joint in self.world.joints:
-            self.world.DestroyJoint(joint)
+            self.destroy_joint(joint)
         for body in self.world.bodies:
             if body != self.world.groundBody:
                 self.world.DestroyBody(body)
+        # The broad-phase of a used world would find the contacts in
+        # another order than a new one, and the same model would not
+        # step the same everywhere, as lockstep needs
+        self.create_world()
+        self.world.groundBody.userData = {"saveid": 0}
 
-        # load bodies
+        # load bodies, indexed by saveid for the joints and pens below.
+        # Box2D copies the definitions, so the same ones are reused.
+        saved = {0: self.world.groundBody}
+        bodyDef = box2d.b2BodyDef()
+        polyDef = box2d.b2FixtureDef()
+        polyShape = box2d.b2PolygonShape()
+        circleDef = box2d.b2FixtureDef()
+        circleShape = box2d.b2CircleShape()
         for body in worldmodel['bodylist']:
-            bodyDef = box2d.b2BodyDef()
             if body['dynamic']:
                 bodyDef.type = box2d.b2_dynamicBody
                 bodyDef.bullet = True
+            else:
+                bodyDef.type = box2d.b2_staticBody
+                bodyDef.bullet = False
             bodyDef.position = body['position']
             bodyDef.userData = body['userData']
             bodyDef.angle = body['angle']
             newBody = self.world.CreateBody(bodyDef)
+            saved[body['userData']['saveid']] = newBody
             # _logger.debug(newBody)
             newBody.angularVelocity = body['angularVelocity']
             newBody.linearVelocity = body['linearVelocity']
             if 'shapes' in body:
                 for shape in body['shapes']:
                     if shape['type'] == 'polygon':
-                        polyDef = box2d.b2FixtureDef()
-                        polyShape = box2d.b2PolygonShape()
                         polyShape.vertices = shape['vertices']
                         polyDef.shape = polyShape
                         polyDef.density = shape['density']
@@ -622,8 +1107,6 @@ class Elements:
                         polyDef.friction = shape['friction']
                         newBody.CreateFixture(polyDef)
                     if shape['type'] == 'circle':
-                        circleDef = box2d.b2FixtureDef()
-                        circleShape = box2d.b2CircleShape()
                         circleShape.radius = shape['radius']
                         circleShape.pos = shape['localPosition']
                         circleDef.shape = circleShape
@@ -633,27 +1116,27 @@ class Elements:
                         newBody.CreateFixture(circleDef)
 
         for joint in worldmodel['jointlist']:
-            if joint['type'] == 'distance':
+            if joint.get('type') == 'distance':
                 jointDef = box2d.b2DistanceJointDef()
-                body1 = self.getBodyWithSaveId(joint['body1'])
+                body1 = saved.get(joint['body1'])
                 anch1 = joint['anchor1']
-                body2 = self.getBodyWithSaveId(joint['body2'])
+                body2 = saved.get(joint['body2'])
                 anch2 = joint['anchor2']
                 jointDef.collideConnected = joint['collideConnected']
                 jointDef.Initialize(body1, body2, anch1, anch2)
                 jointDef.userData = joint['userData']
-                self.world.CreateJoint(jointDef)
-            if joint['type'] == 'revolute':
+                self.create_joint(jointDef)
+            if joint.get('type') == 'revolute':
                 jointDef = box2d.b2RevoluteJointDef()
-                body1 = self.getBodyWithSaveId(joint['body1'])
-                body2 = self.getBodyWithSaveId(joint['body2'])
+                body1 = saved.get(joint['body1'])
+                body2 = saved.get(joint['body2'])
                 anchor = joint['anchor']
                 jointDef.Initialize(body1, body2, anchor)
                 jointDef.userData = joint['userData']
                 jointDef.motorEnabled = joint['enableMotor']
                 jointDef.motorSpeed = joint['motorSpeed']
                 jointDef.maxMotorTorque = joint['maxMotorTorque']
-                self.world.CreateJoint(jointDef)
+                self.create_joint(jointDef)
 
         self.additional_vars = {}
         addvars = {}
@@ -664,10 +1147,8 @@ class Elements:
             trackinfo = addvars['trackinfo']
             for key, info in trackinfo.items():
                 if not info[3]:
-                    addvars['trackinfo'][key][0] = \
-                        self.getBodyWithSaveId(info[0])
-                    addvars['trackinfo'][key][1] = \
-                        self.getBodyWithSaveId(info[1])
+                    addvars['trackinfo'][key][0] = saved.get(info[0])
+                    addvars['trackinfo'][key][1] = saved.get(info[1])
                 else:
                     addvars['trackinfo'][key][0] = None
                     addvars['trackinfo'][key][1] = None
@@ -681,14 +1162,3 @@ class Elements:
         for body in self.world.bodies:
             if body.userData['saveid'] == saveid:
                 return body
-
-
-class Query_CB(box2d.b2QueryCallback):
-
-    def __init__(self):
-        box2d.b2QueryCallback.__init__(self)
-        self.fixtures = []
-
-    def ReportFixture(self, fixture):
-        self.fixtures.append(fixture)
-        return True
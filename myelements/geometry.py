@@ -0,0 +1,315 @@
+"""
+This file is part of the 'Elements' Project
+Elements is a 2D Physics API for Python (supporting Box2D2)
+
+Copyright (C) 2008, The Elements Team, <elements@linuxuser.at>
+
+Home:  http://elements.linuxuser.at
+IRC:   #elements on irc.freenode.org
+
+Code:  http://www.assembla.com/wiki/show/elements
+       svn co http://svn2.assembla.com/svn/elements
+
+License:  GPLv3 | See LICENSE for the full text
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import math
+
+import numpy
+import Box2D as box2d
+
+SHAPE_CIRCLE = 0
+SHAPE_POLYGON = 1
+
+
+class GeometryCache:
+
+    """ Local (body space) geometry of all fixtures, read from Box2D once.
+
+        Fixture shapes never change after creation, so their vertices are
+        cached per body.  The cache entry of a body is dropped when its
+        fixtures are destroyed (see Elements.fixture_destroyed) or by
+        calling invalidate(body) after adding fixtures to it.
+
+        For drawing, the cached shapes of all bodies are laid out in flat
+        arrays, rebuilt only when bodies come or go, so that one batched
+        rotation and translation places every vertex of the world.
+    """
+
+    def __init__(self):
+        self._bodies = {}
+        self._layout_ids = None
+
+        # Per shape, in drawing order: (SHAPE_CIRCLE, row, index) or
+        # (SHAPE_POLYGON, row, first vertex, last vertex + 1)
+        self.shapes = []
+        # The snapshot row of each shape
+        self.shape_rows = numpy.zeros(0, numpy.intp)
+        # The userData dict for each snapshot row
+        self.userdata = []
+
+        self._circle_local = numpy.zeros((0, 2))
+        self._circle_row = numpy.zeros(0, numpy.intp)
+        self.circle_radius = numpy.zeros(0)
+        self._poly_local = numpy.zeros((0, 2))
+        self._poly_row = numpy.zeros(0, numpy.intp)
+
+        # Per snapshot row, for the level of detail: the radius around
+        # the body origin which holds all its fixtures, and the radius of
+        # bodies made of a single circle (0 for the others)
+        self.extent = numpy.zeros(0)
+        self.ball_radius = numpy.zeros(0)
+        # Per snapshot row, the box around all fixtures of the body in
+        # body space, as (center x, center y, half width, half height)
+        self.bounds = numpy.zeros((0, 4))
+        # Per stroke, the centre line of bodies built as a line of rects
+        # joined by circles: (row, first point, last point + 1, width)
+        self.strokes = []
+        self._stroke_local = numpy.zeros((0, 2))
+        self._stroke_row = numpy.zeros(0, numpy.intp)
+        # Changes each time the layout is rebuilt
+        self.version = 0
+
+    def invalidate(self, body=None):
+        """ Forget the cached shapes of body, or of all bodies if None
+        """
+        if body is None:
+            self._bodies = {}
+        else:
+            self._bodies.pop(body, None)
+        self._layout_ids = None
+
+    def get_shapes(self, body):
+        """ Return the cached local shapes of body
+
+            Return: list of (SHAPE_CIRCLE, (x, y), radius) and
+                    (SHAPE_POLYGON, [(x, y), ...]) in meters
+        """
+        shapes = self._bodies.get(body)
+        if shapes is None:
+            shapes = []
+            for fixture in body.fixtures:
+                type_ = fixture.type
+                shape = fixture.shape
+                if type_ == box2d.b2Shape.e_circle:
+                    shapes.append((SHAPE_CIRCLE, tuple(shape.pos),
+                                   shape.radius))
+                elif type_ == box2d.b2Shape.e_polygon:
+                    shapes.append((SHAPE_POLYGON, list(shape.vertices)))
+                else:
+                    print("unknown shape type:%d" % type_)
+            # Bodies without fixtures are not cached, as nothing tells us
+            # when they are destroyed and their address reused
+            if shapes:
+                self._bodies[body] = shapes
+        return shapes
+
+    def _build_layout(self, snapshot):
+        self.shapes = shapes = []
+        self.userdata = []
+        circle_local = []
+        circle_row = []
+        circle_radius = []
+        poly_local = []
+        poly_row = []
+        extent = []
+        ball_radius = []
+        bounds = []
+        self.strokes = strokes = []
+        stroke_local = []
+        stroke_row = []
+
+        for row, body in enumerate(snapshot.bodies):
+            self.userdata.append(body.userData)
+            body_shapes = self.get_shapes(body)
+            reach = 0.0
+            corners = []
+            for shape in body_shapes:
+                if shape[0] == SHAPE_CIRCLE:
+                    shapes.append((SHAPE_CIRCLE, row, len(circle_local)))
+                    circle_local.append(shape[1])
+                    circle_row.append(row)
+                    circle_radius.append(shape[2])
+                    (x, y), radius = shape[1], shape[2]
+                    reach = max(reach, math.hypot(x, y) + radius)
+                    corners.extend(((x - radius, y - radius),
+                                    (x + radius, y + radius)))
+                else:
+                    vertices = shape[1]
+                    start = len(poly_local)
+                    poly_local.extend(vertices)
+                    poly_row.extend([row] * len(vertices))
+                    shapes.append((SHAPE_POLYGON, row, start,
+                                   len(poly_local)))
+                    reach = max([reach] + [math.hypot(*v) for v in vertices])
+                    corners.extend(vertices)
+            extent.append(reach)
+            if corners:
+                xs, ys = zip(*corners)
+                bounds.append(((max(xs) + min(xs)) / 2.0,
+                               (max(ys) + min(ys)) / 2.0,
+                               (max(xs) - min(xs)) / 2.0,
+                               (max(ys) - min(ys)) / 2.0))
+            else:
+                bounds.append((0.0, 0.0, 0.0, 0.0))
+
+            if len(body_shapes) == 1 and body_shapes[0][0] == SHAPE_CIRCLE:
+                ball_radius.append(body_shapes[0][2])
+            else:
+                ball_radius.append(0.0)
+
+            stroke = _stroke(body_shapes)
+            if stroke is not None:
+                points, width = stroke
+                strokes.append((row, len(stroke_local),
+                                len(stroke_local) + len(points), width))
+                stroke_local.extend(points)
+                stroke_row.extend([row] * len(points))
+
+        self._circle_local = numpy.array(circle_local,
+                                         dtype=float).reshape(-1, 2)
+        self._circle_row = numpy.array(circle_row, dtype=numpy.intp)
+        self.circle_radius = numpy.array(circle_radius, dtype=float)
+        self._poly_local = numpy.array(poly_local, dtype=float).reshape(-1, 2)
+        self._poly_row = numpy.array(poly_row, dtype=numpy.intp)
+        self.extent = numpy.array(extent, dtype=float)
+        self.ball_radius = numpy.array(ball_radius, dtype=float)
+        self.bounds = numpy.array(bounds, dtype=float).reshape(-1, 4)
+        self.shape_rows = numpy.array([shape[1] for shape in shapes],
+                                      dtype=numpy.intp)
+        self._stroke_local = numpy.array(stroke_local,
+                                         dtype=float).reshape(-1, 2)
+        self._stroke_row = numpy.array(stroke_row, dtype=numpy.intp)
+        self._layout_ids = snapshot.state['id'].copy()
+        self.version += 1
+
+    def update(self, snapshot):
+        """ Lay out the shapes of the bodies in snapshot, if they changed
+        """
+        ids = snapshot.state['id']
+        if self._layout_ids is None or \
+                not numpy.array_equal(ids, self._layout_ids):
+            self._build_layout(snapshot)
+
+    def transform(self, snapshot):
+        """ Place every cached shape in world coordinates (meters)
+
+            Return: (circle centers, polygon vertices) as (n, 2) arrays,
+                    indexed as in self.shapes
+        """
+        self.update(snapshot)
+        placement = _placement(snapshot)
+        return (_apply(self._circle_local, self._circle_row, *placement),
+                _apply(self._poly_local, self._poly_row, *placement))
+
+    def place(self, snapshot, local, rows):
+        """ Place points given in the body space of the bodies at rows
+            of snapshot in world coordinates (meters)
+
+            Return: (n, 2) array of points
+        """
+        self.update(snapshot)
+        return _apply(local, rows, *_placement(snapshot))
+
+    def world_bounds(self, snapshot):
+        """ Place the box around the fixtures of each body in world
+            coordinates (meters), grown to stay axis aligned as the body
+            turns
+
+            Return: (n, 4) array of (center x, center y, half width,
+                    half height) per snapshot row
+        """
+        self.update(snapshot)
+        x, y, c, s = _placement(snapshot)
+        cx, cy, hx, hy = self.bounds.T
+        out = numpy.empty_like(self.bounds)
+        out[:, 0] = x + c * cx - s * cy
+        out[:, 1] = y + s * cx + c * cy
+        c = numpy.abs(c)
+        s = numpy.abs(s)
+        out[:, 2] = c * hx + s * hy
+        out[:, 3] = s * hx + c * hy
+        return out
+
+    def transform_strokes(self, snapshot):
+        """ Place the centre lines of the strokes in world coordinates
+            (meters)
+
+            Return: (n, 2) array of points, indexed as in self.strokes
+        """
+        self.update(snapshot)
+        return _apply(self._stroke_local, self._stroke_row,
+                      *_placement(snapshot))
+
+
+def _placement(snapshot):
+    # Position, cosine and sine of the angle of each body
+    state = snapshot.state
+    angle = state['angle'].astype(float)
+    return (state['x'].astype(float), state['y'].astype(float),
+            numpy.cos(angle), numpy.sin(angle))
+
+
+def _stroke(shapes):
+    # The centre line and width of a body made of thin rects joined end
+    # to end, with circles on the joins, as Add.concavePoly builds lines;
+    # None for other bodies
+    rects = [shape[1] for shape in shapes if shape[0] == SHAPE_POLYGON]
+    circles = len(shapes) - len(rects)
+    if len(rects) < 2 or circles < len(rects) - 1 or \
+            any(len(rect) != 4 for rect in rects):
+        return None
+
+    points = []
+    width = 0.0
+    for rect in rects:
+        # The ends are the middles of the two short sides
+        sides = [math.hypot(rect[i][0] - rect[i - 1][0],
+                            rect[i][1] - rect[i - 1][1]) for i in range(4)]
+        first = 0 if sides[0] < sides[1] else 1
+        if abs(sides[first] - sides[first + 2]) > 1e-3 * sides[first + 1]:
+            return None  # not a rect
+        ends = [((rect[i][0] + rect[i - 1][0]) / 2.0,
+                 (rect[i][1] + rect[i - 1][1]) / 2.0)
+                for i in (first, first + 2)]
+        width = max(width, sides[first])
+        if not points:
+            points.extend(ends)
+            continue
+        # Follow on from whichever end of the line so far touches
+        tolerance = sides[first]
+        for line in (points, points[::-1]):
+            for a, b in (ends, ends[::-1]):
+                if math.hypot(line[-1][0] - a[0],
+                              line[-1][1] - a[1]) < tolerance:
+                    points[:] = line + [b]
+                    break
+            else:
+                continue
+            break
+        else:
+            return None
+    return points, width
+
+
+def _apply(local, row, x, y, c, s):
+    # Rotate and translate local points by the transform of their body
+    c = c[row]
+    s = s[row]
+    lx = local[:, 0]
+    ly = local[:, 1]
+    out = numpy.empty_like(local)
+    out[:, 0] = x[row] + c * lx - s * ly
+    out[:, 1] = y[row] + s * lx + c * ly
+    return out
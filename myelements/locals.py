@@ -34,4 +34,18 @@ CALLBACK_CONTACT_REMOVE = 2
 CALLBACK_DRAWING_START = 3
 CALLBACK_DRAWING_END = 4
 
+# Joints between the links of Add.chain
+CHAIN_DISTANCE = 0
+CHAIN_ROPE = 1
+CHAIN_REVOLUTE = 2
+# Fewest balls drawn as one chain at a coarse level of detail
+CHAIN_MIN_LINKS = 3
+
 FLT_EPSILON = 1.192092896e-07
+
+# Pixels around the screen within which bodies and joints are drawn,
+# for their outlines and line widths
+VIEW_MARGIN = 4
+
+# Fixed simulation timestep in seconds
+PHYSICS_DT = 1.0 / 120.0
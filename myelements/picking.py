@@ -0,0 +1,213 @@
+"""
+This file is part of the 'Elements' Project
+Elements is a 2D Physics API for Python (supporting Box2D2)
+
+Copyright (C) 2008, The Elements Team, <elements@linuxuser.at>
+
+Home:  http://elements.linuxuser.at
+IRC:   #elements on irc.freenode.org
+
+Code:  http://www.assembla.com/wiki/show/elements
+       svn co http://svn2.assembla.com/svn/elements
+
+License:  GPLv3 | See LICENSE for the full text
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from math import atan2
+
+import numpy
+import Box2D as box2d
+
+
+class _FixtureQuery(box2d.b2QueryCallback):
+
+    def __init__(self):
+        box2d.b2QueryCallback.__init__(self)
+        self.fixtures = []
+
+    def ReportFixture(self, fixture):
+        self.fixtures.append(fixture)
+        return True
+
+
+class Picker:
+    """ Finds the fixtures under points, circles and strokes given in
+        screen coordinates, through the broadphase of the world.
+
+        The query callback and the shapes used for testing are created
+        once and reused. Results are sorted by depth, the fixture drawn
+        on top first.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._query = _FixtureQuery()
+        self._aabb = box2d.b2AABB()
+        self._circle = box2d.b2CircleShape()
+        self._edge = box2d.b2EdgeShape()
+        self._box = box2d.b2PolygonShape()
+        self._identity = box2d.b2Transform()
+        self._identity.SetIdentity()
+
+    def _to_meters(self, pos):
+        x, y = self.parent.to_world(pos)
+        return (x / self.parent.ppm, y / self.parent.ppm)
+
+    def _candidates(self, lower, upper, include_static):
+        self._aabb.lowerBound = lower
+        self._aabb.upperBound = upper
+        self._query.fixtures = []
+        self.parent.world.QueryAABB(self._query, self._aabb)
+
+        fixtures = []
+        for fixture in self._query.fixtures:
+            body = fixture.body
+            if body is None:
+                continue
+            if not include_static:
+                if body.type == box2d.b2_staticBody or body.mass == 0.0:
+                    continue
+            fixtures.append(fixture)
+        return fixtures
+
+    def _overlaps(self, shape, fixture):
+        body = fixture.body
+        for child in range(fixture.shape.childCount):
+            if box2d.b2TestOverlap(shape, 0, fixture.shape, child,
+                                   self._identity, body.transform):
+                return True
+        return False
+
+    def sort_by_depth(self, fixtures):
+        """ Sort fixtures with the one drawn on top first
+
+            Elements.draw paints bodies in the order of the last snapshot,
+            so later rows are on top. Bodies created since then are not
+            drawn yet and go last.
+        """
+        snapshot = self.parent.snapshot
+
+        def depth(fixture):
+            row = snapshot.row(fixture.body)
+            return -1 if row is None else row
+
+        fixtures.sort(key=depth, reverse=True)
+        return fixtures
+
+    def bodies(self, fixtures):
+        """ Return the bodies of fixtures, without repeating any """
+        bodies = []
+        for fixture in fixtures:
+            if fixture.body not in bodies:
+                bodies.append(fixture.body)
+        return bodies
+
+    def fixtures_at(self, pos, include_static=False, area=0.01):
+        """ Return the fixtures containing a point
+
+            Parameters:
+              pos ............ (x, y) in screen coordinates
+              include_static . also return fixtures of static bodies
+              area ........... margin of the broadphase query
+
+            Return: list of fixtures, top first
+        """
+        return self.fixtures_at_points([pos], include_static, area)[0]
+
+    def fixtures_at_points(self, points, include_static=False, area=0.01):
+        """ Like fixtures_at, for several points in one call, as the
+            vertices of a chain
+
+            Return: a list of fixtures for each point
+        """
+        if not len(points):
+            return []
+        f = area / self.parent.camera.scale_factor
+        points = numpy.array(points, float).reshape(-1, 2)
+        meters = self.parent.to_world_array(points) / self.parent.ppm
+        results = []
+        for sx, sy in meters.tolist():
+            hits = [fixture for fixture in
+                    self._candidates((sx - f, sy - f), (sx + f, sy + f),
+                                     include_static)
+                    if fixture.TestPoint((sx, sy))]
+            results.append(self.sort_by_depth(hits))
+        return results
+
+    def fixtures_in_radius(self, pos, radius, include_static=False):
+        """ Return the fixtures touching a circle
+
+            Parameters:
+              pos ...... center in screen coordinates
+              radius ... radius in pixels
+
+            Return: list of fixtures, top first
+        """
+        sx, sy = self._to_meters(pos)
+        r = radius / self.parent.meter_to_screen(1.0)
+        if r <= 0:
+            return self.fixtures_at(pos, include_static)
+        self._circle.radius = r
+        self._circle.pos = (sx, sy)
+        hits = [fixture for fixture in
+                self._candidates((sx - r, sy - r), (sx + r, sy + r),
+                                 include_static)
+                if self._overlaps(self._circle, fixture)]
+        return self.sort_by_depth(hits)
+
+    def fixtures_along(self, points, radius=0, include_static=False):
+        """ Return the fixtures touched by a stroke
+
+            Parameters:
+              points ... polyline in screen coordinates
+              radius ... half width of the stroke in pixels
+
+            Return: list of fixtures, top first
+        """
+        if len(points) < 2:
+            if not points:
+                return []
+            return self.fixtures_in_radius(points[0], radius, include_static)
+
+        r = max(radius, 0) / self.parent.meter_to_screen(1.0)
+        path = [self._to_meters(pos) for pos in points]
+        found = []
+        for (x1, y1), (x2, y2) in zip(path, path[1:]):
+            length = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+            if r > 0:
+                # A box around the segment and a circle at each end
+                shapes = [self._circle, self._circle]
+                if length > 0:
+                    self._box.SetAsBox(
+                        length / 2, r, ((x1 + x2) / 2, (y1 + y2) / 2),
+                        atan2(y2 - y1, x2 - x1))
+                    shapes.append(self._box)
+                ends = [(x1, y1), (x2, y2)]
+            else:
+                self._edge.vertices = [(x1, y1), (x2, y2)]
+                shapes = [self._edge]
+                ends = []
+            lower = (min(x1, x2) - r, min(y1, y2) - r)
+            upper = (max(x1, x2) + r, max(y1, y2) + r)
+            for fixture in self._candidates(lower, upper, include_static):
+                if fixture in found:
+                    continue
+                for i, shape in enumerate(shapes):
+                    if i < len(ends):
+                        self._circle.radius = r
+                        self._circle.pos = ends[i]
+                    if self._overlaps(shape, fixture):
+                        found.append(fixture)
+                        break
+        return self.sort_by_depth(found)
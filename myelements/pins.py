@@ -0,0 +1,97 @@
+"""
+This file is part of the 'Elements' Project
+Elements is a 2D Physics API for Python (supporting Box2D2)
+
+Copyright (C) 2008, The Elements Team, <elements@linuxuser.at>
+
+Home:  http://elements.linuxuser.at
+IRC:   #elements on irc.freenode.org
+
+Code:  http://www.assembla.com/wiki/show/elements
+       svn co http://svn2.assembla.com/svn/elements
+
+License:  GPLv3 | See LICENSE for the full text
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from math import floor
+
+import Box2D as box2d
+
+
+class PinIndex:
+    """ Grid of the revolute joints (pins and motors) by world anchor
+
+        Elements.create_joint and Elements.destroy_joint keep it up to
+        date. A pin to a static body, like the ground, never moves and
+        is kept in the grid cell of its anchor; the rare revolute joint
+        between two moving bodies is kept apart and always tested.
+    """
+
+    def __init__(self, cell=1.0):
+        self.cell = cell  # in meters
+        self._cells = {}
+        self._where = {}  # joint -> cell, or None when not in the grid
+
+    def __len__(self):
+        return len(self._where)
+
+    def _key(self, x, y):
+        return (int(floor(x / self.cell)), int(floor(y / self.cell)))
+
+    def add(self, joint):
+        if not isinstance(joint, box2d.b2RevoluteJoint):
+            return
+        key = None
+        if joint.bodyA.type == box2d.b2_staticBody:
+            key = self._key(*joint.anchorA)
+        elif joint.bodyB.type == box2d.b2_staticBody:
+            key = self._key(*joint.anchorB)
+        self._where[joint] = key
+        self._cells.setdefault(key, []).append(joint)
+
+    def remove(self, joint):
+        if joint not in self._where:
+            return
+        key = self._where.pop(joint)
+        joints = self._cells[key]
+        joints.remove(joint)
+        if not joints:
+            del self._cells[key]
+
+    def clear(self):
+        self._cells = {}
+        self._where = {}
+
+    def rebuild(self, joints):
+        """ Index joints, replacing the current content """
+        self.clear()
+        for joint in joints:
+            self.add(joint)
+
+    def motors(self):
+        """ Return the joints with a motor turning """
+        return [joint for joint in self._where
+                if joint.motorEnabled and joint.motorSpeed != 0]
+
+    def query(self, x, y, radius):
+        """ Return the joints which may have an anchor within radius of
+            (x, y), all in meters. Callers test the exact distance.
+        """
+        x1, y1 = self._key(x - radius, y - radius)
+        x2, y2 = self._key(x + radius, y + radius)
+        found = list(self._cells.get(None, ()))
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                found.extend(self._cells.get((cx, cy), ()))
+        return found
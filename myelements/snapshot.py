@@ -0,0 +1,118 @@
+"""
+This file is part of the 'Elements' Project
+Elements is a 2D Physics API for Python (supporting Box2D2)
+
+Copyright (C) 2008, The Elements Team, <elements@linuxuser.at>
+
+Home:  http://elements.linuxuser.at
+IRC:   #elements on irc.freenode.org
+
+Code:  http://www.assembla.com/wiki/show/elements
+       svn co http://svn2.assembla.com/svn/elements
+
+License:  GPLv3 | See LICENSE for the full text
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy
+import Box2D as box2d
+
+# One row per body, filled by BodySnapshot.capture()
+BODY_STATE = numpy.dtype([
+    ('id', numpy.int32),  # stable while the body exists
+    ('x', numpy.float32),  # position in meters
+    ('y', numpy.float32),
+    ('angle', numpy.float32),  # radians
+    ('vx', numpy.float32),  # linear velocity in m/s
+    ('vy', numpy.float32),
+    ('awake', numpy.bool_),
+    ('type', numpy.uint8),  # box2d.b2_staticBody, _kinematicBody, ...
+])
+
+
+class BodySnapshot:
+
+    """ State of all bodies in a world, read from Box2D in one pass.
+
+        Reading position, angle and velocity through the pybox2d proxies
+        is slow, so capture() does it once per frame into a preallocated
+        structured array (see BODY_STATE).  Drawing, pen tracking and
+        saving then use the arrays instead of touching the bodies again.
+
+        bodies[i] is the b2Body of state[i], and row(body) the inverse.
+    """
+
+    def __init__(self, capacity=64):
+        self._buffer = numpy.zeros(capacity, BODY_STATE)
+        self.count = 0
+        self.bodies = []
+        self._rows = {}
+        self._ids = {}
+        self._next_id = 0
+
+    @property
+    def state(self):
+        """ The captured rows, a view into the preallocated buffer
+        """
+        return self._buffer[:self.count]
+
+    def row(self, body):
+        """ Return the row of body in state, or None if not captured
+        """
+        return self._rows.get(body)
+
+    def forget(self, body):
+        """ Drop the id of a destroyed body, whose address Box2D may reuse
+        """
+        self._ids.pop(body, None)
+
+    def capture(self, world):
+        """ Read the state of every body of world (a b2World)
+
+            Return: state array
+        """
+        bodies = world.bodies
+        count = len(bodies)
+        if count > len(self._buffer):
+            capacity = len(self._buffer)
+            while capacity < count:
+                capacity *= 2
+            self._buffer = numpy.zeros(capacity, BODY_STATE)
+
+        old_ids = self._ids
+        ids = {}
+        rows = {}
+        values = []
+        for i, body in enumerate(bodies):
+            body_id = old_ids.get(body)
+            if body_id is None:
+                body_id = self._next_id
+                self._next_id += 1
+            ids[body] = body_id
+            rows[body] = i
+            x, y = body.position
+            vx, vy = body.linearVelocity
+            values.append((body_id, x, y, body.angle, vx, vy, body.awake,
+                           body.type))
+
+        self._buffer[:count] = values
+        self.count = count
+        self.bodies = bodies
+        self._rows = rows
+        self._ids = ids
+        return self.state
+
+    def dynamic(self):
+        """ Return a boolean mask of the dynamic bodies in state
+        """
+        return self.state['type'] == box2d.b2_dynamicBody
@@ -0,0 +1,150 @@
+"""
+This file is part of the 'Elements' Project
+Elements is a 2D Physics API for Python (supporting Box2D2)
+
+Copyright (C) 2008, The Elements Team, <elements@linuxuser.at>
+
+Home:  http://elements.linuxuser.at
+IRC:   #elements on irc.freenode.org
+
+Code:  http://www.assembla.com/wiki/show/elements
+       svn co http://svn2.assembla.com/svn/elements
+
+License:  GPLv3 | See LICENSE for the full text
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import math
+import time
+
+from .locals import PHYSICS_DT
+
+# Longest frame time accounted for, a longer pause is not caught up
+MAX_ELAPSED = 0.05
+# Steps made in one frame at most, enough to keep up with MAX_ELAPSED
+MAX_STEPS = int(math.ceil(round(MAX_ELAPSED / PHYSICS_DT, 6)))
+# Seconds of stepping per frame, the rest is left to drawing and GTK
+STEP_BUDGET = 0.020
+# (velocity, position) iterations, from the most accurate down
+ITERATIONS = ((10, 8), (8, 4), (6, 3), (4, 2))
+# Weight of the last step in the measured step cost
+COST_SMOOTHING = 0.1
+
+
+class StepController:
+    """ Runs the fixed PHYSICS_DT steps due each frame within a budget
+
+        Real time adds up in an accumulator, and whole steps are taken
+        out of it. Steps stop for the frame when MAX_STEPS are made, the
+        rest is kept for the next frame. When the time spent stepping
+        reaches the budget, the steps still due are dropped instead, so
+        the simulation slows down rather than falling further behind
+        every frame, and the time lost is added to drift.
+
+        The cost of a step is measured. When a frame used up the budget,
+        fewer solver iterations are used, and more again once the steps
+        fit easily. Lockstep needs the same iterations
+        on every buddy and sets adaptive to False.
+    """
+
+    def __init__(self, dt=PHYSICS_DT, max_steps=MAX_STEPS,
+                 budget=STEP_BUDGET, iterations=ITERATIONS):
+        self.dt = dt
+        self.max_steps = max_steps
+        self.budget = budget
+        self.iterations = iterations
+        self.adaptive = True
+        self.level = 0  # index in iterations
+        self.cost = 0.0  # seconds per step, smoothed
+        self.drift = 0.0  # seconds of real time not simulated
+        self.simulated = 0.0
+        self.real = 0.0
+        self._accumulator = dt
+        self._steps = 0
+        self._spent = 0.0
+        self._over = False  # the last frame used up the budget
+
+    @property
+    def vel_iterations(self):
+        return self.iterations[self.level][0]
+
+    @property
+    def pos_iterations(self):
+        return self.iterations[self.level][1]
+
+    def reset(self):
+        self._accumulator = self.dt
+        self.drift = self.simulated = self.real = 0.0
+
+    def advance(self, elapsed):
+        """ Start a frame, elapsed seconds after the previous one """
+        elapsed = min(elapsed, MAX_ELAPSED)
+        self.real += elapsed
+        self._accumulator += elapsed
+        if self.adaptive:
+            self._adapt(elapsed)
+        else:
+            self.level = 0
+        self._steps = 0
+        self._spent = 0.0
+        self._over = False
+
+    def due(self):
+        """ Return whether to make another step in this frame """
+        if self._accumulator < self.dt:
+            return False
+        if self._spent < self.budget:
+            return self._steps < self.max_steps
+        # Drop what does not fit, keeping the part of a step
+        dropped = self._accumulator - self._accumulator % self.dt
+        self._accumulator -= dropped
+        self.drift += dropped
+        self._over = True
+        return False
+
+    def hold(self):
+        """ Wait for the next frame with one step due, when stepping
+            cannot go on now """
+        self._accumulator = self.dt
+
+    def skip(self):
+        """ Drop the time of this frame, when the world is not stepped """
+        self._accumulator = 0.0
+
+    def step(self, world):
+        """ Make a step of the Elements world, measuring its cost """
+        start = time.perf_counter()
+        world.update(fps=int(1.0 / self.dt),
+                     vel_iterations=self.vel_iterations,
+                     pos_iterations=self.pos_iterations)
+        cost = time.perf_counter() - start
+        self._accumulator -= self.dt
+        self._steps += 1
+        self._spent += cost
+        self.simulated += self.dt
+        if self.cost:
+            self.cost += (cost - self.cost) * COST_SMOOTHING
+        else:
+            self.cost = cost
+
+    def _adapt(self, elapsed):
+        # Steps this frame needs to keep up with real time
+        needed = min(elapsed / self.dt, self.max_steps)
+        load = needed * self.cost / self.budget
+        if self._over and self.level < len(self.iterations) - 1:
+            self.level += 1
+            # Fewer iterations make cheaper steps, measure them again
+            self.cost *= 0.75
+        elif not self._over and load < 0.5 and self.level > 0:
+            self.level -= 1
+            self.cost *= 1.25
@@ -32,6 +32,8 @@ from math import atan2
 from math import degrees
 from math import acos
 
+import Box2D as box2d
+
 from .locals import *
 
 
@@ -367,3 +369,130 @@ def convex_hull(points):
                 l = is_left(pt2, pt1, p)
             hull.append(p)
     return hull
+
+
+def poly_area(points):
+    """ Calculate the signed area of a polygon
+
+        Return: The area, positive when counter-clockwise
+    """
+    area = 0.0
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        area += x1 * y2 - x2 * y1
+        x1, y1 = x2, y2
+    return area / 2.0
+
+
+def _cross(p0, p1, p2):
+    return (p1[0] - p0[0]) * (p2[1] - p0[1]) - \
+        (p1[1] - p0[1]) * (p2[0] - p0[0])
+
+
+def _inside_triangle(p, a, b, c):
+    return _cross(a, b, p) >= 0 and _cross(b, c, p) >= 0 and \
+        _cross(c, a, p) >= 0
+
+
+def triangulate(points):
+    """ Cut a counter-clockwise simple polygon into triangles, by
+        clipping its ears
+
+        Return: list of (i, j, k) indices of points, or [] when the
+        polygon cannot be cut, e.g. when it crosses itself
+    """
+    remaining = list(range(len(points)))
+    triangles = []
+    tries = 2 * len(remaining)
+    v = len(remaining) - 1
+    while len(remaining) > 2:
+        tries -= 1
+        if tries <= 0:
+            return []
+        n = len(remaining)
+        u = v % n
+        v = (u + 1) % n
+        w = (v + 1) % n
+        a, b, c = (points[remaining[u]], points[remaining[v]],
+                   points[remaining[w]])
+        if _cross(a, b, c) <= 1e-10:
+            continue
+        if any(_inside_triangle(points[p], a, b, c) for p in remaining
+               if p not in (remaining[u], remaining[v], remaining[w])):
+            continue
+        triangles.append((remaining[u], remaining[v], remaining[w]))
+        remaining.pop(v)
+        tries = 2 * len(remaining)
+    return triangles
+
+
+def _is_convex_piece(points):
+    n = len(points)
+    return all(_cross(points[i - 2], points[i - 1], points[i]) >= 0
+               for i in range(n))
+
+
+def _merge_pieces(piece1, piece2, a, b):
+    # piece1 has the edge a -> b and piece2 the edge b -> a, walk piece1
+    # from b round to a and go on along piece2 back to b
+    i = piece1.index(b)
+    j = piece2.index(a)
+    first = piece1[i:] + piece1[:i]
+    second = piece2[j:] + piece2[:j]
+    return first + second[1:-1]
+
+
+def decompose_poly(points, max_vertices=box2d.b2_maxPolygonVertices):
+    """ Cut a simple polygon into a few convex pieces
+
+        The polygon is triangulated, then neighbouring pieces are merged
+        as long as the merged piece is convex and has no more than
+        max_vertices, so each piece fits a Box2D polygon shape.
+
+        Parameters:
+          points ........ vertices of the polygon, not closed
+          max_vertices .. most vertices of a piece
+
+        Return: list of convex pieces ([(x, y), ...]) counter-clockwise,
+        or [] when the polygon cannot be decomposed
+    """
+    points = list(points)
+    if len(points) < 3:
+        return []
+    area = poly_area(points)
+    if area < 0:
+        points.reverse()
+        area = -area
+
+    pieces = [list(triangle) for triangle in triangulate(points)]
+    if not pieces:
+        return []
+
+    # A polygon crossing itself does not add up to its own area
+    total = sum(poly_area([points[i] for i in piece]) for piece in pieces)
+    if abs(total - area) > 1e-6 * max(area, 1.0):
+        return []
+
+    merged = True
+    while merged:
+        merged = False
+        edges = {}
+        for piece in pieces:
+            for k in range(len(piece)):
+                edges[(piece[k - 1], piece[k])] = piece
+        for (a, b), piece1 in edges.items():
+            piece2 = edges.get((b, a))
+            if piece2 is None or piece2 is piece1:
+                continue
+            if len(piece1) + len(piece2) - 2 > max_vertices:
+                continue
+            candidate = _merge_pieces(piece1, piece2, a, b)
+            if not _is_convex_piece([points[i] for i in candidate]):
+                continue
+            pieces.remove(piece1)
+            pieces.remove(piece2)
+            pieces.append(candidate)
+            merged = True
+            break
+
+    return [[points[i] for i in piece] for piece in pieces]
@@ -0,0 +1,332 @@
+"""
+This file is part of the 'Elements' Project
+Elements is a 2D Physics API for Python (supporting Box2D2)
+
+Copyright (C) 2008, The Elements Team, <elements@linuxuser.at>
+
+Home:  http://elements.linuxuser.at
+IRC:   #elements on irc.freenode.org
+
+Code:  http://www.assembla.com/wiki/show/elements
+       svn co http://svn2.assembla.com/svn/elements
+
+License:  GPLv3 | See LICENSE for the full text
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+# Binary container for the world model of Elements.get_world_model:
+#
+#   magic (8 bytes), version and header length (2 x uint32),
+#   JSON header, then the sections below as little endian arrays,
+#   each starting at an offset aligned to 8 bytes.
+#
+# The header holds the offset and length of each section, the user data
+# of bodies and joints and the additional vars, except the pen traces
+# which are stored as one float32 array. Box2D keeps everything in
+# float32, so nothing is lost compared to the JSON format.
+import json
+import struct
+
+import numpy
+
+MAGIC = b'PHYSWLD\0'
+VERSION = 1
+
+_PREFIX = struct.Struct('<8sII')
+_ALIGN = 8
+
+SHAPE_CIRCLE = 0
+SHAPE_POLYGON = 1
+
+JOINT_OTHER = 0
+JOINT_REVOLUTE = 1
+JOINT_DISTANCE = 2
+
+BODY = numpy.dtype([
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('angle', '<f4'),
+    ('vx', '<f4'),
+    ('vy', '<f4'),
+    ('omega', '<f4'),
+    ('dynamic', 'u1'),
+    ('fixture_start', '<i4'),
+    ('fixture_count', '<i4'),
+])
+
+FIXTURE = numpy.dtype([
+    ('type', 'u1'),
+    ('density', '<f4'),
+    ('restitution', '<f4'),
+    ('friction', '<f4'),
+    ('radius', '<f4'),
+    ('x', '<f4'),  # local position of circles
+    ('y', '<f4'),
+    ('vertex_start', '<i4'),
+    ('vertex_count', '<i4'),
+])
+
+JOINT = numpy.dtype([
+    ('type', 'u1'),
+    ('body1', '<i4'),
+    ('body2', '<i4'),
+    ('x1', '<f4'),
+    ('y1', '<f4'),
+    ('x2', '<f4'),
+    ('y2', '<f4'),
+    ('collideConnected', 'u1'),
+    ('enableMotor', 'u1'),
+    ('motorSpeed', '<f4'),
+    ('maxMotorTorque', '<f4'),
+])
+
+SECTIONS = (
+    ('bodies', BODY),
+    ('fixtures', FIXTURE),
+    ('vertices', numpy.dtype('<f4')),
+    ('joints', JOINT),
+    ('traces', numpy.dtype('<f4')),
+    ('trace_offsets', numpy.dtype('<i8')),
+)
+
+TRACES_KEY = 'full_pos_list'
+
+
+def is_binary(path):
+    """ Return True if path is a file written by write() """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def _body_arrays(bodylist):
+    bodies = numpy.zeros(len(bodylist), BODY)
+    fixtures = []
+    vertices = []
+    for i, body in enumerate(bodylist):
+        shapes = body.get('shapes', ())
+        bodies[i] = (body['position'][0], body['position'][1],
+                     body['angle'],
+                     body['linearVelocity'][0], body['linearVelocity'][1],
+                     body['angularVelocity'], body['dynamic'],
+                     len(fixtures), len(shapes))
+        for shape in shapes:
+            if shape['type'] == 'circle':
+                x, y = shape['localPosition']
+                fixtures.append((SHAPE_CIRCLE, shape['density'],
+                                 shape['restitution'], shape['friction'],
+                                 shape['radius'], x, y, 0, 0))
+            else:
+                fixtures.append((SHAPE_POLYGON, shape['density'],
+                                 shape['restitution'], shape['friction'],
+                                 0, 0, 0, len(vertices) // 2,
+                                 len(shape['vertices'])))
+                for vertex in shape['vertices']:
+                    vertices.extend(vertex)
+    return (bodies, numpy.array(fixtures, FIXTURE),
+            numpy.array(vertices, '<f4'))
+
+
+def _joint_array(jointlist):
+    joints = numpy.zeros(len(jointlist), JOINT)
+    for i, joint in enumerate(jointlist):
+        x1 = y1 = x2 = y2 = speed = torque = 0
+        motor = False
+        kind = JOINT_OTHER
+        if joint.get('type') == 'revolute':
+            kind = JOINT_REVOLUTE
+            x1, y1 = joint['anchor']
+            motor = joint['enableMotor']
+            speed = joint['motorSpeed']
+            torque = joint['maxMotorTorque']
+        elif joint.get('type') == 'distance':
+            kind = JOINT_DISTANCE
+            x1, y1 = joint['anchor1']
+            x2, y2 = joint['anchor2']
+        joints[i] = (kind, joint['body1'], joint['body2'], x1, y1, x2, y2,
+                     joint['collideConnected'], motor, speed, torque)
+    return joints
+
+
+def _trace_arrays(traces):
+    offsets = numpy.zeros(len(traces) + 1, '<i8')
+    for i, trace in enumerate(traces):
+        offsets[i + 1] = offsets[i] + len(trace)
+    if traces:
+        points = numpy.concatenate(
+            [numpy.asarray(trace, '<f4').ravel() for trace in traces])
+    else:
+        points = numpy.zeros(0, '<f4')
+    return points, offsets
+
+
+def _encode(worldmodel):
+    additional_vars = dict(worldmodel.get('additional_vars', {}))
+    traces = additional_vars.pop(TRACES_KEY, [])
+
+    arrays = {}
+    arrays['bodies'], arrays['fixtures'], arrays['vertices'] = \
+        _body_arrays(worldmodel['bodylist'])
+    arrays['joints'] = _joint_array(worldmodel['jointlist'])
+    arrays['traces'], arrays['trace_offsets'] = _trace_arrays(traces)
+
+    header = {
+        'bodyUserData': [body['userData'] for body in worldmodel['bodylist']],
+        'jointUserData': [joint['userData']
+                          for joint in worldmodel['jointlist']],
+        'additional_vars': additional_vars,
+        'has_traces': TRACES_KEY in worldmodel.get('additional_vars', {}),
+        'sections': {},
+    }
+    # Offsets depend on the header length, which depends on the offsets,
+    # so lay the sections out relative to the end of the header first
+    offset = 0
+    for name, dtype in SECTIONS:
+        offset = -(-offset // _ALIGN) * _ALIGN
+        header['sections'][name] = [offset, len(arrays[name])]
+        offset += arrays[name].nbytes
+    blob = json.dumps(header).encode('utf-8')
+    start = -(-(_PREFIX.size + len(blob)) // _ALIGN) * _ALIGN
+
+    chunks = [_PREFIX.pack(MAGIC, VERSION, len(blob)), blob]
+    position = _PREFIX.size + len(blob)
+    for name, dtype in SECTIONS:
+        padding = start + header['sections'][name][0] - position
+        data = numpy.ascontiguousarray(arrays[name], dtype).tobytes()
+        chunks.append(b'\0' * padding)
+        chunks.append(data)
+        position += padding + len(data)
+    return chunks
+
+
+def write(path, worldmodel):
+    """ Write a world model to path in the binary format
+
+        Parameters:
+          path ......... file name
+          worldmodel ... dict returned by Elements.get_world_model, the
+                         pen traces in additional_vars['full_pos_list']
+                         can be lists or arrays of x, y, x, y, ...
+
+        Return: -
+    """
+    with open(path, 'wb') as f:
+        for chunk in _encode(worldmodel):
+            f.write(chunk)
+
+
+def dumps(worldmodel):
+    """ Return a world model in the binary format, as bytes """
+    return b''.join(_encode(worldmodel))
+
+
+def _decode(data, name):
+    magic, version, length = _PREFIX.unpack(bytes(data[:_PREFIX.size]))
+    if magic != MAGIC:
+        raise ValueError('%s is not a binary world file' % name)
+    if version > VERSION:
+        raise ValueError('%s was written by a newer version (%d)'
+                         % (name, version))
+    header = json.loads(
+        bytes(data[_PREFIX.size:_PREFIX.size + length]).decode('utf-8'))
+    start = -(-(_PREFIX.size + length) // _ALIGN) * _ALIGN
+
+    arrays = {}
+    for section, dtype in SECTIONS:
+        offset, count = header['sections'][section]
+        arrays[section] = numpy.frombuffer(data, dtype, count,
+                                           start + offset)
+    return header, arrays
+
+
+def read_arrays(path):
+    """ Map a file written by write() into memory
+
+        Return: (header, dict of section name -> array), the arrays are
+        read-only views of the mapped file
+    """
+    return _decode(numpy.memmap(path, mode='r'), path)
+
+
+def read(path):
+    """ Read a file written by write()
+
+        Return: the world model, as accepted by Elements.load_world_model.
+        The pen traces are float32 arrays of x, y, x, y, ...
+    """
+    return _model(*read_arrays(path))
+
+
+def loads(data):
+    """ Like read(), for bytes returned by dumps() """
+    return _model(*_decode(data, 'data'))
+
+
+def _model(header, arrays):
+    bodies = arrays['bodies']
+    fixtures = arrays['fixtures']
+    vertices = arrays['vertices'].reshape(-1, 2).tolist()
+
+    shapes = []
+    for (kind, density, restitution, friction, radius, x, y, first,
+         count) in fixtures.tolist():
+        shape = {'density': density, 'restitution': restitution,
+                 'friction': friction}
+        if kind == SHAPE_CIRCLE:
+            shape['type'] = 'circle'
+            shape['radius'] = radius
+            shape['localPosition'] = (x, y)
+        else:
+            shape['type'] = 'polygon'
+            shape['vertices'] = vertices[first:first + count]
+        shapes.append(shape)
+
+    bodylist = []
+    for (x, y, angle, vx, vy, omega, dynamic, first, count), userData in \
+            zip(bodies.tolist(), header['bodyUserData']):
+        body = {'position': (x, y), 'angle': angle,
+                'linearVelocity': (vx, vy), 'angularVelocity': omega,
+                'dynamic': bool(dynamic), 'userData': userData}
+        if count:
+            body['shapes'] = shapes[first:first + count]
+        bodylist.append(body)
+
+    jointlist = []
+    for (kind, body1, body2, x1, y1, x2, y2, collide, motor, speed,
+         torque), userData in zip(arrays['joints'].tolist(),
+                                  header['jointUserData']):
+        joint = {'body1': body1, 'body2': body2,
+                 'collideConnected': bool(collide), 'userData': userData}
+        if kind == JOINT_REVOLUTE:
+            joint['type'] = 'revolute'
+            joint['anchor'] = (x1, y1)
+            joint['enableMotor'] = bool(motor)
+            joint['motorSpeed'] = speed
+            joint['maxMotorTorque'] = torque
+        elif kind == JOINT_DISTANCE:
+            joint['type'] = 'distance'
+            joint['anchor1'] = (x1, y1)
+            joint['anchor2'] = (x2, y2)
+        jointlist.append(joint)
+
+    additional_vars = header['additional_vars']
+    if header['has_traces']:
+        points = arrays['traces']
+        offsets = arrays['trace_offsets'].tolist()
+        additional_vars[TRACES_KEY] = [points[offsets[i]:offsets[i + 1]]
+                                       for i in range(len(offsets) - 1)]
+
+    return {'bodylist': bodylist, 'jointlist': jointlist,
+            'controllerlist': [], 'additional_vars': additional_vars}
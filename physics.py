@@ -26,19 +26,29 @@
 # Code:   git://git.sugarlabs.org/physics/mainline.git
 
 import os
+import json
+import time
 
-from gi.repository import Gtk
+from gi.repository import GLib
 from gi.repository import Gdk
 
 import pygame
-from pygame.locals import MOUSEBUTTONUP
+from pygame.locals import MOUSEBUTTONUP, MOUSEMOTION, KEYDOWN, K_F9
 
 import Box2D as box2d
 import myelements as elements
+from myelements.stepper import StepController
 
 import tools
+import traces
+import profiler
 
-PHYSICS_DT = 1.0 / 120.0
+# Projects with more bodies and pen points than this are saved in the
+# binary format of myelements.worldfile instead of JSON
+BINARY_SAVE_THRESHOLD = 5000
+# Milliseconds between frames while something moves, under 30 FPS to
+# help keep the rest of the platform responsive
+FRAME_MS = 34
 
 
 class PhysicsGame:
@@ -46,7 +56,6 @@ class PhysicsGame:
     def __init__(self, activity):
         self.activity = activity
         # Get everything set up
-        self.clock = pygame.time.Clock()
         self.in_focus = True
         # Create the name --> instance map for components
         self.toolList = {}
@@ -58,20 +67,29 @@ class PhysicsGame:
         self.opening_queue = None
         self.running = True
         self.initialise = True
+        self._source = None  # GLib source of the next frame
+        self._last_frame = None
+        self._cursor = None  # position and picture of the fake cursor
 
-        self.full_pos_list = []
+        self.traces = traces.PenTraces()
         self.tracked_bodies = 0
 
         self.trackinfo = {}
 
         self.box2d_fps = 50
-        self._physics_accumulator = PHYSICS_DT
+        self.stepper = StepController()
+
+        # Frames are profiled into a log kept with the instance, F9 shows
+        # the overlay
+        self.profiler = profiler.FrameProfiler(log_path=os.path.join(
+            activity.get_activity_root(), 'instance', 'profile.csv'))
 
     def set_game_fps(self, fps):
         self.box2d_fps = fps
 
     def switch_off_fake_pygame_cursor_cb(self, panel, event):
         self.show_fake_cursor = False
+        self._cursor = None
 
     def switch_on_fake_pygame_cursor_cb(self, panel, event):
         self.show_fake_cursor = True
@@ -79,12 +97,19 @@ class PhysicsGame:
     def write_file(self, path):
         # Saving to journal
         self.world.add.remove_mouseJoint()
+        # Small projects stay JSON, so older versions can open them
+        binary = self.world.world.bodyCount + self.traces.point_count() > \
+            BINARY_SAVE_THRESHOLD
         additional_data = {
             'trackinfo': self.trackinfo,
-            'full_pos_list': self.full_pos_list,
+            'full_pos_list': self.traces.to_arrays() if binary
+            else self.traces.to_lists(),
             'tracked_bodies': self.tracked_bodies
         }
-        self.world.json_save(path, additional_data, serialize=True)
+        if binary:
+            self.world.binary_save(path, additional_data, serialize=True)
+        else:
+            self.world.json_save(path, additional_data, serialize=True)
 
     def read_file(self, path):
         # Loading from journal
@@ -94,15 +119,70 @@ class PhysicsGame:
         if self.opening_queue:
             path = self.opening_queue.encode('ascii', 'convert')
             if os.path.exists(path):
-                self.world.json_load(path, serialized=True)
-                if 'full_pos_list' in self.world.additional_vars:
-                    self.full_pos_list = \
-                        self.world.additional_vars['full_pos_list']
-                if 'trackinfo' in self.world.additional_vars:
-                    self.trackinfo = self.world.additional_vars['trackinfo']
-                if 'tracked_bodies' in self.world.additional_vars:
-                    self.tracked_bodies = \
-                        self.world.additional_vars['tracked_bodies']
+                self.world.load(path, serialized=True)
+                self._restore_additional_vars()
+
+    def get_snapshot(self):
+        """ Return the world with its pens and traces, in the binary
+            format, for a buddy joining the shared activity
+        """
+        # get_world_model replaces the pen bodies with save ids in place
+        trackinfo = dict((key, list(info))
+                         for key, info in self.trackinfo.items())
+        additional_data = {
+            'trackinfo': trackinfo,
+            'full_pos_list': self.traces.to_arrays(),
+            'tracked_bodies': self.tracked_bodies,
+            'run_physics': self.world.run_physics
+        }
+        return self.world.binary_dumps(additional_data, serialize=True)
+
+    def set_snapshot(self, data):
+        """ Replace the world with one from get_snapshot """
+        self.world.binary_loads(data, serialized=True)
+        self._restore_additional_vars()
+        if 'run_physics' in self.world.additional_vars:
+            self.set_running(self.world.additional_vars['run_physics'],
+                             share=False)
+
+    def set_running(self, running, share=True):
+        """ Run or pause the simulation, for the buddies too """
+        if share and self.activity.send_event(
+                'r:' + json.dumps([running])):
+            return
+        self.world.run_physics = running
+        self.activity.set_stop_play_state(running)
+
+    def clear_all(self, share=True):
+        """ Destroy all the bodies and the pen points, for the buddies
+            too
+        """
+        if share and self.activity.send_event('x:' + json.dumps([])):
+            return
+        self.world.add.remove_mouseJoint()
+        # Get bodies and destroy them too
+        for body in self.world.world.bodies:
+            self.world.world.DestroyBody(body)
+
+        # Add ground, because we destroyed it before
+        self.world.add.ground()
+        # Also clear the points recorded in pens.
+        self.traces.clear()
+        self.world.renderer.invalidate()
+
+    def _restore_additional_vars(self):
+        if 'trackinfo' in self.world.additional_vars:
+            self.trackinfo = self.world.additional_vars['trackinfo']
+        if 'full_pos_list' in self.world.additional_vars:
+            colors = dict((info[4], info[2])
+                          for info in self.trackinfo.values())
+            self.traces.load_lists(
+                self.world.additional_vars['full_pos_list'], colors)
+        if 'tracked_bodies' in self.world.additional_vars:
+            self.tracked_bodies = \
+                self.world.additional_vars['tracked_bodies']
+        self.world.renderer.invalidate()
+        self.wake()
 
     def run(self):
         if self.initialise:
@@ -120,117 +200,206 @@ class PhysicsGame:
                                 self.switch_off_fake_pygame_cursor_cb)
             self.canvas.add_events(Gdk.EventMask.ENTER_NOTIFY_MASK |
                                    Gdk.EventMask.LEAVE_NOTIFY_MASK)
+            # Frames stop while idle, input starts them again
+            self.canvas.connect('event', self._canvas_event_cb)
+            self.canvas.connect('size-allocate',
+                                lambda widget, allocation: self.wake())
 
         self.screen = pygame.display.get_surface()
         self.world = elements.Elements(self.screen.get_size())
         self.world.renderer.set_surface(self.screen)
+        # Keep settled bodies in a cached layer, only redraw what moved
+        self.world.renderer.set_retained(True, (240, 240, 240))  # #f0f0f0
         self.world.add.ground()
         self.check_queue()
 
+        self.wake()
+        # Frames now come from _frame_cb, leave the idle source
+        return False
 
-        while self.running:
-
-            # Pump GTK messages.
-            while Gtk.events_pending():
-                Gtk.main_iteration()
-            if not self.running:
-                break
-
-            # Pump PyGame messages.
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    return
-                elif event.type == pygame.VIDEORESIZE:
-                    pygame.display.set_mode(event.size, pygame.RESIZABLE)
-
-                self.currentTool.handleEvents(event)
-
-                if event.type == MOUSEBUTTONUP:
-                    # if event.button == 1:
-                    self.show_fake_cursor = True
-
-            if self.in_focus:
-                # Drive motors
-                if self.world.run_physics:
-                    bodies_present = len(self.world.world.bodies)
-                    clear_all_active = self.activity.clear_all.get_sensitive()
-                    if (bodies_present > 2) and clear_all_active is False:
-                        self.activity.clear_all.set_sensitive(True)
-                    elif (bodies_present > 2) is False and \
-                            clear_all_active is True:
-                        self.activity.clear_all.set_sensitive(False)
-
-                    poslist = self.full_pos_list
-                    clear_trace_active = \
-                        self.activity.clear_trace.get_sensitive()
-                    if poslist:
-                        if not poslist[0]:
-                            if clear_trace_active:
-                                self.activity.clear_trace.set_sensitive(False)
-                        else:
-                            if clear_trace_active is False:
-                                self.activity.clear_trace.set_sensitive(True)
-
-                    for key, info in self.trackinfo.items():
-                        # [host_body, tracker, color, destroyed?]
-                        body = info[1]
-                        if info[3] is False:  # Not destroyed the pen
-                            trackdex = info[4]
-
-                            def to_screen(pos):
-                                px = self.world.meter_to_screen(
-                                    pos[0])
-                                py = self.world.meter_to_screen(
-                                    pos[1])
-                                py = self.world.renderer.get_surface() \
-                                    .get_height() - py
-                                return (px, py)
-
-                            x = body.position.x
-                            y = body.position.y
-                            tupled_pos = to_screen((x, y))
-                            posx = tupled_pos[0]
-                            posy = tupled_pos[1]
-                            try:
-                                self.full_pos_list[trackdex].append(posx)
-                                self.full_pos_list[trackdex].append(posy)
-                            except IndexError:
-                                self.full_pos_list.append([posx, posy])
-                    '''
-                    for body in self.world.world.GetBodyList():
-                        if isinstance(body.userData, dict):
-                            if 'rollMotor' in body.userData:
-                                rollmotor = body.userData['rollMotor']
-                                diff = rollmotor['targetVelocity'] - \
-                                       body.GetAngularVelocity()
-                                body.ApplyTorque(rollmotor['strength'] * \
-                                                 diff * body.getMassData().I)
-                    '''
-
-                elapsed = min(max(self.clock.get_time(), 1) / 1000.0, 0.05)
-                self._physics_accumulator += elapsed
-                while self._physics_accumulator >= PHYSICS_DT:
-                    self.world.update(fps=int(1.0 / PHYSICS_DT))
-                    self._physics_accumulator -= PHYSICS_DT
-                self.screen.fill((240, 240, 240))  # #f0f0f0, light-grey
-                self.world.draw()
-
-                # Draw output from tools
-                self.currentTool.draw()
-
-                # Show Sugar like cursor for UI consistancy
-                if self.show_fake_cursor:
-                    self.screen.blit(self.cursor_picture,
-                                     pygame.mouse.get_pos())
-
-                # Flip Display
-                pygame.display.flip()
-
-            # Stay < 30 FPS to help keep the rest of the platform responsive
-            self.clock.tick_busy_loop(30)
+    def wake(self):
+        """ Schedule frames again, after input, a message from a buddy
+            or anything else changing the world while idle """
+        if not hasattr(self, 'world'):
+            return  # run() starts the frames
+        if self._source is None and self.running:
+            self._last_frame = time.monotonic()
+            self._source = GLib.timeout_add(FRAME_MS, self._frame_cb)
+
+    def post_action(self, action):
+        """ Send an action of the toolbar to the current tool """
+        pygame.event.post(pygame.event.Event(pygame.USEREVENT,
+                                             action=action))
+        self.wake()
+
+    def _canvas_event_cb(self, widget, event):
+        # Runs before sugargame turns the event into a pygame one
+        self.wake()
+        return False
 
+    def _frame_cb(self):
+        if self.running and self.frame():
+            return True
+        self._source = None
         return False
 
+    def frame(self):
+        """ Handle the pending events, step the world and draw it
+
+            Return: whether a next frame is needed soon. When not, the
+            frames stop until wake() is called.
+        """
+        self.profiler.begin()
+        now = time.monotonic()
+        elapsed = now - self._last_frame
+        self._last_frame = now
+        busy = False
+
+        # Pump PyGame messages.
+        for event in pygame.event.get():
+            busy = True
+            if event.type == pygame.QUIT:
+                self.running = False
+                return False
+            elif event.type == pygame.VIDEORESIZE:
+                self.screen = pygame.display.set_mode(event.size,
+                                                      pygame.RESIZABLE)
+                self.world.renderer.set_surface(self.screen)
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.world.renderer.invalidate()
+            elif event.type == KEYDOWN and event.key == K_F9:
+                self.profiler.toggle()
+                self.world.renderer.invalidate()
+
+            self.currentTool.handleEvents(event)
+            if event.type != MOUSEMOTION:
+                # The world may change, do not keep it settled
+                self.world.wake()
+
+            if event.type == MOUSEBUTTONUP:
+                # if event.button == 1:
+                self.show_fake_cursor = True
+
+        self.profiler.lap('events')
+
+        # Share what the tools made, apply what buddies made
+        self.activity.flush_events()
+        self.activity.apply_events()
+        self.profiler.lap('share')
+        steps = 0
+
+        if self.in_focus:
+            # Drive motors
+            if self.world.run_physics:
+                bodies_present = len(self.world.world.bodies)
+                clear_all_active = self.activity.clear_all.get_sensitive()
+                if (bodies_present > 2) and clear_all_active is False:
+                    self.activity.clear_all.set_sensitive(True)
+                elif (bodies_present > 2) is False and \
+                        clear_all_active is True:
+                    self.activity.clear_all.set_sensitive(False)
+
+                clear_trace_active = \
+                    self.activity.clear_trace.get_sensitive()
+                if len(self.traces):
+                    if not self.traces.point_count():
+                        if clear_trace_active:
+                            self.activity.clear_trace.set_sensitive(False)
+                    else:
+                        if clear_trace_active is False:
+                            self.activity.clear_trace.set_sensitive(True)
+
+                '''
+                for body in self.world.world.GetBodyList():
+                    if isinstance(body.userData, dict):
+                        if 'rollMotor' in body.userData:
+                            rollmotor = body.userData['rollMotor']
+                            diff = rollmotor['targetVelocity'] - \
+                                   body.GetAngularVelocity()
+                            body.ApplyTorque(rollmotor['strength'] * \
+                                             diff * body.getMassData().I)
+                '''
+
+            # Buddies in lockstep must use the same iterations
+            self.stepper.adaptive = not self.activity.lockstep.enabled
+            self.stepper.advance(elapsed)
+            if self.activity.following:
+                # The leader steps the world, it is only interpolated
+                self.stepper.skip()
+                self.activity.follow_leader()
+            while self.stepper.due():
+                if not self.activity.before_step():
+                    # Lockstep waits for a buddy, try next frame
+                    self.stepper.hold()
+                    break
+                self.stepper.step(self.world)
+                steps += 1
+                # Paused frames count too, the operations scheduled
+                # for them are applied and the buddies don't wait
+                self.activity.after_step()
+            self.profiler.lap('step')
+            self.world.draw()
+
+            if self.world.run_physics:
+                self._track_pens()
+            self.profiler.lap('draw')
+
+            # Draw output from tools
+            self.currentTool.draw()
+
+            # Show Sugar like cursor for UI consistancy. It is put back
+            # each frame, but only a move needs more frames
+            if self.show_fake_cursor:
+                cursor = (pygame.mouse.get_pos(), self.cursor_picture)
+                self.add_dirty(self.screen.blit(*cursor),
+                               changed=cursor != self._cursor)
+                self._cursor = cursor
+            overlay = self.profiler.draw(self.screen)
+            if overlay is not None:
+                self.add_dirty(overlay)
+            self.profiler.lap('tools')
+
+            # Update the parts of the display that changed
+            changed = self.world.renderer.changed
+            dirty = self.world.renderer.get_dirty()
+            pygame.display.update(dirty)
+            self.profiler.lap('display')
+
+            # Keep going while something moves or is redrawn
+            snapshot = self.world.snapshot
+            awake = snapshot.state['awake'] & snapshot.dynamic()
+            busy = busy or changed or self.profiler.overlay or \
+                (self.world.run_physics and bool(awake.any()))
+        self.profiler.end(self.world, steps, self.stepper.drift)
+        return busy or self.activity.busy
+
+    def _track_pens(self):
+        # Record pen positions from the snapshot taken by world.draw()
+        snapshot = self.world.snapshot
+        pens = []
+        rows = []
+        for key, info in self.trackinfo.items():
+            # [host_body, tracker, color, destroyed?, trackdex]
+            if info[3] is False:  # Not destroyed the pen
+                row = snapshot.row(info[1])
+                if row is not None:
+                    pens.append((info[4], info[2]))
+                    rows.append(row)
+        if not pens:
+            return
+
+        state = snapshot.state[rows]
+        scale = self.world.meter_to_screen(1.0)
+        height = self.world.renderer.get_surface().get_height()
+        xs = (state['x'].astype(float) * scale).tolist()
+        ys = (height - state['y'].astype(float) * scale).tolist()
+        for (trackdex, color), posx, posy in zip(pens, xs, ys):
+            self.traces.append(trackdex, color, (posx,), (posy,))
+
+    def add_dirty(self, rect, changed=True):
+        # Tools draw straight to the screen, mark where for the next update
+        self.world.renderer.add_dirty(rect, changed)
+
     def setTool(self, tool):
         self.currentTool.cancel()
         self.currentTool = self.toolList[tool]
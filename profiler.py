@@ -0,0 +1,169 @@
+# Physics, a 2D Physics Playground for Kids
+
+#  This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Frame profiler of the main loop.
+
+PhysicsGame.run marks the end of each phase of a frame with lap(), and
+end() adds the number of physics steps and the body, joint, contact and
+awake body counts. The last frames are always kept and written now and
+then to a CSV or JSON log, so slowdowns seen in the field can be
+diagnosed without attaching a profiler. F9 draws them as an overlay on
+the canvas.
+"""
+
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+# Phases of a frame of PhysicsGame.run, in order
+PHASES = ('events', 'share', 'step', 'draw', 'tools', 'display')
+COUNTS = ('steps', 'bodies', 'joints', 'contacts', 'awake')
+COLUMNS = ('time', ) + PHASES + ('total', 'drift') + COUNTS
+# Frames kept, and averaged in the overlay
+FRAME_HISTORY = 300
+# Frames between two writes of the log
+LOG_EVERY = 300
+
+OVERLAY_COLOR = (0, 0, 0)
+OVERLAY_BACKGROUND = (255, 255, 224)
+
+
+class FrameProfiler:
+
+    def __init__(self, history=FRAME_HISTORY, log_path=None,
+                 log_every=LOG_EVERY):
+        """ Parameters:
+              history .... frames kept
+              log_path ... file the frames are written to, as JSON when
+                           it ends with .json and CSV otherwise
+              log_every .. frames between two writes of the log
+        """
+        self.overlay = False
+        self.log_path = log_path
+        self.log_every = log_every
+        self.frames = deque(maxlen=history)
+        self._times = {}
+        self._start = None
+        self._last = None
+        self._logged = 0
+        self._font = None
+
+    def toggle(self):
+        """ Show or hide the overlay, the frames are recorded anyway """
+        self.overlay = not self.overlay
+
+    def begin(self):
+        """ Start timing a frame """
+        self._times = {}
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """ Add the time since the last lap to phase """
+        if self._start is None:
+            return
+        now = time.perf_counter()
+        self._times[phase] = self._times.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def end(self, world=None, steps=0, drift=0.0):
+        """ Record the frame timed since begin()
+
+            Parameters:
+              world ... the Elements world, for its counts
+              steps ... physics steps made during the frame
+              drift ... seconds of real time not simulated so far
+        """
+        if self._start is None:
+            return
+        row = [time.time()]
+        row.extend(1000.0 * self._times.get(phase, 0.0) for phase in PHASES)
+        row.append(1000.0 * (self._last - self._start))
+        row.append(1000.0 * drift)
+        row.append(steps)
+        if world is not None:
+            # Awake dynamic bodies, from the snapshot taken for drawing
+            snapshot = world.snapshot
+            awake = snapshot.state['awake'] & snapshot.dynamic()
+            row.extend((world.world.bodyCount, world.world.jointCount,
+                        world.world.contactCount, int(awake.sum())))
+        else:
+            row.extend((0, 0, 0, 0))
+        self.frames.append(tuple(row))
+        self._start = None
+
+        self._logged += 1
+        if self.log_path and self._logged >= self.log_every:
+            self.write(self.log_path)
+
+    def averages(self):
+        """ Return the mean of each column over the frames kept """
+        if not self.frames:
+            return {}
+        count = float(len(self.frames))
+        return dict((column, sum(values) / count) for column, values in
+                    zip(COLUMNS, zip(*self.frames)))
+
+    def write(self, path):
+        """ Write the frames kept, replacing the previous log """
+        self._logged = 0
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'columns': COLUMNS,
+                           'frames': list(self.frames)}, f)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(COLUMNS)
+                writer.writerows(self.frames)
+
+    def lines(self):
+        """ Return the text of the overlay """
+        mean = self.averages()
+        if not mean:
+            return []
+        # The wait for the next frame is not counted in the total
+        return [
+            '%.1f ms/frame  %.1f steps  drift %.0f ms' % (
+                mean['total'], mean['steps'], self.frames[-1][-6]),
+            '  '.join('%s %.1f' % (phase, mean[phase]) for phase in PHASES),
+            'bodies %d  joints %d  contacts %d  awake %d' % tuple(
+                self.frames[-1][-4:]),
+        ]
+
+    def draw(self, surface, pos=(8, 8)):
+        """ Draw the overlay on surface
+
+            Return: the rect drawn, or None
+        """
+        if not self.overlay:
+            return None
+        lines = self.lines()
+        if not lines:
+            return None
+        if self._font is None:
+            self._font = pygame.font.Font(None, 20)
+        images = [self._font.render(line, True, OVERLAY_COLOR,
+                                    OVERLAY_BACKGROUND) for line in lines]
+        x, y = pos
+        rect = pygame.Rect(x, y, max(image.get_width() for image in images),
+                           sum(image.get_height() for image in images))
+        for image in images:
+            surface.blit(image, (x, y))
+            y += image.get_height()
+        return rect
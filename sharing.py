@@ -0,0 +1,644 @@
+# Physics, a 2D Physics Playground for Kids
+
+#  This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Late-join synchronisation of a shared Physics activity.
+
+The leader answers CollabWrapper's init request with the current world in
+the binary format, compressed, instead of a replay of every message. Each
+shared operation carries an id, and the snapshot lists the ids already
+in it, so a buddy joining holds the operations received while waiting
+and applies only the ones the snapshot is missing: the delta stream.
+
+Operations sent during a frame are framed into one batch message by
+pack(), and unpack() splits them again at the other end.
+
+In the opt-in lockstep mode every buddy steps the world by whole
+PHYSICS_DT frames, and each operation, including the sender's own, is
+applied at the frame it is tagged with. See Lockstep. The leader chooses
+it by starting the activity with PHYSICS_SYNC=lockstep in the
+environment, see sync_mode().
+
+In the opt-in state broadcast only the leader steps the world. It posts
+the quantized transforms of the bodies which moved, and the buddies
+interpolate between them. See StateBroadcast and StateFollower. The
+leader chooses it with PHYSICS_SYNC=broadcast. Bodies are known there by
+an id kept in their userData, made of the id of the operation which
+made them, see tag_bodies().
+"""
+
+import os
+import time
+import uuid
+import zlib
+import base64
+import struct
+import hashlib
+import logging
+from collections import deque
+
+import Box2D as box2d
+
+SYNC_VERSION = 1
+BATCH_VERSION = 1
+# Batches of operations tagged with the frame they apply at
+FRAMED_BATCH_VERSION = 2
+# Largest text of operations put in one batch message
+MAX_BATCH_TEXT = 16384
+# Ids of recent operations sent along with a snapshot
+HISTORY = 256
+# Operations held while waiting for a snapshot before giving up on it
+MAX_HELD = 1000
+
+# Environment variable with the sync mode of the leader, buddies joining
+# follow the leader's mode
+SYNC_VARIABLE = 'PHYSICS_SYNC'
+# Operations are applied as they arrive, the default
+SYNC_OPERATIONS = 'operations'
+# Operations are applied at the same frame by every buddy, opt-in
+SYNC_LOCKSTEP = 'lockstep'
+# Only the leader steps the world and broadcasts it, opt-in
+SYNC_BROADCAST = 'broadcast'
+SYNC_MODES = (SYNC_OPERATIONS, SYNC_LOCKSTEP, SYNC_BROADCAST)
+# Frames between an operation and the frame it is applied at, so that it
+# reaches every buddy in time (15 frames are 125 ms at 120 Hz)
+LOCKSTEP_DELAY = 15
+# Frames between two state hashes compared with the buddies
+HASH_INTERVAL = 120
+# Seconds without news from a buddy before not waiting for it any more
+PEER_TIMEOUT = 5.0
+
+# Seconds between two broadcasts
+STATE_INTERVAL = 0.1
+# Quantum of positions in meters and of angles in radians
+STATE_POSITION_STEP = 0.001
+STATE_ANGLE_STEP = 0.001
+# Movement below which a body is not sent again, in quanta
+STATE_THRESHOLD = 5
+# Bodies in one broadcast, those which moved most go first
+MAX_STATE_BODIES = 300
+# Seconds a body broadcast may stay unknown to a buddy, before it asks
+# the leader for the world again
+STATE_TIMEOUT = 2.0
+# Key of the id of a body in its userData
+BODY_ID = 'sync_id'
+
+
+def sync_mode(value=None):
+    """ Return the sync mode named by value, by default the one of the
+        PHYSICS_SYNC environment variable, SYNC_OPERATIONS when empty
+
+        Raises ValueError for an unknown mode, or for several modes, like
+        lockstep and broadcast which exclude each other.
+    """
+    if value is None:
+        value = os.environ.get(SYNC_VARIABLE, '')
+    modes = set(mode.strip().lower() for mode in value.split(','))
+    modes.discard('')
+    for mode in modes:
+        if mode not in SYNC_MODES:
+            raise ValueError('Unknown sync mode %r, not one of %s' % (
+                mode, ', '.join(SYNC_MODES)))
+    if len(modes) > 1:
+        raise ValueError('Sync modes %s cannot be used together' %
+                         ' and '.join(sorted(modes)))
+    return modes.pop() if modes else SYNC_OPERATIONS
+
+
+def pack(ops, limit=MAX_BATCH_TEXT):
+    """ Frame the operations sent during a frame into batch messages
+
+        Parameters:
+          ops ..... operation messages, dict(action='text', text, id)
+          limit ... maximum length of the texts in one batch
+
+        Return: list of messages to post. A lone operation is posted as
+        it is, which older versions understand.
+    """
+    if len(ops) == 1:
+        return list(ops)
+    framed = any('frame' in op for op in ops)
+    messages = []
+    batch = []
+    size = 0
+    for op in ops:
+        if batch and size + len(op['text']) > limit:
+            messages.append(_batch(batch, framed))
+            batch = []
+            size = 0
+        if framed:
+            batch.append([op.get('id'), op['text'], op.get('frame')])
+        else:
+            batch.append([op.get('id'), op['text']])
+        size += len(op['text'])
+    if batch:
+        messages.append(_batch(batch, framed))
+    return messages
+
+
+def _batch(ops, framed=False):
+    version = FRAMED_BATCH_VERSION if framed else BATCH_VERSION
+    return {'action': 'batch', 'version': version, 'ops': ops}
+
+
+def unpack(msg):
+    """ Return the operation messages in a message from pack() """
+    action = msg.get('action')
+    if action == 'text':
+        return [msg]
+    if action == 'batch':
+        version = msg.get('version')
+        if version == BATCH_VERSION:
+            return [{'action': 'text', 'text': text, 'id': op_id}
+                    for op_id, text in msg['ops']]
+        if version == FRAMED_BATCH_VERSION:
+            ops = []
+            for op_id, text, frame in msg['ops']:
+                op = {'action': 'text', 'text': text, 'id': op_id}
+                if frame is not None:
+                    op['frame'] = frame
+                ops.append(op)
+            return ops
+        logging.warning('Ignoring batch of version %r', version)
+        return []
+    return []
+
+
+def state_hash(world):
+    """ Return a digest of the position and velocity of every body of a
+        Box2D world, the same on every buddy as long as they agree
+    """
+    digest = hashlib.sha1()
+    for body in world.bodies:
+        x, y = body.position
+        vx, vy = body.linearVelocity
+        digest.update(struct.pack('<6d', x, y, body.angle, vx, vy,
+                                  body.angularVelocity))
+    return digest.hexdigest()[:16]
+
+
+class WorldSync:
+
+    def __init__(self, get_snapshot, set_snapshot, history=HISTORY,
+                 max_held=MAX_HELD):
+        """ Parameters:
+              get_snapshot .. returns the world as bytes
+              set_snapshot .. replaces the world with such bytes
+        """
+        self._get_snapshot = get_snapshot
+        self._set_snapshot = set_snapshot
+        self.peer = uuid.uuid4().hex[:8]
+        self._count = 0
+        self._recent = deque()
+        self._applied = set()
+        self._history = history
+        self._max_held = max_held
+        self._held = []
+        self.waiting = False
+
+    def new_id(self):
+        """ Return an id for an operation sent from here """
+        self._count += 1
+        return '%s:%d' % (self.peer, self._count)
+
+    def applied(self, op_id):
+        """ Record that the operation op_id is in the world """
+        if op_id is None or op_id in self._applied:
+            return
+        self._applied.add(op_id)
+        self._recent.append(op_id)
+        if len(self._recent) > self._history:
+            self._applied.discard(self._recent.popleft())
+
+    def is_applied(self, op_id):
+        return op_id is not None and op_id in self._applied
+
+    def wait(self):
+        """ Hold incoming operations until set_data() is called """
+        self.waiting = True
+        self._held = []
+
+    def receive(self, msg):
+        """ Return the messages to apply now that msg was received """
+        if not self.waiting:
+            return [msg]
+        self._held.append(msg)
+        if len(self._held) > self._max_held:
+            logging.warning('No world from the leader, applying %d held '
+                            'operations', len(self._held))
+            return self._release()
+        return []
+
+    def _release(self):
+        held = self._held
+        self._held = []
+        self.waiting = False
+        return held
+
+    def get_data(self, reload=False):
+        """ Return the world for CollabWrapper, which sends it as JSON
+
+            Parameters:
+              reload .. also replace the world here with the one sent, as
+                        lockstep needs: Box2D keeps contacts between
+                        steps which the snapshot does not carry, and a
+                        world continued here would step differently
+                        from the one the buddy rebuilds
+        """
+        snapshot = self._get_snapshot()
+        if reload:
+            self._set_snapshot(snapshot)
+        data = zlib.compress(snapshot)
+        return {'version': SYNC_VERSION,
+                'world': base64.b64encode(data).decode('ascii'),
+                'applied': list(self._recent)}
+
+    def set_data(self, data):
+        """ Load the world from get_data()
+
+            Return: the held messages which are not in the world yet, to
+            be applied in order
+        """
+        if data.get('version') == SYNC_VERSION and 'world' in data:
+            self._set_snapshot(zlib.decompress(
+                base64.b64decode(data['world'])))
+            # What is in the world is now what the leader had
+            self._applied = set()
+            self._recent = deque()
+            for op_id in data.get('applied', []):
+                self.applied(op_id)
+        elif data:
+            logging.warning('Ignoring world of sync version %r',
+                            data.get('version'))
+        # Operations without an id come from older versions, keep them
+        return [msg for msg in self._release()
+                if not self.is_applied(msg.get('id'))]
+
+
+def _op_order(msg):
+    # Operations for the same frame are applied in the same order
+    # everywhere: by buddy, then in the order each buddy sent them
+    peer, _, count = (msg.get('id') or '').partition(':')
+    return (peer, int(count) if count.isdigit() else 0)
+
+
+class Lockstep:
+    """ Deterministic lockstep of a shared simulation
+
+        Every buddy steps the world by whole PHYSICS_DT frames. An
+        operation made at frame n is tagged with frame n + delay and
+        applied there by all, including the sender, so the worlds stay
+        the same without sending any body state.
+
+        Buddies post tick() messages with the frame they reached. Frames
+        before the lowest reported frame + delay have all their
+        operations received, so can_step() lets a buddy run ahead of the
+        others by delay frames at most. Every hash_interval frames the
+        state is hashed and compared, and a difference is logged and
+        kept in diverged, for the buddy to ask the leader for its world.
+
+        Lockstep is started by the leader when it sends the world to a
+        buddy joining, and by the buddy once it loaded that world, both
+        at the leader's frame and with the world rebuilt from the same
+        snapshot (see WorldSync.get_data).
+    """
+
+    def __init__(self, delay=LOCKSTEP_DELAY, hash_interval=HASH_INTERVAL,
+                 timeout=PEER_TIMEOUT):
+        self.enabled = False
+        self.frame = 0
+        self.delay = delay
+        self.hash_interval = hash_interval
+        self.timeout = timeout
+        self.diverged = None  # first frame found different
+        self._scheduled = {}  # frame -> operations
+        self._peers = {}  # buddy -> [frame reported, time of report]
+        self._hashes = {}  # frame -> hash, of the recent frames
+        self._remote = {}  # frame -> {buddy: hash}, not checked yet
+        self._reported = None
+        self._tick_time = 0
+        self._hash = None  # last hash not posted yet
+
+    def start(self, frame=0):
+        self.enabled = True
+        self.frame = frame
+        self.diverged = None
+        self._hashes = {}
+        self._remote = {}
+        self._reported = None
+        self._hash = None
+
+    def stop(self):
+        """ Leave lockstep, returning the operations still scheduled in
+            the order they would have been applied
+        """
+        self.enabled = False
+        ops = []
+        for frame in sorted(self._scheduled):
+            ops.extend(sorted(self._scheduled[frame], key=_op_order))
+        self._scheduled = {}
+        self._peers = {}
+        return ops
+
+    def tag(self, msg):
+        """ Schedule an operation made here, see schedule() """
+        msg['frame'] = self.frame + self.delay
+        self.schedule(msg)
+
+    def schedule(self, msg):
+        """ Keep an operation until the frame it is tagged with """
+        frame = msg.get('frame', self.frame)
+        if frame < self.frame:
+            logging.warning('Operation %s for frame %d arrived at frame %d',
+                            msg.get('id'), frame, self.frame)
+            frame = self.frame
+        self._scheduled.setdefault(frame, []).append(msg)
+
+    def due(self):
+        """ Return the operations to apply before stepping this frame """
+        return sorted(self._scheduled.pop(self.frame, []), key=_op_order)
+
+    def pending(self):
+        """ Return the operations scheduled for later frames """
+        return [msg for frame in sorted(self._scheduled)
+                for msg in self._scheduled[frame]]
+
+    def can_step(self, now=None):
+        """ Return whether every operation for this frame was received """
+        if now is None:
+            now = time.monotonic()
+        for buddy, (frame, when) in list(self._peers.items()):
+            if now - when > self.timeout:
+                logging.warning('No tick from %s since frame %d, '
+                                'not waiting for it', buddy, frame)
+                del self._peers[buddy]
+            elif self.frame >= frame + self.delay:
+                return False
+        return True
+
+    def stepped(self, world):
+        """ Count a frame once the world was stepped, hashing it every
+            hash_interval frames
+        """
+        self.frame += 1
+        if self.frame % self.hash_interval:
+            return
+        value = state_hash(world)
+        self._hashes[self.frame] = value
+        self._hash = [self.frame, value]
+        for buddy, remote in self._remote.pop(self.frame, {}).items():
+            self._compare(buddy, self.frame, remote)
+        # Buddies run delay frames apart at most
+        oldest = self.frame - self.hash_interval * 4
+        for frames in (self._hashes, self._remote):
+            for frame in [f for f in frames if f < oldest]:
+                del frames[frame]
+
+    def tick(self, peer, now=None):
+        """ Return the message telling the buddies the frame reached, or
+            None when nothing changed since the last one. A buddy held
+            back keeps ticking now and then, so the others wait for it.
+            Paused frames are counted like the others, the simulation is
+            run or paused by an operation for every buddy at its frame.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._reported == self.frame and self._hash is None and \
+                now - self._tick_time < self.timeout / 4:
+            return None
+        self._reported = self.frame
+        self._tick_time = now
+        msg = {'action': 'tick', 'peer': peer, 'frame': self.frame}
+        if self._hash is not None:
+            msg['hash'] = self._hash
+            self._hash = None
+        return msg
+
+    def receive_tick(self, msg, now=None):
+        if now is None:
+            now = time.monotonic()
+        buddy = msg['peer']
+        self._peers[buddy] = [msg['frame'], now]
+        if 'hash' in msg:
+            frame, value = msg['hash']
+            if frame in self._hashes:
+                self._compare(buddy, frame, value)
+            elif frame > self.frame:
+                self._remote.setdefault(frame, {})[buddy] = value
+
+    def _compare(self, buddy, frame, value):
+        if value == self._hashes[frame]:
+            return
+        logging.error('World of %s differs at frame %d', buddy, frame)
+        if self.diverged is None:
+            self.diverged = frame
+
+    def get_data(self, peer):
+        """ Return what a buddy joining needs to follow the leader """
+        return {'frame': self.frame, 'peer': peer,
+                'scheduled': self.pending()}
+
+    def set_data(self, data, now=None):
+        """ Start at the leader's frame, with its scheduled operations
+            and waiting for it
+        """
+        if now is None:
+            now = time.monotonic()
+        self.start(data['frame'])
+        self._peers[data['peer']] = [data['frame'], now]
+        for msg in data.get('scheduled', []):
+            self.schedule(msg)
+
+
+def tag_bodies(bodies, op_id):
+    """ Give an id to the bodies which move and have none yet, the id of
+        the operation which made them and their ordinal among them. The
+        buddies applying the operation make its bodies in the same order.
+
+        Return: the number of bodies tagged
+    """
+    count = 0
+    for body in bodies:
+        if body.type == box2d.b2_staticBody or \
+                not isinstance(body.userData, dict) or \
+                BODY_ID in body.userData:
+            continue
+        body.userData[BODY_ID] = '%s/%d' % (op_id, count)
+        count += 1
+    return count
+
+
+def body_id(body):
+    """ Return the id given by tag_bodies(), or None """
+    if isinstance(body.userData, dict):
+        return body.userData.get(BODY_ID)
+    return None
+
+
+def bodies_by_id(bodies):
+    """ Return a dict of the bodies with an id, by their id """
+    ids = [(body_id(body), body) for body in bodies]
+    return dict((key, body) for key, body in ids if key is not None)
+
+
+def _quantize(body):
+    x, y = body.position
+    return (int(round(x / STATE_POSITION_STEP)),
+            int(round(y / STATE_POSITION_STEP)),
+            int(round(body.angle / STATE_ANGLE_STEP)))
+
+
+class StateBroadcast:
+    """ The leader's side of the state broadcast
+
+        Bodies are known by their id, see tag_bodies(), the same on every
+        buddy once the shared operations are applied. Bodies without one
+        are not sent.
+    """
+
+    def __init__(self, interval=STATE_INTERVAL, threshold=STATE_THRESHOLD,
+                 max_bodies=MAX_STATE_BODIES):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_bodies = max_bodies
+        self._last = {}  # body -> quantized transform sent
+        self._rested = set()  # bodies asleep where they were last sent
+        self._time = None
+
+    def reset(self):
+        """ Send every body again, to a buddy joining """
+        self._last = {}
+        self._rested = set()
+
+    def state(self, world, now=None):
+        """ Return the state message to post, or None when it is not
+            time yet or nothing moved
+
+            Parameters:
+              world ... Box2D world
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._time is not None and now - self._time < self.interval:
+            return None
+        self._time = now
+
+        bodies = world.bodies
+        moved = []
+        for body in bodies:
+            key = body_id(body)
+            if body.type == box2d.b2_staticBody or key is None:
+                continue
+            last = self._last.get(body)
+            if last is not None and not body.awake and body in self._rested:
+                continue
+            current = _quantize(body)
+            if last is None:
+                distance = self.threshold
+            else:
+                distance = max(abs(a - b) for a, b in zip(current, last))
+                # A body falling asleep is sent once more, where it stopped
+                if distance < (self.threshold if body.awake else 1):
+                    if not body.awake:
+                        self._rested.add(body)
+                    continue
+            moved.append((distance, key, body, current))
+        if not moved:
+            return None
+
+        moved.sort(key=lambda item: item[0], reverse=True)
+        values = []
+        for distance, key, body, current in moved[:self.max_bodies]:
+            self._last[body] = current
+            self._rested.discard(body)
+            values.extend((key, ) + current)
+        # Forget destroyed bodies, Box2D reuses their addresses
+        live = set(bodies)
+        for body in [body for body in self._last if body not in live]:
+            del self._last[body]
+        self._rested &= live
+        return {'action': 'state', 'bodies': values}
+
+
+class StateFollower:
+    """ A buddy's side of the state broadcast, moving the bodies between
+        the transforms received over one interval
+    """
+
+    def __init__(self, interval=STATE_INTERVAL, timeout=STATE_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self._moves = {}  # body id -> (from, to, time received)
+        self._unknown = {}  # body id -> time first received
+
+    @property
+    def moving(self):
+        return bool(self._moves)
+
+    def reset(self):
+        """ Forget the moves and the unknown bodies, with a new world """
+        self._moves = {}
+        self._unknown = {}
+
+    def receive(self, msg, world, now=None):
+        """ Take the transforms of a state message, for the bodies known
+            here. A body may be broadcast before the operation which
+            makes it arrives.
+
+            Return: False when a body stayed unknown for timeout seconds,
+            the world is not the leader's and must be loaded again
+        """
+        if now is None:
+            now = time.monotonic()
+        values = msg['bodies']
+        bodies = bodies_by_id(world.bodies)
+        for i in range(0, len(values), 4):
+            key, qx, qy, qa = values[i:i + 4]
+            body = bodies.get(key)
+            if body is None:
+                self._unknown.setdefault(key, now)
+                continue
+            self._unknown.pop(key, None)
+            x, y = body.position
+            start = (x, y, body.angle)
+            end = (qx * STATE_POSITION_STEP, qy * STATE_POSITION_STEP,
+                   qa * STATE_ANGLE_STEP)
+            self._moves[key] = (start, end, now)
+        for key in [b for b in self._unknown if b in bodies]:
+            del self._unknown[key]
+        if any(now - when >= self.timeout
+               for when in self._unknown.values()):
+            logging.debug('Bodies %s unknown here',
+                          ', '.join(sorted(self._unknown)))
+            return False
+        return True
+
+    def apply(self, world, now=None):
+        """ Move the bodies to where they are at time now """
+        if now is None:
+            now = time.monotonic()
+        bodies = bodies_by_id(world.bodies)
+        done = []
+        for key, (start, end, when) in self._moves.items():
+            if key not in bodies:
+                done.append(key)
+                continue
+            t = min((now - when) / self.interval, 1.0)
+            x, y, angle = [a + (b - a) * t for a, b in zip(start, end)]
+            bodies[key].transform = ((x, y), angle)
+            if t >= 1.0:
+                done.append(key)
+        for key in done:
+            del self._moves[key]
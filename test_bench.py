@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark suite.
+
+Usage:
+    python3 -m pytest test_bench.py
+"""
+
+import pytest
+
+import bench
+
+
+def test_measure():
+    result = bench.measure('motors_and_pins', steps=10, repeat=1)
+    assert result['bodies'] > 60 and result['joints'] == 60
+    for metric, higher_is_better in bench.METRICS:
+        assert result[metric] > 0
+
+
+def test_compare():
+    baseline = {'a': {'steps_per_second': 1000.0, 'draw_ms': 10.0,
+                      'peak_mb': 50.0}}
+    results = [{'scene': 'a', 'steps_per_second': 700.0, 'draw_ms': 11.0,
+                'peak_mb': 80.0},
+               {'scene': 'new', 'steps_per_second': 1.0}]
+    regressions = bench.compare(results, baseline, threshold=0.2)
+    assert [(scene, metric) for scene, metric, old, new, change in
+            regressions] == [('a', 'steps_per_second'), ('a', 'peak_mb')]
+    assert bench.compare(results, baseline, threshold=1.0) == []
+
+
+def test_missing_baseline(tmp_path):
+    # A baseline asked for must exist, or nothing would be compared
+    with pytest.raises(SystemExit) as error:
+        bench.main(['--baseline', str(tmp_path / 'none.json'),
+                    'motors_and_pins'])
+    assert error.value.code != 0
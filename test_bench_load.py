@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Tests for the load benchmark.
+
+Usage:
+    python3 -m pytest test_bench_load.py
+"""
+
+import bench_load
+
+
+def test_chain_model():
+    # Chains made by Add.chain: balls and distance joints
+    model = bench_load.make_chain_model(90, links=40)
+    assert len(model['bodylist']) == 90
+    assert len(model['jointlist']) == 90
+    assert all(shape['type'] == 'circle' for body in model['bodylist']
+               for shape in body['shapes'])
+    assert all(joint['type'] == 'distance' for joint in model['jointlist'])
+    # Each of the three chains is held by the ground
+    assert [joint['body1'] for joint in model['jointlist']].count(0) == 3
+
+
+def test_run():
+    results = bench_load.run(bodies=[100], links=20)
+    assert len(results) == 1
+    result = results[0]
+    assert result['bodies'] == 100 and result['joints'] == 100
+    assert result['json'] > 0 and result['binary'] > 0
+    assert result['binary_bytes'] < result['json_bytes']
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Tests for the Elements wrapper around Box2D, without a display.
+
+Usage:
+    python3 -m pytest test_elements.py
+"""
+
+import os
+import math
+
+import Box2D as box2d
+import myelements as elements
+from myelements import worldfile
+
+SAMPLES = os.path.join(os.path.dirname(__file__), 'samples')
+
+
+def make_world(sample=None):
+    world = elements.Elements((1200, 750), renderer=None)
+    if sample is None:
+        world.add.ground()
+    else:
+        world.json_load(os.path.join(SAMPLES, sample), serialized=True)
+    return world
+
+
+def test_snapshot_matches_bodies():
+    world = make_world('example-2.json')
+    for i in range(30):
+        world.update(fps=120)
+    snapshot = world.capture_state()
+    state = snapshot.state
+    assert len(state) == world.world.bodyCount
+    for i, body in enumerate(world.world.bodies):
+        assert snapshot.row(body) == i
+        assert state['x'][i] == body.position.x
+        assert state['y'][i] == body.position.y
+        assert state['angle'][i] == body.angle
+        assert state['vx'][i] == body.linearVelocity.x
+        assert state['awake'][i] == body.awake
+        assert state['type'][i] == body.type
+
+
+def test_snapshot_ids_are_stable():
+    world = make_world()
+    balls = [world.add.ball((100 + 50 * i, 100), 20) for i in range(100)]
+    before = world.capture_state()
+    ids = dict((body, before.state['id'][before.row(body)])
+               for body in balls)
+    world.world.DestroyBody(balls[0])
+    after = world.capture_state()
+    assert after.row(balls[1]) is not None
+    for body in balls[1:]:
+        assert after.state['id'][after.row(body)] == ids[body]
+    assert after.dynamic().sum() == 99
+    assert world.world.bodyCount == after.count
+    assert box2d.b2_staticBody in after.state['type']
+
+
+def test_geometry_follows_bodies():
+    world = make_world()
+    ball = world.add.ball((100, 100), 20)
+    snapshot = world.capture_state()
+    circles, vertices = world.geometry.transform(snapshot)
+    assert len(circles) == 1
+    assert tuple(circles[0]) == tuple(ball.worldCenter)
+
+    # Box2D reuses the address of a destroyed body straight away
+    world.world.DestroyBody(ball)
+    box = world.add.rect((300, 100), 20, 10, angle=30)
+    world.world.Step(1.0 / 120, 10, 8)
+    snapshot = world.capture_state()
+    circles, vertices = world.geometry.transform(snapshot)
+    assert len(circles) == 0
+    expected = [box.transform * v for v in box.fixtures[0].shape.vertices]
+    for shape in world.geometry.shapes:
+        if snapshot.bodies[shape[1]] == box:
+            placed = vertices[shape[2]:shape[3]]
+    assert len(placed) == len(expected)
+    for (x, y), v in zip(placed, expected):
+        assert abs(x - v.x) < 1e-5 and abs(y - v.y) < 1e-5
+
+
+def test_retained_layer():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    world = elements.Elements((400, 300))
+    world.renderer.set_surface(pygame.Surface((400, 300)))
+    world.renderer.set_retained(True, (240, 240, 240))
+    world.add.ground()
+    world.add.ball((100, 100), 20)
+
+    world.draw()
+    assert world.renderer.get_dirty()[0].size == (400, 300)
+    for i in range(2):
+        world.update()
+        world.draw()
+        dirty = world.renderer.get_dirty()
+    # Only the old and new places of the falling ball
+    assert len(dirty) == 2 and dirty[0].width < 400
+
+    world.run_physics = False
+    world.draw()
+    world.renderer.get_dirty()
+    world.draw()
+    assert world.renderer.get_dirty() == []  # everything settled
+
+    # Something put back over the layer each frame, like the cursor, is
+    # updated but is no change once it stays at the same place
+    rect = pygame.Rect(10, 10, 8, 8)
+    world.draw()
+    world.renderer.add_dirty(rect)
+    assert world.renderer.changed
+    world.renderer.get_dirty()
+    world.draw()
+    world.renderer.add_dirty(rect, changed=False)
+    assert not world.renderer.changed
+    assert world.renderer.get_dirty() == [rect, rect]
+
+
+def test_binary_round_trip(tmp_path):
+    world = make_world('example-2.json')
+    for i in range(30):
+        world.update(fps=120)
+    traces = [[1.5, 2.5, 3.5, 4.5], []]
+    path = str(tmp_path / 'project')
+    json_path = str(tmp_path / 'project.json')
+    world.binary_save(path, {'full_pos_list': traces, 'answer': 42})
+    world.json_save(json_path, {'full_pos_list': traces, 'answer': 42})
+    assert worldfile.is_binary(path)
+    assert not worldfile.is_binary(json_path)
+
+    # Both formats load the same world
+    loaded = make_world()
+    loaded.load(path)
+    expected = make_world()
+    expected.load(json_path)
+    assert loaded.get_world_model()['bodylist'] == \
+        expected.get_world_model()['bodylist']
+    assert loaded.get_world_model()['jointlist'] == \
+        expected.get_world_model()['jointlist']
+    assert loaded.additional_vars['answer'] == 42
+    assert [t.tolist() for t in loaded.additional_vars['full_pos_list']] == \
+        traces
+
+
+def test_load_resolves_saveids(tmp_path):
+    from bench_load import make_chain_model
+    model = make_chain_model(120, links=40)
+    path = str(tmp_path / 'chains')
+    worldfile.write(path, model)
+    world = make_world()
+    world.load(path)
+    assert world.world.bodyCount == 121
+    assert world.world.jointCount == 120
+    ground = world.world.groundBody
+    pinned = [joint for joint in world.world.joints
+              if joint.bodyA == ground]
+    assert len(pinned) == 3
+    for joint in world.world.joints:
+        if joint.bodyA != ground:
+            # Each link hangs from the one left of it
+            assert joint.bodyA.position.x < joint.bodyB.position.x
+
+
+def test_picking():
+    world = make_world()
+    under = world.add.ball((200, 200), 30)
+    over = world.add.ball((210, 200), 30)
+    apart = world.add.ball((400, 200), 10)
+    world.capture_state()  # as drawn, later rows on top
+    snapshot = world.snapshot
+    top = max((under, over), key=snapshot.row)
+    assert world.get_bodies_at_pos((205, 200)) == \
+        [top, under if top == over else over]
+    assert world.get_bodies_at_pos((300, 200)) == []
+    assert world.get_bodies_in_radius((300, 200), 10) == []
+    assert world.get_bodies_in_radius((375, 200), 20) == [apart]
+    # A stroke between two empty points finds what it crosses
+    assert world.get_bodies_along([(400, 100), (400, 300)]) == [apart]
+    assert world.get_bodies_along([(300, 100), (300, 300)]) == []
+    assert world.get_bodies_along([(300, 100), (300, 300)], 80) != []
+    assert len(world.picker.fixtures_at((205, 200))) == 2
+    assert len(world.picker.fixtures_at((400, 200))) == 1
+
+
+def test_fixtures_at_points():
+    world = make_world()
+    under = world.add.ball((200, 200), 30)
+    world.add.ball((210, 200), 30)
+    apart = world.add.ball((400, 200), 10)
+    points = [(205, 200), (300, 200), (400, 200), (175, 200)]
+    hits = world.picker.fixtures_at_points(points)
+    assert [len(fixtures) for fixtures in hits] == [2, 0, 1, 1]
+    # The same as one point at a time
+    assert hits == [world.picker.fixtures_at(pos) for pos in points]
+    assert world.picker.fixtures_at_points([]) == []
+    bodies = world.get_bodies_at_points(points)
+    assert bodies[2] == [apart] and bodies[3] == [under]
+    # Static bodies only when asked
+    assert world.get_bodies_at_points([(10, 745)]) == [[]]
+    assert world.get_bodies_at_points([(10, 745)], include_static=True)
+
+
+def test_pin_index():
+    world = make_world()
+    ball = world.add.ball((200, 200), 20)
+    other = world.add.ball((600, 200), 20)
+    world.add.joint(ball, (200, 200))
+    world.add.motor(other, (600, 200))
+    world.add.joint(ball, other, (200, 200), (600, 200))  # distance joint
+    assert len(world.pins) == 2
+    pins = world.get_pins_at_pos((202, 198), 5)
+    assert len(pins) == 1 and pins[0].bodyB == ball
+    assert world.get_pins_at_pos((400, 200), 5) == []
+
+    world.destroy_joint(pins[0])
+    assert world.get_pins_at_pos((200, 200), 5) == []
+    # Joints destroyed with their body leave the index too
+    world.world.DestroyBody(other)
+    assert len(world.pins) == 0
+
+
+def test_step_controller():
+    from myelements.stepper import StepController, ITERATIONS
+    world = make_world('example-2.json')
+    stepper = StepController(max_steps=4, budget=1.0)
+    stepper.advance(0.05)
+    steps = 0
+    while stepper.due():
+        stepper.step(world)
+        steps += 1
+    # Capped, the rest is caught up later while within the budget
+    assert steps == 4
+    assert stepper.drift == 0.0
+    stepper.advance(0.0)
+    while stepper.due():
+        stepper.step(world)
+        steps += 1
+    assert steps == 7
+
+    # Cheap steps keep up with real time at slow frames
+    stepper = StepController()
+    for frame in range(100):
+        stepper.advance(0.040)
+        while stepper.due():
+            stepper.step(world)
+    assert stepper.drift == 0.0
+    assert abs(stepper.simulated - stepper.real) <= stepper.dt
+
+    # Over the budget, the steps due are dropped
+    stepper = StepController(budget=1e-9)
+    stepper.advance(0.05)
+    while stepper.due():
+        stepper.step(world)
+    assert stepper.simulated == stepper.dt
+    assert stepper.drift > 0.04
+
+    # A step cost above the budget lowers the iterations
+    stepper = StepController(budget=1e-9)
+    for frame in range(len(ITERATIONS)):
+        stepper.advance(0.033)
+        while stepper.due():
+            stepper.step(world)
+    assert stepper.level == len(ITERATIONS) - 1
+    stepper.adaptive = False
+    stepper.advance(0.033)
+    assert stepper.vel_iterations == ITERATIONS[0][0]
+
+
+def test_settled_scene():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    world = elements.Elements((400, 300))
+    world.renderer.set_surface(pygame.Surface((400, 300)))
+    world.renderer.set_retained(True, (240, 240, 240))
+    world.add.ground()
+    ball = world.add.ball((100, 250), 20)
+    world.add.joint(ball, (100, 250))
+    assert not world.is_settled()
+
+    for i in range(600):
+        world.update(fps=120)
+        if not ball.awake:
+            break
+    world.draw()
+    world.renderer.get_dirty()
+    assert world.is_settled()
+    world.draw()
+    # Joints are in the cached layer, nothing is redrawn
+    assert world.renderer.get_dirty() == []
+    position = tuple(ball.position)
+    world.update(fps=120)
+    assert tuple(ball.position) == position
+
+    world.wake()
+    world.draw()
+    world.renderer.get_dirty()
+    world.add.motor(ball, (100, 250), speed=5)
+    assert not world.is_settled()
+    world.destroy_joint(world.pins.motors()[0])
+    world.draw()
+    assert world.renderer.get_dirty()  # the layer without the motor
+
+
+def test_convex_decomposition():
+    from myelements import tools_poly
+    ell = [(0, 0), (100, 0), (100, 20), (20, 20), (20, 100), (0, 100)]
+    pieces = tools_poly.decompose_poly(ell)
+    assert len(pieces) == 2
+    area = sum(tools_poly.poly_area(piece) for piece in pieces)
+    assert abs(area - tools_poly.poly_area(ell)) < 1e-9
+    # A bow tie crosses itself
+    assert tools_poly.decompose_poly([(0, 0), (10, 10), (10, 0), (0, 10)]) \
+        == []
+
+    world = make_world()
+    star = []
+    for i in range(24):
+        angle = 2 * math.pi * i / 24
+        radius = 80 if i % 2 else 40
+        star.append((300 + radius * math.cos(angle),
+                     300 + radius * math.sin(angle)))
+    star.append(star[0])
+    body = world.add.concavePoly(star)
+    assert len(body.fixtures) < 24
+    for fixture in body.fixtures:
+        assert isinstance(fixture.shape, box2d.b2PolygonShape)
+        assert len(fixture.shape.vertices) <= box2d.b2_maxPolygonVertices
+    mass = sum(fixture.massData.mass for fixture in body.fixtures)
+    assert abs(mass - tools_poly.poly_area(star[:-1]) / world.ppm ** 2) < 1e-3
+
+    # Open strokes are still made of lines
+    line = world.add.concavePoly(star[:12])
+    assert any(isinstance(fixture.shape, box2d.b2CircleShape)
+               for fixture in line.fixtures)
+
+
+def test_bulk_creation():
+    world = make_world()
+    positions = [(20 * i + 10, 100 + 5 * i) for i in range(100)]
+    balls = world.add.balls(positions, 6, friction=[0.1, 0.9] * 50)
+    assert len(balls) == 100
+    # One prototype per material of the same shape, and the ground
+    assert len(world.add._fixture_defs) == 3
+    single = world.add.ball(positions[3], 6, friction=0.9)
+    assert tuple(single.position) == tuple(balls[3].position)
+    assert single.fixtures[0].shape.radius == balls[3].fixtures[0].shape.radius
+    assert single.fixtures[0].friction == balls[3].fixtures[0].friction
+    # Each body has its own userData
+    assert balls[0].userData is not balls[1].userData
+
+    boxes = world.add.rects(positions[:2], [10, 20], 5, angles=[0, 90])
+    box = world.add.rect(positions[1], 20, 5, angle=90)
+    assert tuple(boxes[1].position) == tuple(box.position)
+    vertices = box.fixtures[0].shape.vertices
+    assert boxes[1].fixtures[0].shape.vertices == vertices
+
+
+def test_chain():
+    from myelements.locals import CHAIN_ROPE, CHAIN_REVOLUTE
+    world = make_world()
+    end1 = world.add.ball((100, 100), 8)
+    end2 = world.add.ball((300, 100), 8)
+    joints = world.world.jointCount
+    links = world.add.chain([(100, 100), (300, 100)], 20, 6,
+                            bodies=[end1, end2])
+    # A ball every 20 pixels from 10 pixels on, joined one to the next
+    assert len(links) == 10
+    assert world.world.jointCount == joints + 11
+    single = world.add.ball((110, 100), 6)
+    assert tuple(links[0].position) == tuple(single.position)
+    assert all(isinstance(joint, box2d.b2DistanceJoint)
+               for joint in world.world.joints)
+
+    # New balls at the vertices, and a closing segment
+    square = [(500, 100), (600, 100), (600, 200), (500, 200)]
+    joints = world.world.jointCount
+    balls = world.add.chain(square, 20, 6, closed=True, joint=CHAIN_ROPE)
+    assert len(balls) == 4 + 4 * 5
+    assert world.world.jointCount == joints + 4 * 6
+    assert isinstance(world.world.joints[-1], box2d.b2RopeJoint)
+
+    balls = world.add.chain(square, 20, 6, joint=CHAIN_REVOLUTE,
+                            max_links=6)
+    assert len(balls) == 4 + 6
+    assert isinstance(world.world.joints[-1], box2d.b2RevoluteJoint)
+
+
+def test_closed_chain():
+    world = make_world()
+    # The last point of the polyline is on the first ball, and the ring
+    # closes there, with no ball of its own
+    loop = [(500, 100), (600, 100), (600, 200), (500, 200), (503, 102)]
+    joints = world.world.jointCount
+    balls = world.add.chain(loop, 20, 6, closed=True)
+    assert len(balls) == 4 + 4 * 5
+    assert world.world.jointCount == joints + 4 * 6
+    assert all(len(ball.joints) == 2 for ball in balls)
+
+    # Near the first point, a segment joins the last ball to the first
+    found = world.add.ball((100, 300), 8)
+    loop = [(100, 300), (200, 300), (200, 400), (100, 400), (100, 320)]
+    balls = world.add.chain(
+        loop, 20, 6, closed=True,
+        find=lambda points: [bodies[0] if bodies else None for bodies in
+                             world.get_bodies_at_points(points)])
+    assert len(balls) == 4 + 4 * 5
+    assert len(found.joints) == 2
+    assert all(len(ball.joints) == 2 for ball in balls)
+
+
+def test_level_of_detail():
+    import pygame
+    world = elements.Elements((800, 600))
+    world.renderer.set_surface(pygame.Surface((800, 600)))
+    world.add.ground()
+    world.add.chain([(100, 100), (500, 100)], 20, 6)
+    world.add.concavePoly([(100, 300), (200, 300), (200, 400), (260, 440)])
+    world.add.ball((600, 300), 0.4)  # smaller than a pixel
+
+    calls = []
+    world.renderer.draw_circle = lambda *args: calls.append('circle')
+    world.renderer.draw_polygon = lambda *args: calls.append('polygon')
+    world.renderer.draw_lines = \
+        lambda clr, closed, points, width: calls.append(len(points))
+
+    world.draw()
+    # 22 balls of the chain and their 21 joints, 2 circles and 3 rects
+    # of the stroke, the ground
+    assert calls.count('circle') == 24
+    assert calls.count('polygon') == 4
+    assert calls.count(2) == 21
+
+    del calls[:]
+    world.camera.set_scale_factor(0.3)
+    world.draw()
+    assert not world.renderer.orientation
+    # The ground, then the stroke and the chain as polylines
+    assert calls.count('polygon') == 1
+    assert sorted(call for call in calls if call != 'polygon') == [4, 22]
+
+
+def test_view_culling():
+    import pygame
+    world = elements.Elements((800, 600))
+    world.renderer.set_surface(pygame.Surface((800, 600)))
+    world.add.ground()
+    inside = world.add.rect((400, 300), 20, 20)
+    outside = world.add.rect((2400, 300), 20, 20)
+    world.add.joint(inside, (400, 300))
+    world.add.joint(outside, (2400, 300))
+    # A joint across the screen, with both ends off it
+    left = world.add.ball((-500, 100), 10)
+    right = world.add.ball((1500, 100), 10)
+    world.add.joint(left, right, (-500, 100), (1500, 100))
+
+    calls = []
+    world.renderer.draw_circle = lambda *args: calls.append('circle')
+    world.renderer.draw_polygon = lambda *args: calls.append('polygon')
+    world.renderer.draw_lines = lambda *args: calls.append('lines')
+    world.draw()
+    # The ground, the box and its pin, the joint across
+    assert sorted(calls) == ['circle', 'lines', 'polygon', 'polygon']
+
+    left, bottom, right, top = world.get_view()
+    assert (left, right) == (0, 8)
+    del calls[:]
+    world.camera.set_offset((2000, 0), screenCoord=False)
+    world.draw()
+    # The ground and the other box with its pin
+    assert sorted(calls) == ['circle', 'polygon', 'polygon']
+
+
+def test_opengl_renderer():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import pytest
+    world = elements.Elements((400, 300), renderer=None)
+    if not world.set_drawingMethod('opengl'):
+        pytest.skip('no OpenGL through EGL')
+    surface = pygame.Surface((400, 300))
+    world.renderer.set_surface(surface)
+    world.renderer.set_retained(True, (240, 240, 240))
+    world.add.ground()
+    ball = world.add.ball((100, 100), 30)
+    ball.userData['color'] = (255, 0, 0)
+    box = world.add.rect((300, 100), 40, 20, dynamic=False)
+    box.userData['color'] = (0, 0, 255)
+
+    world.draw()
+    assert surface.get_at((100, 110))[:3] == (255, 0, 0)
+    assert surface.get_at((300, 100))[:3] == (0, 0, 255)
+    assert surface.get_at((200, 50))[:3] == (240, 240, 240)
+    # The orientation line of the ball
+    assert surface.get_at((120, 100))[:3] == (255, 255, 255)
+    assert world.renderer.get_dirty() == [surface.get_rect()]
+    # The same frame again is no change
+    world.draw()
+    assert not world.renderer.changed
+    world.renderer.get_dirty()
+
+    # A body drawn later is on top
+    over = world.add.rect((100, 100), 5, 5, dynamic=False)
+    over.userData['color'] = (0, 255, 0)
+    world.draw()
+    assert surface.get_at((100, 103))[:3] == (0, 255, 0)
+
+    # Lines and fills overlap in the order they are drawn, like pygame
+    renderer = world.renderer
+    renderer.start_drawing()
+    renderer.draw_lines((0, 0, 0), False, [(10, 50), (390, 50)], 9)
+    renderer.draw_polygon((255, 0, 0), [(40, 40), (60, 40), (60, 60),
+                                        (40, 60)])
+    renderer.draw_lines((0, 0, 255), False, [(50, 10), (50, 290)], 3)
+    renderer.draw_circle((0, 255, 0), (150, 50), 20, 0)
+    renderer.after_drawing()
+    assert surface.get_at((45, 50))[:3] == (255, 0, 0)
+    assert surface.get_at((50, 50))[:3] == (0, 0, 255)
+    assert surface.get_at((100, 50))[:3] == (0, 0, 0)
+    assert surface.get_at((140, 50))[:3] == (0, 255, 0)
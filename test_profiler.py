@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the frame profiler.
+
+Usage:
+    python3 -m pytest test_profiler.py
+"""
+
+import csv
+import json
+
+import myelements as elements
+from profiler import FrameProfiler, COLUMNS, PHASES
+
+
+def test_frames(tmp_path):
+    world = elements.Elements((1200, 750), renderer=None)
+    world.add.ground()
+    for i in range(3):
+        world.add.ball((300 + 100 * i, 100), 20)
+    world.capture_state()
+
+    path = str(tmp_path / 'profile.csv')
+    profiler = FrameProfiler(history=4, log_path=path, log_every=5)
+    # Recorded and logged without the overlay
+    assert not profiler.overlay
+    for frame in range(6):
+        profiler.begin()
+        for phase in PHASES:
+            profiler.lap(phase)
+        profiler.end(world, steps=4)
+    assert len(profiler.frames) == 4
+    mean = profiler.averages()
+    assert mean['steps'] == 4
+    assert mean['bodies'] == world.world.bodyCount
+    assert mean['awake'] == 3
+    assert mean['total'] >= mean['step']
+    assert len(profiler.lines()) == 3
+    assert profiler.draw(None) is None
+    profiler.toggle()
+    assert profiler.overlay
+
+    # Written after log_every frames
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    assert tuple(rows[0]) == COLUMNS
+    assert len(rows) == 1 + 4
+
+    json_path = str(tmp_path / 'profile.json')
+    profiler.write(json_path)
+    with open(json_path) as f:
+        data = json.load(f)
+    assert len(data['frames']) == 4
+    assert len(data['frames'][0]) == len(data['columns'])
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Tests for the late-join synchronisation of shared activities.
+
+Usage:
+    python3 -m pytest test_sharing.py
+"""
+
+import json
+
+import pytest
+
+import myelements as elements
+from sharing import WorldSync, Lockstep, pack, unpack
+from sharing import sync_mode
+from sharing import StateBroadcast, StateFollower, tag_bodies
+
+
+class Peer:
+    """ A world and its WorldSync, applying 'C:' ball messages """
+
+    def __init__(self):
+        self.world = elements.Elements((1200, 750), renderer=None)
+        self.world.add.ground()
+        self.sync = WorldSync(self.world.binary_dumps,
+                              self.world.binary_loads)
+
+    def apply(self, msg):
+        if self.sync.is_applied(msg.get('id')):
+            return
+        self.sync.applied(msg.get('id'))
+        pos, radius = json.loads(msg['text'][2:])
+        self.world.add.ball(pos, radius)
+        tag_bodies(self.world.world.bodies, msg['id'])
+
+    def send(self, pos, radius):
+        msg = {'action': 'text', 'text': 'C:' + json.dumps([pos, radius]),
+               'id': self.sync.new_id()}
+        self.apply(msg)
+        return msg
+
+    def receive(self, msg):
+        for msg in self.sync.receive(msg):
+            self.apply(msg)
+
+    def positions(self):
+        return sorted(tuple(body.position) for body in self.world.world.bodies)
+
+
+def test_late_join():
+    leader = Peer()
+    other = Peer()
+    for i in range(5):
+        msg = leader.send((100 + 60 * i, 100), 20)
+        other.receive(msg)
+    leader.world.update()
+
+    joining = Peer()
+    joining.sync.wait()
+    # Sent before the leader took the snapshot, but arriving after
+    before = other.send((100, 300), 10)
+    leader.receive(before)
+    data = json.loads(json.dumps(leader.sync.get_data()))
+    after = other.send((200, 300), 10)
+    leader.receive(after)
+    joining.receive(before)
+    joining.receive(after)
+    assert joining.world.world.bodyCount == Peer().world.world.bodyCount
+
+    # Only what the world is missing is applied again
+    for msg in joining.sync.set_data(data):
+        joining.apply(msg)
+    assert joining.world.world.bodyCount == leader.world.world.bodyCount
+    assert joining.positions() == leader.positions()
+
+
+def test_held_messages_are_released():
+    joining = Peer()
+    empty = joining.world.world.bodyCount
+    joining.sync.wait()
+    sender = Peer()
+    joining.receive(sender.send((100, 100), 10))
+    assert joining.world.world.bodyCount == empty
+    # An older leader answers with an empty dict
+    for msg in joining.sync.set_data({}):
+        joining.apply(msg)
+    assert joining.world.world.bodyCount == empty + 1
+    assert not joining.sync.waiting
+
+
+def test_history_is_bounded():
+    sync = WorldSync(bytes, None, history=4)
+    ids = [sync.new_id() for i in range(10)]
+    for op_id in ids:
+        sync.applied(op_id)
+    assert sync.get_data()['applied'] == ids[-4:]
+    assert not sync.is_applied(ids[0]) and sync.is_applied(ids[-1])
+
+
+def test_batches():
+    sender = Peer()
+    receiver = Peer()
+    ops = [sender.send((100 + 10 * i, 100), 5) for i in range(20)]
+    assert pack(ops[:1]) == ops[:1]
+    messages = pack(ops, limit=200)
+    assert 1 < len(messages) < 20
+    assert all(msg['action'] == 'batch' for msg in messages)
+    received = []
+    for msg in messages:
+        received.extend(unpack(json.loads(json.dumps(msg))))
+    assert received == ops
+    for msg in received:
+        receiver.receive(msg)
+    assert receiver.positions() == sender.positions()
+    assert unpack({'action': 'batch', 'version': 99, 'ops': []}) == []
+
+
+class LockstepPeer(Peer):
+    """ A Peer stepping its world in lockstep """
+
+    def __init__(self, delay=4, hash_interval=10):
+        Peer.__init__(self)
+        self.lockstep = Lockstep(delay, hash_interval)
+        self.lockstep.start()
+
+    def send(self, pos, radius):
+        msg = {'action': 'text', 'text': 'C:' + json.dumps([pos, radius]),
+               'id': self.sync.new_id()}
+        self.lockstep.tag(msg)
+        return json.loads(json.dumps(msg))
+
+    def receive(self, msg):
+        self.lockstep.schedule(msg)
+
+    def step(self, now=0):
+        if not self.lockstep.can_step(now):
+            return False
+        for msg in self.lockstep.due():
+            self.apply(msg)
+        self.world.update(fps=120)
+        self.lockstep.stepped(self.world.world)
+        return True
+
+    def tick(self, now=0):
+        return self.lockstep.tick(self.sync.peer, now)
+
+
+def test_lockstep():
+    a = LockstepPeer()
+    b = LockstepPeer()
+    a.lockstep.receive_tick(b.tick(), now=0)
+    b.lockstep.receive_tick(a.tick(), now=0)
+    for i in range(3):
+        assert a.step()
+    # Made on each side at different frames, arriving a few frames late
+    from_a = a.send((300, 100), 20)
+    for i in range(2):
+        assert b.step()
+    from_b = b.send((320, 40), 20)
+    a.receive(from_b)
+    b.receive(from_a)
+
+    # Neither runs further than the delay ahead of the other
+    while a.step():
+        pass
+    # b last told it was at frame 0
+    assert a.lockstep.frame == 0 + 4
+    for frame in range(40):
+        for peer, other in ((a, b), (b, a)):
+            peer.step()
+            other.lockstep.receive_tick(peer.tick(), now=0)
+    assert a.lockstep.frame > 30 and b.lockstep.frame > 30
+    while a.lockstep.frame != b.lockstep.frame:
+        min(a, b, key=lambda peer: peer.lockstep.frame).step()
+    assert a.world.world.bodyCount == b.world.world.bodyCount
+    assert a.positions() == b.positions()
+    assert a.lockstep.diverged is None and b.lockstep.diverged is None
+
+    # A body only one of them has is found at the next hash
+    a.world.add.ball((600, 100), 10)
+    while b.lockstep.diverged is None:
+        for peer, other in ((a, b), (b, a)):
+            peer.step()
+            other.lockstep.receive_tick(peer.tick(), now=0)
+    assert b.lockstep.diverged % 10 == 0
+
+
+def test_lockstep_timeout_and_batches():
+    a = LockstepPeer()
+    a.lockstep.receive_tick({'action': 'tick', 'peer': 'gone', 'frame': 0},
+                            now=0)
+    while a.step(now=1):
+        pass
+    assert a.lockstep.frame == 4
+    assert a.step(now=10)
+
+    ops = [a.send((100 + 10 * i, 100), 5) for i in range(3)]
+    received = []
+    for msg in pack(ops):
+        received.extend(unpack(json.loads(json.dumps(msg))))
+    assert received == ops
+    assert [msg['frame'] for msg in a.lockstep.stop()] == [9] * 3
+    assert not a.lockstep.enabled and a.lockstep.pending() == []
+
+
+def test_lockstep_late_join():
+    leader = LockstepPeer()
+    for i in range(24):
+        leader.world.add.ball((300 + 25 * (i % 6), 100 + 30 * (i // 6)), 12)
+    for i in range(60):
+        assert leader.step()
+
+    # The leader rebuilds its world from the snapshot it sends, without
+    # the contacts of the world stepped so far, like the buddy does
+    joining = LockstepPeer()
+    joining.lockstep.stop()
+    joining.sync.wait()
+    data = json.loads(json.dumps(leader.sync.get_data(reload=True)))
+    data['lockstep'] = leader.lockstep.get_data(leader.sync.peer)
+    joining.sync.set_data(data)
+    joining.lockstep.set_data(data['lockstep'], now=0)
+    assert joining.lockstep.frame == leader.lockstep.frame == 60
+
+    for frame in range(200):
+        for peer, other in ((leader, joining), (joining, leader)):
+            peer.step()
+            other.lockstep.receive_tick(peer.tick(), now=0)
+    while leader.lockstep.frame != joining.lockstep.frame:
+        min(leader, joining, key=lambda peer: peer.lockstep.frame).step()
+    assert joining.positions() == leader.positions()
+    assert leader.lockstep.diverged is None
+    assert joining.lockstep.diverged is None
+
+
+def test_sync_mode():
+    assert sync_mode('') == 'operations'
+    assert sync_mode(' Lockstep ') == 'lockstep'
+    assert sync_mode('broadcast,') == 'broadcast'
+    with pytest.raises(ValueError):
+        sync_mode('fast')
+    # Either the buddies step their world or the leader's is broadcast
+    with pytest.raises(ValueError):
+        sync_mode('lockstep,broadcast')
+
+
+def test_state_broadcast():
+    leader = Peer()
+    follower = Peer()
+    msgs = [leader.send((300 + 100 * i, 100), 20) for i in range(3)]
+    # Bodies are matched by id, whatever their order in the world
+    for msg in reversed(msgs):
+        follower.receive(msg)
+    broadcast = StateBroadcast(interval=0.1, max_bodies=2)
+    state = broadcast.state(leader.world.world, now=0)
+    # The static ground is never sent, the rest over two broadcasts
+    assert len(state['bodies']) == 2 * 4
+    assert broadcast.state(leader.world.world, now=0.05) is None
+    assert len(broadcast.state(leader.world.world, now=0.1)['bodies']) == 4
+    assert broadcast.state(leader.world.world, now=0.2) is None
+
+    for i in range(30):
+        leader.world.update(fps=120)
+    broadcast.max_bodies = 10
+    state = json.loads(json.dumps(broadcast.state(leader.world.world,
+                                                  now=0.5)))
+    follower_state = StateFollower(interval=0.1)
+    assert follower_state.receive(state, follower.world.world, now=1)
+    before = follower.positions()
+    follower_state.apply(follower.world.world, now=1.05)
+    halfway = follower.positions()
+    follower_state.apply(follower.world.world, now=1.1)
+    after = follower.positions()
+    assert before != halfway != after
+    for (x1, y1), (x2, y2) in zip(after, leader.positions()):
+        assert abs(x1 - x2) < 0.001 and abs(y1 - y2) < 0.001
+
+    # A body unknown here for a while means the world is not the leader's
+    msg = leader.send((700, 100), 20)
+    state = broadcast.state(leader.world.world, now=1)
+    assert follower_state.receive(state, follower.world.world, now=2)
+    assert follower_state.receive(state, follower.world.world, now=3)
+    assert not follower_state.receive(state, follower.world.world, now=4)
+    follower.receive(msg)
+    assert follower_state.receive(state, follower.world.world, now=5)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Tests for the pen trace buffers and the trail surface.
+
+Usage:
+    python3 -m pytest test_traces.py
+"""
+
+import pygame
+
+from traces import TraceBuffer, PenTraces
+
+
+def test_buffer_skips_small_steps():
+    buffer = TraceBuffer(capacity=16, min_step=1.0)
+    assert buffer.append(10.0, 10.0) == 1
+    assert buffer.append(10.5, 10.2) == 0
+    assert buffer.append(12.0, 10.0) == 1
+    assert buffer.to_list() == [10.0, 10.0, 12.0, 10.0]
+
+
+def test_buffer_is_bounded():
+    decimate = TraceBuffer(capacity=64, policy='decimate')
+    ring = TraceBuffer(capacity=64, policy='ring')
+    for i in range(1000):
+        decimate.append(float(i), 0.0)
+        ring.append(float(i), 0.0)
+    assert len(decimate) <= 64 and len(ring) <= 64
+    # Decimation keeps the start of the path, the ring only the end
+    assert decimate.points[0][0] == 0.0
+    assert ring.points[0][0] > 900.0
+    assert decimate.points[-1][0] == ring.points[-1][0] == 999.0
+
+
+def test_journal_round_trip():
+    pens = PenTraces()
+    pens.append(0, (255, 0, 0), [1.0, 5.0], [2.0, 6.0])
+    pens.append(2, (0, 0, 255), [3.25], [4.0])
+    saved = pens.to_lists()
+    assert saved == [[1.0, 2.0, 5.0, 6.0], [], [3.2, 4.0]]
+    loaded = PenTraces()
+    loaded.load_lists(saved, {0: (255, 0, 0), 2: (0, 0, 255)})
+    assert loaded.to_lists() == saved
+    assert loaded.colors[2] == (0, 0, 255)
+
+
+def test_only_new_points_are_painted():
+    surface = pygame.Surface((100, 100))
+    pens = PenTraces()
+    pens.append(0, (255, 0, 0), [10.0], [10.0])
+    assert pens.draw(surface, []) == [surface.get_rect()]
+    assert pens.draw(surface, []) == []
+    pens.append(0, (255, 0, 0), [50.0], [50.0])
+    changed = pens.draw(surface, [])
+    assert len(changed) == 1 and changed[0].collidepoint(50, 50)
+    assert surface.get_at((50, 50))[:3] == (255, 0, 0)
+    assert surface.get_at((10, 10))[:3] == (255, 0, 0)
+    # Points off the surface are not painted
+    pens.append(0, (255, 0, 0), [500.0], [50.0])
+    assert pens.draw(surface, []) == []
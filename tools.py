@@ -23,7 +23,6 @@
 import os
 from shutil import copy
 import json
-import math
 import logging
 import pygame
 from gettext import gettext as _
@@ -31,9 +30,8 @@ from gettext import gettext as _
 from pygame.locals import \
     USEREVENT, MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION
 from helpers import \
-    tuple_to_int, distance, constructTriangleFromLine, find_body
-
-import Box2D as box2d
+    tuple_to_int, distance, constructTriangleFromLine, find_body, \
+    find_bodies
 
 from sugar3.activity import activity
 
@@ -94,19 +92,12 @@ class Tool(object):
                 if event.action == 'stop_start_toggle':
                     # Stop/start simulation
                     toggle = self.game.world.run_physics
-                    self.game.world.run_physics = not toggle
+                    self.game.set_running(not toggle)
                 elif event.action == 'clear_all':
-                    # Get bodies and destroy them too
-                    for body in self.game.world.world.bodies:
-                        self.game.world.world.DestroyBody(body)
-
-                    # Add ground, because we destroyed it before
-                    self.game.world.add.ground()
-                    # Also clear the points recorded in pens.
-                    self.game.full_pos_list = \
-                        [[] for _ in self.game.full_pos_list]
+                    self.game.clear_all()
                 elif event.action == 'focus_in':
                     self.game.in_focus = True
+                    self.game.world.renderer.invalidate()
                 elif event.action == 'focus_out':
                     self.game.in_focus = False
                 elif event.action in self.game.toolList:
@@ -125,20 +116,19 @@ class Tool(object):
         # Overload to handle events for Tool subclasses
         pass
 
+    def send_event(self, code, data):
+        # Share what a constructor makes with the buddies. True means
+        # lockstep builds it later, at its frame, so skip it for now
+        return self.game.activity.send_event(code + ':' + json.dumps(data))
+
     def draw(self):
         # Default drawing method is draw the pen points.
-        surface = self.game.world.renderer.get_surface()
-        for key, info in self.game.trackinfo.items():
-            color = info[2]
-            trackdex = info[4]
-            try:
-                pos_list = self.game.full_pos_list[trackdex]
-                for i in range(0, len(pos_list), 2):
-                    posx = int(pos_list[i])
-                    posy = int(pos_list[i + 1])
-                    pygame.draw.circle(surface, color, (posx, posy), 2)
-            except IndexError:
-                pass
+        # Only new points are painted, the trail is copied back over
+        # the areas redrawn this frame
+        renderer = self.game.world.renderer
+        rects = renderer.dirty if renderer.retained else None
+        for rect in self.game.traces.draw(renderer.get_surface(), rects):
+            self.game.add_dirty(rect)
 
     def cancel(self):
         # Default cancel doesn't do anything
@@ -196,14 +186,13 @@ class CircleTool(Tool):
 
     def constructor(self, pos, radius, density, restitution, friction,
                     share=True):
+        if share and self.send_event(
+                'C', [pos, radius, density, restitution, friction]):
+            return
         self.game.world.add.ball(pos, radius, dynamic=True,
                                  density=density, restitution=restitution,
                                  friction=friction)
 
-        if share:
-            data = json.dumps([pos, radius, density, restitution, friction])
-            self.game.activity.send_event('C:' + data)
-
     def draw(self):
         Tool.draw(self)
         # Draw a circle from pt1 to mouse
@@ -212,10 +201,12 @@ class CircleTool(Tool):
                              tuple_to_int(pygame.mouse.get_pos()))
             if delta > 0:
                 self.radius = max(delta, 5)
-                pygame.draw.circle(self.game.screen, (100, 180, 255),
-                                   self.pt1, int(self.radius), 3)
-                pygame.draw.line(self.game.screen, (100, 180, 255), self.pt1,
-                                 tuple_to_int(pygame.mouse.get_pos()), 1)
+                self.game.add_dirty(pygame.draw.circle(
+                    self.game.screen, (100, 180, 255), self.pt1,
+                    int(self.radius), 3))
+                self.game.add_dirty(pygame.draw.line(
+                    self.game.screen, (100, 180, 255), self.pt1,
+                    tuple_to_int(pygame.mouse.get_pos()), 1))
 
     def cancel(self):
         self.pt1 = None
@@ -256,6 +247,9 @@ class BoxTool(Tool):
 
     def constructor(self, pos1, pos2, density, restitution, friction,
                     share=True):
+        if share and self.send_event(
+                'B', [pos1, pos2, density, restitution, friction]):
+            return
         if pos1[0] == pos2[0] and pos1[1] == pos2[1]:
             self.rect = pygame.Rect(pos1, (-self.width, -self.height))
         else:
@@ -271,10 +265,6 @@ class BoxTool(Tool):
                                  restitution=restitution,
                                  friction=friction)
 
-        if share:
-            data = json.dumps([pos1, pos2, density, restitution, friction])
-            self.game.activity.send_event('B:' + data)
-
     def draw(self):
         Tool.draw(self)
         # Draw a box from pt1 to mouse
@@ -285,8 +275,8 @@ class BoxTool(Tool):
                 self.height = mouse_x_y[1] - self.pt1[1]
                 self.rect = pygame.Rect(self.pt1, (self.width, self.height))
                 self.rect.normalize()
-                pygame.draw.rect(self.game.screen, (100, 180, 255),
-                                 self.rect, 3)
+                self.game.add_dirty(pygame.draw.rect(
+                    self.game.screen, (100, 180, 255), self.rect, 3))
 
     def cancel(self):
         self.pt1 = None
@@ -347,17 +337,15 @@ class TriangleTool(Tool):
             pos2[1] = middle_y - (((middle_y - pos2[1]) /
                                    minimum_size_check) * 20)
 
+        if share and self.send_event(
+                'T', [pos1, pos2, density, restitution, friction]):
+            return
         self.vertices = constructTriangleFromLine(pos1, pos2)
         self.game.world.add.convexPoly(self.vertices,
                                        dynamic=True,
                                        density=density,
                                        restitution=restitution,
                                        friction=friction)
-
-        if share:
-            data = json.dumps([pos1, pos2, density, restitution, friction])
-            self.game.activity.send_event('T:' + data)
-
         self.vertices = None
 
     def draw(self):
@@ -369,10 +357,10 @@ class TriangleTool(Tool):
                 self.vertices = constructTriangleFromLine(self.pt1, mouse_x_y)
                 self.line_delta = [mouse_x_y[0] - self.pt1[0],
                                    mouse_x_y[1] - self.pt1[1]]
-                pygame.draw.polygon(self.game.screen, (100, 180, 255),
-                                    self.vertices, 3)
-                pygame.draw.line(self.game.screen, (100, 180, 255),
-                                 self.pt1, mouse_x_y, 1)
+                self.game.add_dirty(pygame.draw.polygon(
+                    self.game.screen, (100, 180, 255), self.vertices, 3))
+                self.game.add_dirty(pygame.draw.line(
+                    self.game.screen, (100, 180, 255), self.pt1, mouse_x_y, 1))
 
     def cancel(self):
         self.pt1 = None
@@ -450,26 +438,27 @@ class PolygonTool(Tool):
 
     def constructor(self, vertices, density, restitution, friction,
                     share=True):
+        if share and self.send_event(
+                'P', [vertices, density, restitution, friction]):
+            return
         self.game.world.add.complexPoly(vertices, dynamic=True,
                                         density=density,
                                         restitution=restitution,
                                         friction=friction)
-        if share:
-            data = json.dumps([vertices, density, restitution, friction])
-            self.game.activity.send_event('P:' + data)
 
     def draw(self):
         Tool.draw(self)
         # Draw the poly being created
         if self.vertices:
             for i in range(len(self.vertices) - 1):
-                pygame.draw.line(self.game.screen, (100, 180, 255),
-                                 self.vertices[i], self.vertices[i + 1], 3)
-            pygame.draw.line(self.game.screen, (100, 180, 255),
-                             self.vertices[-1],
-                             tuple_to_int(pygame.mouse.get_pos()), 3)
-            pygame.draw.circle(self.game.screen, (100, 180, 255),
-                               self.vertices[0], 15, 3)
+                self.game.add_dirty(pygame.draw.line(
+                    self.game.screen, (100, 180, 255), self.vertices[i],
+                    self.vertices[i + 1], 3))
+            self.game.add_dirty(pygame.draw.line(
+                self.game.screen, (100, 180, 255), self.vertices[-1],
+                tuple_to_int(pygame.mouse.get_pos()), 3))
+            self.game.add_dirty(pygame.draw.circle(
+                self.game.screen, (100, 180, 255), self.vertices[0], 15, 3))
 
     def cancel(self):
         self.vertices = None
@@ -526,13 +515,13 @@ class MagicPenTool(Tool):
 
     def constructor(self, vertices, density, restitution, friction,
                     share=True):
+        if share and self.send_event(
+                'M', [vertices, density, restitution, friction]):
+            return
         self.game.world.add.complexPoly(vertices, dynamic=True,
                                         density=density,
                                         restitution=restitution,
                                         friction=friction)
-        if share:
-            data = json.dumps([vertices, density, restitution, friction])
-            self.game.activity.send_event('M:' + data)
 
     def draw(self):
         Tool.draw(self)
@@ -540,13 +529,15 @@ class MagicPenTool(Tool):
         if self.vertices:
             if len(self.vertices) > 1:
                 for i in range(len(self.vertices) - 1):
-                    pygame.draw.line(self.game.screen, (100, 180, 255),
-                                     self.vertices[i], self.vertices[i + 1], 3)
-                pygame.draw.line(self.game.screen, (100, 180, 255),
-                                 self.vertices[-1],
-                                 tuple_to_int(pygame.mouse.get_pos()), 3)
-                pygame.draw.circle(self.game.screen, (100, 180, 255),
-                                   self.vertices[0], 15, 3)
+                    self.game.add_dirty(pygame.draw.line(
+                        self.game.screen, (100, 180, 255), self.vertices[i],
+                        self.vertices[i + 1], 3))
+                self.game.add_dirty(pygame.draw.line(
+                    self.game.screen, (100, 180, 255), self.vertices[-1],
+                    tuple_to_int(pygame.mouse.get_pos()), 3))
+                self.game.add_dirty(pygame.draw.circle(
+                    self.game.screen, (100, 180, 255), self.vertices[0],
+                    15, 3))
 
     def cancel(self):
         self.vertices = None
@@ -562,7 +553,8 @@ class GrabTool(Tool):
     def __init__(self, gameInstance):
         Tool.__init__(self, gameInstance)
         self._current_body = None
-        self._moving_pm = None
+        self._moving_pm = None  # whether the pin taken off is a motor
+        self._grabbing = False
 
         self.DEFAULT_PR_RADIUS = 2
         self.PIN_MOTOR_RADIUS = 5
@@ -581,98 +573,106 @@ class GrabTool(Tool):
         # We handle two types of 'grab' depending on simulation running or not
         if event.type == MOUSEBUTTONDOWN:
             if event.button == 1:
+                pos = tuple_to_int(event.pos)
                 # Give preference to pins and motors being caught
-                for joint in self.game.world.world.joints:
+                for joint in self.game.world.get_pins_at_pos(
+                        pos, self.PIN_MOTOR_RADIUS):
+                    logging.debug("found a pin or motor")
                     x, y = joint.anchorA
                     ppm = self.game.world.ppm
                     x, y = self.game.world.to_screen((x * ppm, y * ppm))
-                    wh_half = self.PIN_MOTOR_RADIUS
-                    wh = 2 * self.PIN_MOTOR_RADIUS
-                    rect = pygame.Rect(x - wh_half, y - wh_half, wh, wh)
-                    if isinstance(joint, box2d.b2RevoluteJoint) \
-                       and rect.collidepoint(tuple_to_int(event.pos)):
-                        logging.debug("found a pin or motor")
-
-                        self._moving_pm = joint
-                        self.pm_mode_active = True
-                        self.pm_x = x
-                        self.pm_y = y
-                        self.game.world.world.DestroyJoint(joint)
-
-                        break
-
-                if self.pm_mode_active:
-                    # Game is stopped when moving pins and motors
-                    # So that the game doesn't mess up, and for user
-                    # convenience
-                    self._game_run_prev_state = self.game.world.run_physics
-                    self.game.world.run_physics = False
 
+                    self.pm_mode_active = True
+                    self.pm_x = x
+                    self.pm_y = y
+                    self.constructor('pin', pos)
                     return
                     # Don't want to register the body under too
 
                 # Grab the first object at the mouse pointer
-                bodylist = self.game.world.get_bodies_at_pos(
-                    tuple_to_int(event.pos),
-                    include_static=False)
-                if bodylist and len(bodylist) > 0:
-                    if self.game.world.run_physics:
-                        self.game.world.add.mouseJoint(bodylist[0],
-                                                       tuple_to_int(event.pos))
-                    else:
-                        self._current_body = bodylist[0]
+                if self.game.world.get_bodies_at_pos(pos,
+                                                     include_static=False):
+                    self._grabbing = True
+                    self.constructor('grab', pos)
         elif event.type == MOUSEBUTTONUP:
             # Let it go
             if event.button == 1:
-                if self.game.world.run_physics:
-                    self.game.world.add.remove_mouseJoint()
-                else:
-                    if self.pm_mode_active:
-                        pos = event.pos
-                        body = find_body(self.game.world, pos)
-                        if body is not None:
-                            if self._moving_pm.enableMotor:
-                                self.game.world.add.motor(
-                                    body, pos,
-                                    speed=MotorTool.palette_data['speed'])
-                            else:
-                                self.game.world.add.joint(body, pos)
-
-                        # Check motor/pin and add joint accordingly
-
-                        self.pm_mode_active = False
-                        self._moving_pm = None
-
-                        self.game.world.run_physics = self._game_run_prev_state
-
-                    self._current_body = None
+                if self.pm_mode_active:
+                    # Check motor/pin and add joint accordingly
+                    self.pm_mode_active = False
+                    self.constructor('drop', tuple_to_int(event.pos),
+                                     MotorTool.palette_data['speed'])
+                elif self._grabbing:
+                    self._grabbing = False
+                    self.constructor('release', tuple_to_int(event.pos))
         elif event.type == MOUSEMOTION:  # and event.buttons[0]:
             # Move it around
-            if self.game.world.run_physics:
-                # Use box2D mouse motion
-                self.game.world.mouse_move(tuple_to_int(event.pos))
-            else:
-                if self.pm_mode_active:
-                    self.pm_x, self.pm_y = event.pos
-                    return
+            if self.pm_mode_active:
+                self.pm_x, self.pm_y = event.pos
+            elif self._grabbing:
+                self.constructor('move', tuple_to_int(event.pos))
+
+    def constructor(self, action, pos, speed=None, share=True):
+        # Change the world like the grab did, the same for the buddies:
+        # 'pin' takes the pin or motor at pos off, 'drop' puts it back at
+        # pos, and 'grab', 'move' and 'release' drag the body at pos
+        if share and self.send_event('g', [action, pos, speed]):
+            return
 
+        world = self.game.world
+        if action == 'pin':
+            for joint in world.get_pins_at_pos(pos, self.PIN_MOTOR_RADIUS):
+                self._moving_pm = joint.enableMotor
+                world.destroy_joint(joint)
+                # Game is stopped when moving pins and motors
+                # So that the game doesn't mess up, and for user
+                # convenience
+                self._game_run_prev_state = world.run_physics
+                world.run_physics = False
+                break
+        elif action == 'drop':
+            if self._moving_pm is not None:
+                body = find_body(world, pos)
+                if body is not None:
+                    if self._moving_pm:
+                        world.add.motor(body, pos, speed=speed)
+                    else:
+                        world.add.joint(body, pos)
+                self._moving_pm = None
+                world.run_physics = self._game_run_prev_state
+        elif action == 'grab':
+            bodylist = world.get_bodies_at_pos(pos, include_static=False)
+            if bodylist and len(bodylist) > 0:
+                if world.run_physics:
+                    world.add.mouseJoint(bodylist[0], pos)
+                else:
+                    self._current_body = bodylist[0]
+        elif action == 'move':
+            if world.run_physics:
+                # Use box2D mouse motion
+                world.mouse_move(pos)
+            elif self._current_body is not None:
                 # Position directly (if we have a current body)
-                if self._current_body is not None:
-                    x, y = self.game.world.to_world(tuple_to_int(event.pos))
-                    x /= self.game.world.ppm
-                    y /= self.game.world.ppm
-                    self._current_body.position = (x, y)
+                x, y = world.to_world(pos)
+                x /= world.ppm
+                y /= world.ppm
+                self._current_body.position = (x, y)
+        elif action == 'release':
+            world.add.remove_mouseJoint()
+            self._current_body = None
 
     def draw(self):
         Tool.draw(self)
         if self.pm_mode_active:
-            pygame.draw.circle(
+            self.game.add_dirty(pygame.draw.circle(
                 self.game.screen, (255, 255, 255),
                 tuple_to_int((self.pm_x, self.pm_y)),
-                self.PIN_MOTOR_RADIUS, 0)
+                self.PIN_MOTOR_RADIUS, 0))
 
     def cancel(self):
-        self.game.world.add.remove_mouseJoint()
+        if self._grabbing:
+            self._grabbing = False
+            self.constructor('release', None)
         self.game.world.set_pin_motor_radius(self.DEFAULT_PR_RADIUS)
 
 
@@ -713,18 +713,17 @@ class JointTool(Tool):
         body2 = find_body(self.game.world, pos2)
         if body1 is None or body2 is None:
             return
+        if share and self.send_event('j', [pos1, pos2]):
+            return
 
         self.game.world.add.joint(body1, body2, pos1, pos2)
 
-        if share:
-            data = json.dumps([pos1, pos2])
-            self.game.activity.send_event('j:' + data)
-
     def draw(self):
         Tool.draw(self)
         if self.jb1:
-            pygame.draw.line(self.game.screen, (100, 180, 255), self.jb1pos,
-                             tuple_to_int(pygame.mouse.get_pos()), 3)
+            self.game.add_dirty(pygame.draw.line(
+                self.game.screen, (100, 180, 255), self.jb1pos,
+                tuple_to_int(pygame.mouse.get_pos()), 3))
 
     def cancel(self):
         self.jb1 = self.jb2 = self.jb1pos = self.jb2pos = None
@@ -752,13 +751,11 @@ class PinTool(Tool):
             self.jb1 = self.jb1pos = None
 
     def constructor(self, pos, share=True):
+        if share and self.send_event('p', [pos]):
+            return
         body = find_body(self.game.world, pos)
         self.game.world.add.joint(body, pos)
 
-        if share:
-            data = json.dumps([pos])
-            self.game.activity.send_event('p:' + data)
-
         if not self.added_badge:
             self.add_badge(
                 icon='trophy-icon-physics',
@@ -812,13 +809,11 @@ class MotorTool(Tool):
                 self.jb1 = self.jb1pos = None
 
     def constructor(self, pos, speed, share=True):
+        if share and self.send_event('m', [pos, speed]):
+            return
         body = find_body(self.game.world, pos)
         self.game.world.add.motor(body, pos, speed=speed)
 
-        if share:
-            data = json.dumps([pos, speed])
-            self.game.activity.send_event('m:' + data)
-
         if not self.added_badge:
             self.add_badge(
                 icon='trophy-icon-physics',
@@ -878,36 +873,47 @@ class DestroyTool(Tool):
             if len(self.vertices) > 10:
                 self.vertices.pop(0)
 
-            body_to_remove = find_body(self.game.world, event.pos)
-            if body_to_remove is not None:
-                tracklist = list(self.game.trackinfo.items())
-                destroyed_body = False
-                for key, info in tracklist:
-                    trackdex = info[4]
-                    if 'track_indices' in body_to_remove.userData and \
-                       trackdex in body_to_remove.userData['track_indices'] \
-                       and info[3] is False:
-                        self.game.world.world.DestroyBody(info[1])
-                        self.game.trackinfo[key][3] = True
-                        destroyed_body = True
-                        break
-
-                jointnode = body_to_remove.joints
-                if jointnode and not destroyed_body:
-                    joint = jointnode[-1].joint
-                    self.game.world.world.DestroyJoint(joint)
-                elif not destroyed_body:
-                    self.game.world.world.DestroyBody(body_to_remove)
+            # Erase along the stroke since the last event, so fast
+            # strokes don't skip over bodies between two events
+            if self.game.world.get_bodies_along(self.vertices[-2:]):
+                self.constructor(self.vertices[-2:])
         elif event.type == MOUSEBUTTONUP and event.button == 1:
             self.cancel()
 
+    def constructor(self, vertices, share=True):
+        # Erase the first body along the stroke, for the buddies too
+        if share and self.send_event('d', [vertices]):
+            return
+
+        bodies = self.game.world.get_bodies_along(vertices)
+        body_to_remove = bodies[0] if bodies else None
+        if body_to_remove is not None:
+            tracklist = list(self.game.trackinfo.items())
+            destroyed_body = False
+            for key, info in tracklist:
+                trackdex = info[4]
+                if 'track_indices' in body_to_remove.userData and \
+                   trackdex in body_to_remove.userData['track_indices'] \
+                   and info[3] is False:
+                    self.game.world.world.DestroyBody(info[1])
+                    self.game.trackinfo[key][3] = True
+                    destroyed_body = True
+                    break
+
+            jointnode = body_to_remove.joints
+            if jointnode and not destroyed_body:
+                joint = jointnode[-1].joint
+                self.game.world.destroy_joint(joint)
+            elif not destroyed_body:
+                self.game.world.world.DestroyBody(body_to_remove)
+
     def draw(self):
         Tool.draw(self)
         # Draw the trail
         if self.vertices:
             if len(self.vertices) > 1:
-                pygame.draw.lines(self.game.screen, (255, 0, 0), False,
-                                  self.vertices, 3)
+                self.game.add_dirty(pygame.draw.lines(
+                    self.game.screen, (255, 0, 0), False, self.vertices, 3))
 
     def cancel(self):
         self.vertices = None
@@ -945,6 +951,8 @@ class TrackTool(Tool):
                     self.added_badge = True
 
     def constructor(self, pos, color, share=True):
+        if share and self.send_event('t', [pos, color]):
+            return
         body = find_body(self.game.world, pos)
         track_circle = self.game.world.add.ball(
             pos, self.radius, dynamic=True, density=0.001,
@@ -967,10 +975,6 @@ class TrackTool(Tool):
         self.game.trackinfo[dictkey][4] = trackdex  # Tracking index.
         self.game.tracked_bodies += 1  # counter of tracked bodies
 
-        if share:
-            data = json.dumps([pos, color])
-            self.game.activity.send_event('t:' + data)
-
 
 class ChainTool(Tool):
     name = 'Chain'
@@ -1045,39 +1049,16 @@ class ChainTool(Tool):
                 self.safe = True
 
     def constructor(self, vertices, link_length, radius, share=True):
-        pos1 = vertices[0][:]
-        body1 = find_body(self.game.world, pos1)
-        if body1 is None:
-            body1 = self.game.world.add.ball(
-                pos1, radius, dynamic=True, density=1.0, restitution=0.16,
-                friction=0.1)
-            body1.userData['color'] = (0, 0, 0)
-        for i, pos2 in enumerate(vertices):
-            if i == 0:
-                continue
-            body2 = find_body(self.game.world, pos2)
-            if body2 is None:
-                body2 = self.game.world.add.ball(
-                    pos2, radius, dynamic=True, density=1.0, restitution=0.16,
-                    friction=0.1)
-                body2.userData['color'] = (0, 0, 0)
-
-            self.make_chain(body1, body2, pos1, pos2, link_length, radius)
-            body1 = body2
-            pos1 = pos2[:]
-
+        if share and self.send_event('c', [vertices, link_length, radius]):
+            return
+        world = self.game.world
         # Close the chain if the start and end were near each other
-        if distance(vertices[0], vertices[-1]) < link_length * 2:
-            pos1 = vertices[0][:]
-            body1 = find_body(self.game.world, pos1)
-            pos2 = vertices[-1][:]
-            body2 = find_body(self.game.world, pos2)
-            if body1 != body2:
-                self.make_chain(body1, body2, pos1, pos2, link_length, radius)
-
-        if share:
-            data = json.dumps([vertices, link_length, radius])
-            self.game.activity.send_event('c:' + data)
+        closed = distance(vertices[0], vertices[-1]) < link_length * 2
+        for body in world.add.chain(vertices, link_length, radius,
+                                    closed=closed,
+                                    find=lambda points: find_bodies(world,
+                                                                    points)):
+            body.userData['color'] = (0, 0, 0)
 
     def draw(self):
         Tool.draw(self)
@@ -1085,47 +1066,19 @@ class ChainTool(Tool):
         if self.vertices:
             if len(self.vertices) > 1:
                 for i in range(len(self.vertices) - 1):
-                    pygame.draw.line(self.game.screen, (100, 180, 255),
-                                     self.vertices[i], self.vertices[i + 1], 3)
-                pygame.draw.line(self.game.screen, (100, 180, 255),
-                                 self.vertices[-1],
-                                 tuple_to_int(pygame.mouse.get_pos()), 3)
-                pygame.draw.circle(self.game.screen, (100, 180, 255),
-                                   self.vertices[0], 15, 3)
+                    self.game.add_dirty(pygame.draw.line(
+                        self.game.screen, (100, 180, 255), self.vertices[i],
+                        self.vertices[i + 1], 3))
+                self.game.add_dirty(pygame.draw.line(
+                    self.game.screen, (100, 180, 255), self.vertices[-1],
+                    tuple_to_int(pygame.mouse.get_pos()), 3))
+                self.game.add_dirty(pygame.draw.circle(
+                    self.game.screen, (100, 180, 255), self.vertices[0],
+                    15, 3))
 
     def cancel(self):
         self.vertices = None
 
-    def make_chain(self, body1, body2, pos1, pos2, link_length, radius):
-        dist = int(distance(pos1, pos2) + 0.5)
-        x1, y1 = pos1
-        x2, y2 = pos2
-        bearing = math.atan2((y2 - y1), (x2 - x1))
-
-        if dist < link_length:  # Too short to make a chain
-            self.game.world.add.joint(body1, body2, pos1, pos2)
-            return
-
-        # Draw circles along the path and join them together
-        prev_circle = body1
-        prev_pos = tuple_to_int((x1, y1))
-        for current_point in range(int(link_length / 2.), dist,
-                                   int(link_length)):
-            x = x1 + (current_point) * math.cos(bearing)
-            y = y1 + (current_point) * math.sin(bearing)
-            circle = self.game.world.add.ball(tuple_to_int((x, y)),
-                                              radius, dynamic=True,
-                                              density=1.0,
-                                              restitution=0.16, friction=0.1)
-            circle.userData['color'] = (0, 0, 0)
-            self.game.world.add.joint(
-                prev_circle, circle, prev_pos, tuple_to_int((x, y)), False)
-            if (current_point + link_length) >= dist:
-                self.game.world.add.joint(
-                    circle, body2, tuple_to_int((x, y)), pos2, False)
-            prev_circle = circle
-            prev_pos = tuple_to_int((x, y))
-
 
 def getAllTools():
     return [MagicPenTool,
@@ -0,0 +1,235 @@
+# Physics, a 2D Physics Playground for Kids
+
+#  This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Storage and drawing of the points recorded by pens.
+
+Each pen keeps its points in a preallocated NumPy buffer of fixed
+capacity, so a long running demo uses bounded memory, and the points are
+painted once onto a trail surface instead of being redrawn every frame.
+"""
+
+import numpy
+import pygame
+
+# Points kept per pen before old points are dropped or thinned out
+TRACE_CAPACITY = 4096
+# A point closer than this (in pixels) to the previous one is not stored
+TRACE_MIN_STEP = 1.0
+# When a buffer is full:
+#   'decimate' .. drop every other point, keeping the whole path
+#   'ring' ...... drop the oldest eighth of the points
+TRACE_POLICY = 'decimate'
+
+POINT_RADIUS = 2
+
+
+class TraceBuffer:
+
+    def __init__(self, capacity=TRACE_CAPACITY, min_step=TRACE_MIN_STEP,
+                 policy=TRACE_POLICY):
+        if policy not in ('decimate', 'ring'):
+            raise ValueError('unknown trace policy %r' % (policy,))
+        self.capacity = max(capacity, 8)
+        self.min_step = min_step
+        self.policy = policy
+        self._points = numpy.zeros((self.capacity, 2), numpy.float32)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def points(self):
+        """ The stored points, oldest first, as a (count, 2) array """
+        return self._points[:self.count]
+
+    def clear(self):
+        self.count = 0
+
+    def append(self, x, y):
+        """ Store a point unless it is too close to the previous one
+
+            Return: 1 if the point was stored, 2 if it was stored and
+            older points were dropped, 0 if it was skipped
+        """
+        if self.count:
+            last = self._points[self.count - 1]
+            if abs(x - last[0]) < self.min_step and \
+                    abs(y - last[1]) < self.min_step:
+                return 0
+        stored = 1
+        if self.count == self.capacity:
+            self._evict()
+            stored = 2
+        self._points[self.count] = (x, y)
+        self.count += 1
+        return stored
+
+    def _evict(self):
+        if self.policy == 'decimate':
+            kept = self._points[:self.count:2].copy()
+        else:
+            kept = self._points[self.count // 8:self.count].copy()
+        self.count = len(kept)
+        self._points[:self.count] = kept
+
+    def to_list(self):
+        """ Return [x0, y0, x1, y1, ...], the journal format of a trace """
+        return numpy.round(self.points.astype(float), 1).ravel().tolist()
+
+    def extend_list(self, flat):
+        """ Append the points of a trace in journal format, a list or
+            an array of x, y, x, y, ...
+        """
+        points = numpy.asarray(flat, numpy.float32)
+        points = points[:len(points) // 2 * 2].reshape(-1, 2)
+        if self.count + len(points) <= self.capacity:
+            # Saved traces were already filtered, copy them in one go
+            self._points[self.count:self.count + len(points)] = points
+            self.count += len(points)
+        else:
+            for x, y in points.tolist():
+                self.append(x, y)
+
+
+class PenTraces:
+    """ The traces of all pens, indexed by the pen's tracking index """
+
+    def __init__(self, capacity=TRACE_CAPACITY, min_step=TRACE_MIN_STEP,
+                 policy=TRACE_POLICY):
+        self.capacity = capacity
+        self.min_step = min_step
+        self.policy = policy
+        self.buffers = []
+        self.colors = []
+        self._surface = None
+        self._new = []
+        self._repaint = True
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def point_count(self):
+        return sum(len(buffer) for buffer in self.buffers)
+
+    def _buffer(self, trackdex, color):
+        while len(self.buffers) <= trackdex:
+            self.buffers.append(TraceBuffer(self.capacity, self.min_step,
+                                            self.policy))
+            self.colors.append((0, 0, 0))
+        if color is not None:
+            self.colors[trackdex] = tuple(color)
+        return self.buffers[trackdex]
+
+    def append(self, trackdex, color, xs, ys):
+        """ Record the next positions of one pen
+
+            Parameters:
+              trackdex .. tracking index of the pen
+              color ..... pen color
+              xs, ys .... screen coordinates of the new points
+        """
+        buffer = self._buffer(trackdex, color)
+        for x, y in zip(xs, ys):
+            stored = buffer.append(x, y)
+            if stored == 2:
+                self._repaint = True
+            elif stored:
+                self._new.append((trackdex, x, y))
+
+    def clear(self):
+        """ Erase the points of all pens, keeping the pens """
+        for buffer in self.buffers:
+            buffer.clear()
+        self._repaint = True
+
+    def to_lists(self):
+        """ Return the traces in the journal format of full_pos_list """
+        return [buffer.to_list() for buffer in self.buffers]
+
+    def to_arrays(self):
+        """ Like to_lists, with a float32 array per pen """
+        return [buffer.points.ravel() for buffer in self.buffers]
+
+    def load_lists(self, full_pos_list, colors=None):
+        """ Replace the traces with ones saved by to_lists()
+
+            Parameters:
+              full_pos_list .. list of [x0, y0, x1, y1, ...] per pen
+              colors ......... dict of tracking index -> color
+        """
+        self.buffers = []
+        self.colors = []
+        for trackdex, flat in enumerate(full_pos_list):
+            color = None if colors is None else colors.get(trackdex)
+            self._buffer(trackdex, color).extend_list(flat)
+        self._repaint = True
+
+    def draw(self, surface, rects=None):
+        """ Paint the new points on the trail surface and copy the trail
+            to surface
+
+            Parameters:
+              surface .. destination surface
+              rects .... areas of surface redrawn since the last frame,
+                         where the trail must be copied again. None
+                         copies the whole trail.
+
+            Return: the rects of surface changed by the new points
+        """
+        size = surface.get_size()
+        if self._surface is None or self._surface.get_size() != size:
+            self._surface = pygame.Surface(size)
+            self._surface.set_colorkey((255, 0, 255))
+            self._repaint = True
+
+        changed = []
+        if self._repaint:
+            self._repaint = False
+            self._new = []
+            self._surface.fill((255, 0, 255))
+            for buffer, color in zip(self.buffers, self.colors):
+                for x, y in _visible(buffer.points, size).tolist():
+                    pygame.draw.circle(self._surface, color, (x, y),
+                                       POINT_RADIUS)
+            rects = None
+            changed.append(self._surface.get_rect())
+        else:
+            width, height = size
+            for trackdex, x, y in self._new:
+                if -POINT_RADIUS <= x < width + POINT_RADIUS and \
+                        -POINT_RADIUS <= y < height + POINT_RADIUS:
+                    changed.append(pygame.draw.circle(
+                        self._surface, self.colors[trackdex],
+                        (int(x), int(y)), POINT_RADIUS))
+            self._new = []
+
+        if rects is None:
+            surface.blit(self._surface, (0, 0))
+        else:
+            for rect in list(rects) + changed:
+                surface.blit(self._surface, rect, rect)
+        return changed
+
+
+def _visible(points, size):
+    # The points, as ints, which touch a surface of size when drawn
+    width, height = size
+    x = points[:, 0]
+    y = points[:, 1]
+    inside = (x >= -POINT_RADIUS) & (x < width + POINT_RADIUS) & \
+        (y >= -POINT_RADIUS) & (y < height + POINT_RADIUS)
+    return points[inside].astype(int)